@@ -11,6 +11,17 @@ import multiprocessing
 import daemon
 
 from pandaatm.atmconfig import atm_config
+from pandaatm.atmcore.metrics import MetricsRegistry, MetricsCollector, MetricsHTTPServer, MetricsTextfileWriter, \
+                                    set_metrics_connection, COUNTER
+
+
+# default agents and numbers of processes, when master.agents is not configured
+default_agents = 'slow_task_analyzer:1'
+
+# default parameters of supervision of agent processes, in seconds
+default_restart_backoff_base = 5
+default_restart_backoff_max = 600
+default_stable_run_period = 600
 
 
 # master class of ATM which runs the main process
@@ -18,10 +29,14 @@ class AtmMaster(object):
 
     # constructor
     def __init__(self):
-        pass
+        # metrics fed by agents through pipes
+        self.metrics_registry = MetricsRegistry()
+        self.metrics_collector = MetricsCollector(self.metrics_registry)
 
     # spawn a proc to have own file descriptors
-    def launcher(self, moduleName, *args, **kwargs):
+    def launcher(self, moduleName, *args, metrics_conn=None, **kwargs):
+        # send metrics to the master through the pipe
+        set_metrics_connection(metrics_conn, agent=moduleName.split('.')[-1], shard=kwargs.get('shard_index', 0))
         # import module
         mod = __import__(moduleName)
         for subModuleName in moduleName.split('.')[1:]:
@@ -54,42 +69,115 @@ class AtmMaster(object):
 
 
 
+    # start metrics endpoint and/or textfile according to config
+    def start_metrics(self):
+        self.metrics_collector.start()
+        metrics_port = getattr(atm_config.master, 'metrics_port', None)
+        metrics_textfile = getattr(atm_config.master, 'metrics_textfile', None)
+        if metrics_port:
+            MetricsHTTPServer(self.metrics_registry, int(metrics_port)).start()
+        if metrics_textfile:
+            MetricsTextfileWriter(self.metrics_registry, metrics_textfile,
+                                    interval=getattr(atm_config.master, 'metrics_textfile_interval', 60)).start()
+
+
+
+    # print message
+    def _print(self, level, msg):
+        timeNow = datetime.datetime.utcnow()
+        print('{0} {1}: {2:<7} {3}'.format(str(timeNow), self.__class__.__name__, level, msg))
+
+
+
+    # get list of (agent name, number of processes) from config
+    def get_agent_config_list(self):
+        """
+        master.agents is like "slow_task_analyzer:2;testing_agent:0", where each item is
+        agent_name:n_proc and agent_name is a module in pandaatm.atmbody.
+        Processes of an agent are launched with shard_index=i_proc and n_shards=n_proc
+        """
+        agents_str = getattr(atm_config.master, 'agents', default_agents)
+        agent_config_list = []
+        for item_str in str(agents_str).split(';'):
+            item_str = item_str.strip()
+            if not item_str:
+                continue
+            items = self.convParams(item_str)
+            agent_name = items[0]
+            n_proc = items[1] if len(items) > 1 and items[1] is not None else 1
+            agent_config_list.append((agent_name, n_proc))
+        return agent_config_list
+
+
+
+    # start a process of an agent slot
+    def _start_slot(self, slot):
+        parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+        proc = multiprocessing.Process(name='{0}-{1}'.format(slot['agent_name'], slot['i_proc']),
+                                        target=self.launcher,
+                                        args=('pandaatm.atmbody.{0}'.format(slot['agent_name']),),
+                                        kwargs={'metrics_conn': child_conn,
+                                                'shard_index': slot['i_proc'],
+                                                'n_shards': slot['n_proc']})
+        proc.start()
+        child_conn.close()
+        self.metrics_collector.add_connection(parent_conn)
+        slot['proc'] = proc
+        slot['start_time'] = time.monotonic()
+        slot['restart_time'] = None
+        self._print('INFO', 'started name={0}, pid={1}'.format(proc.name, proc.pid))
+
+
+
     # main process
     def start(self):
-        # the list of agent processes
-        procList = []
-        # setup agents
-        # for agent_type in something: # FIXME
-        #     for agent_each in agent_type: # FIXME
-        #         for i_proc in range(n_proc): # FIXME
-        #             parent_conn, child_conn = multiprocessing.Pipe()
-        #             proc = multiprocessing.Process(name=some_name, target=self.launcher, args=some_args_tuple)
-        #             proc.start()
-        #             procList.append(proc)
-        # slow_task_analyzer agent
-        parent_conn, child_conn = multiprocessing.Pipe()
-        proc = multiprocessing.Process(name='slow_task_analyzer', target=self.launcher, args=('pandaatm.atmbody.slow_task_analyzer',))
-        proc.start()
-        procList.append(proc)
-        # testing agent
-        # parent_conn, child_conn = multiprocessing.Pipe()
-        # proc = multiprocessing.Process(name='testing_agent', target=self.launcher, args=('pandaatm.atmbody.testing_agent',))
-        # proc.start()
-        # procList.append(proc)
-        # check initial failures
-        time.sleep(5)
-        for proc in procList:
-            if not proc.is_alive():
-                timeNow = datetime.datetime.utcnow()
-                print('{0} {1}: ERROR  name={2}, pid={3} died in startup'.format(
-                                                                            str(timeNow),
-                                                                            self.__class__.__name__,
-                                                                            proc.name,
-                                                                            proc.pid))
-                os.killpg(os.getpgrp(), signal.SIGKILL)
-        # join
-        for proc in procList:
-            proc.join()
+        # parameters of supervision
+        backoff_base = getattr(atm_config.master, 'restart_backoff_base', default_restart_backoff_base)
+        backoff_max = getattr(atm_config.master, 'restart_backoff_max', default_restart_backoff_max)
+        stable_period = getattr(atm_config.master, 'stable_run_period', default_stable_run_period)
+        # metrics
+        self.start_metrics()
+        # slots of agent processes
+        slot_list = []
+        for agent_name, n_proc in self.get_agent_config_list():
+            for i_proc in range(n_proc):
+                slot = {
+                        'agent_name': agent_name,
+                        'i_proc': i_proc,
+                        'n_proc': n_proc,
+                        'proc': None,
+                        'start_time': None,
+                        'restart_time': None,
+                        'n_failures': 0,
+                    }
+                self._start_slot(slot)
+                slot_list.append(slot)
+        if not slot_list:
+            self._print('WARNING', 'no agent configured')
+            return
+        # supervise; restart dead agents with exponential backoff
+        while True:
+            now = time.monotonic()
+            for slot in slot_list:
+                proc = slot['proc']
+                if slot['restart_time'] is not None:
+                    # waiting to restart
+                    if now >= slot['restart_time']:
+                        self.metrics_registry.apply(COUNTER, 'atm_agent_restarts_total', {'agent': slot['agent_name']}, 1)
+                        self._start_slot(slot)
+                    continue
+                if proc.is_alive():
+                    continue
+                proc.join()
+                if now - slot['start_time'] >= stable_period:
+                    # ran long enough; not a crash loop
+                    slot['n_failures'] = 0
+                backoff = min(backoff_base * 2**slot['n_failures'], backoff_max)
+                slot['n_failures'] += 1
+                slot['restart_time'] = now + backoff
+                self._print('ERROR', 'name={0}, pid={1} died with exitcode={2} after {3:.0f} s; restart in {4} s'.format(
+                                        proc.name, proc.pid, proc.exitcode, now - slot['start_time'], backoff))
+            time.sleep(1)
 
 
 
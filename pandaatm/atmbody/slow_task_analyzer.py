@@ -1,15 +1,25 @@
 import os
+import glob
 import time
 import datetime
 import copy
 import json
+import pickle
+
+import numpy as np
 
 from pandacommon.pandalogger import logger_utils
 
 from pandaatm.atmconfig import atm_config
 from pandaatm.atmcore import core_utils
+from pandaatm.atmcore.attempt_job_cache import AttemptJobCache
+from pandaatm.atmcore.job_fetcher import ParallelJobFetcher
+from pandaatm.atmcore.cycle_profiler import CycleProfiler
 from pandaatm.atmbody.agent_base import AgentBase
-from pandaatm.atmutils.slow_task_analyzer_utils import get_job_durations, get_jobs_time_consumption_statistics, bad_job_test_main
+from pandaatm.atmutils.slow_task_analyzer_utils import job_status_code_map, get_job_durations_from_arrays, bad_job_test_main, \
+                                                        jobspecs_to_time_arrays, get_jobs_time_consumption_statistics_from_arrays, \
+                                                        JobsTimeConsumptionAggregator
+from pandaatm.atmutils.live_task_tracker import task_active_statuses
 
 
 base_logger = logger_utils.setup_logger('slow_task_analyzer')
@@ -18,8 +28,12 @@ base_logger = logger_utils.setup_logger('slow_task_analyzer')
 # agent class
 class SlowTaskAnalyzer(AgentBase):
 
-    def __init__(self):
+    def __init__(self, shard_index=0, n_shards=1):
         super().__init__()
+        # shard of candidate tasks by jediTaskID; shard 0 merges results of all shards into the report
+        self.shardIndex = shard_index
+        self.nShards = n_shards
+        self.shardMergePollPeriod = 10
         # parameters
         self.sleepPeriod = 300
         self.sinceHours = 336
@@ -35,6 +49,29 @@ class SlowTaskAnalyzer(AgentBase):
                 'closed': {'wait': 12, 'run': 16},
             }
         self.reportDir = '/tmp/slow_task_dumps'
+        self.metricsFile = os.path.join(self.reportDir, 'slow_task_analyzer_metrics.jsonl')
+        self.profileAllocations = False
+        # live mode to analyze also open task attempts provisionally, with the current time as their end
+        self.liveMode = False
+        self.liveAttemptMinHours = 24
+        # jobs of open task attempts cached across cycles; (jediTaskID, attemptNr): {aggregator, fetch_time, active_id_set}
+        self.liveAttemptCacheDict = {}
+        # jobs of huge task attempts fetched in windows of about the number of jobs in parallel over the DB proxy pool
+        self.jobFetchChunkRows = 100000
+        self.jobFetchWorkers = 4
+        self.jobFetcher = ParallelJobFetcher(self.dbProxyPool, chunk_rows=self.jobFetchChunkRows, n_workers=self.jobFetchWorkers)
+        # jobs of candidate task attempts cached across cycles, up to the number of jobs; 0 to disable
+        self.jobCacheMaxJobs = 500000
+        self.jobCache = AttemptJobCache(max_jobs=self.jobCacheMaxJobs)
+        # screen candidate task attempts with aggregates of jobs computed in DB before fetching their jobs,
+        # skipping those with successful run time above the threshold by the margin; attempts whose jobs are
+        # cached are not screened. Attempts screened out are remembered with their window and number of archived
+        # jobs, and screened again only when the number changes (a cheap count instead of the aggregate), since
+        # newly archived failed or closed jobs can lower the share of successful run time
+        self.aggregatePrefilter = True
+        self.aggregatePrefilterMarginPercent = 1
+        # task attempts screened out; (jediTaskID, attemptNr): (startTime, endTime, number of archived jobs)
+        self.prefilteredAttemptDict = {}
 
     def _slow_task_attempts_display(self, ret_dict: dict) -> str :
         result_str_line_template = '{jediTaskID:>10}  {attemptNr:>4} | {finalStatus:>10} {startTime:>20}  {endTime:>20}  {attemptDuration:>15}    {successful_run_time_ratio:>6} '
@@ -48,14 +85,141 @@ class SlowTaskAnalyzer(AgentBase):
                                                                 finalStatus=v['finalStatus'],
                                                                 startTime=v['startTime'].strftime('%y-%m-%d %H:%M:%S'),
                                                                 endTime=v['endTime'].strftime('%y-%m-%d %H:%M:%S'),
-                                                                attemptDuration=core_utils.timedelta_parse_dict(v['attemptDuration'])['str_dcolon'],
+                                                                attemptDuration=core_utils.timedelta_str(v['attemptDuration']),
                                                                 successful_run_time_ratio='{0:.2f}%'.format(v['jobs_time_consumption_stats_dict']['_successful_run_time_ratio']*100),
                                                                 )
             result_str_list.append(result_str_line)
         return '\n'.join(result_str_list)
 
-    def _get_job_attr_dict(self, jobspec):
-        wait_duration, run_duration = get_job_durations(jobspec)
+    def _live_attempts_display(self, live_row_list) -> str :
+        result_str_line_template = '{jediTaskID:>10}  {attemptNr:>4} | {status:>10} {statusDuration:>15}  {startTime:>20}  {attemptDuration:>15}  {n_jobs:>8} {n_active_jobs:>8}    {jobful_time_ratio:>7} {successful_run_time_ratio:>7}  {slowness_score:>6} {symptoms}'
+        result_str_list = []
+        result_str_list.append(result_str_line_template.format(jediTaskID='taskID', attemptNr='#N', status='status', statusDuration='for',
+                                                                startTime='startTime', attemptDuration='duration', n_jobs='nJobs',
+                                                                n_active_jobs='nActive', jobful_time_ratio='JTR%',
+                                                                successful_run_time_ratio='SRTR%', slowness_score='score', symptoms='symptoms'))
+        for row_dict in sorted(live_row_list, key=(lambda x: (-x['slowness_score'], x['jediTaskID'], x['attemptNr']))):
+            result_str_line = result_str_line_template.format(
+                                                                jediTaskID=row_dict['jediTaskID'],
+                                                                attemptNr=row_dict['attemptNr'],
+                                                                status=row_dict['status'],
+                                                                statusDuration=core_utils.timedelta_str(row_dict['statusDuration']),
+                                                                startTime=row_dict['startTime'].strftime('%y-%m-%d %H:%M:%S'),
+                                                                attemptDuration=core_utils.timedelta_str(row_dict['attemptDuration']),
+                                                                n_jobs=row_dict['n_jobs'],
+                                                                n_active_jobs=row_dict['n_active_jobs'],
+                                                                jobful_time_ratio='{0:.2f}%'.format(row_dict['jobful_time_ratio']*100),
+                                                                successful_run_time_ratio='{0:.2f}%'.format(row_dict['successful_run_time_ratio']*100),
+                                                                slowness_score='{0:.2f}'.format(row_dict['slowness_score']),
+                                                                symptoms=' '.join(row_dict['symptoms']),
+                                                                )
+            result_str_list.append(result_str_line)
+        return '\n'.join(result_str_list)
+
+    def _get_live_attempt_rows(self, profiler, tmp_log) -> list:
+        """
+        get list of dicts of provisional analysis of open task attempts, with the current time as their end.
+        The slowness score is the time of the attempt so far not covered by successful running of jobs, relative to
+        that allowed for an attempt of taskDurationMaxHours; 1 or more means it already lost as much time as a slow one.
+        Jobs of open attempts are cached across cycles. Each cycle fetches the active jobs of the task, and only the
+        archived jobs created since the watermark of the attempt, i.e. the last fetch time, or the earliest creation
+        time of jobs active at the last fetch but not any more; other jobs created before then were fetched already
+        """
+        tmp_log.debug('fetching open task attempts longer than {0} hours'.format(self.liveAttemptMinHours))
+        created_since = datetime.datetime.utcnow() - datetime.timedelta(hours=self.sinceHours)
+        attempt_duration_min = datetime.timedelta(hours=self.liveAttemptMinHours)
+        shard = (self.shardIndex, self.nShards) if self.nShards > 1 else None
+        with profiler.stage('live_candidate_query'):
+            open_ret_dict = self.dbProxy.openTaskAttempts_ATM(created_since=created_since, prod_source_label=None,
+                                                                attempt_duration=attempt_duration_min, shard=shard)
+        if open_ret_dict is None:
+            tmp_log.error('failed to get open task attempts; skipped live analysis')
+            return []
+        profiler.count('live_attempts', len(open_ret_dict))
+        # drop cache of attempts not open any more
+        for k in list(self.liveAttemptCacheDict):
+            if k not in open_ret_dict:
+                del self.liveAttemptCacheDict[k]
+        task_duration_max_us = self.taskDurationMaxHours*3600*10**6
+        unproductive_time_max_us = task_duration_max_us * (1 - self.taskSuccefulRunTimeMinPercent/100)
+        status_duration_max_us = self.taskEachStatusMaxHours*3600*10**6
+        live_row_list = []
+        for k, v in open_ret_dict.items():
+            jediTaskID, attemptNr = k
+            cache_dict = self.liveAttemptCacheDict.get(k)
+            if cache_dict is None:
+                cache_dict = {'aggregator': JobsTimeConsumptionAggregator(), 'fetch_time': None, 'active_id_set': set()}
+                self.liveAttemptCacheDict[k] = cache_dict
+            aggregator = cache_dict['aggregator']
+            # active jobs before archived jobs, so that jobs terminated in between are not missed
+            fetch_time = datetime.datetime.utcnow()
+            with profiler.stage('live_job_fetch'):
+                active_jobspec_list = self.dbProxy.activeJobsInTask_ATM(jediTaskID=jediTaskID, created_since=v['startTime'])
+            if active_jobspec_list is None:
+                tmp_log.error('failed to get active jobs of open task attempt {0}_{1:02}; skipped'.format(*k))
+                continue
+            # jobs created after the fetch time are left to the next cycle
+            active_jobspec_list = [ jobspec for jobspec in active_jobspec_list if jobspec.creationTime <= fetch_time ]
+            active_id_set = set(jobspec.PandaID for jobspec in active_jobspec_list)
+            created_after = None
+            if cache_dict['fetch_time'] is not None:
+                created_after = min([cache_dict['fetch_time']]
+                                    + [ core_utils.epoch_us_to_datetime(aggregator.job_dict[pandaid][0])
+                                        for pandaid in cache_dict['active_id_set'] - active_id_set ])
+            # active jobs first, so that jobs terminated in between are updated by archived jobs
+            with profiler.stage('live_statistics'):
+                for jobspec in active_jobspec_list:
+                    aggregator.add_job(jobspec.PandaID, creationTime=core_utils.datetime_to_epoch_us(jobspec.creationTime),
+                                        startTime=(None if jobspec.startTime in (None, 'NULL')
+                                                    else core_utils.datetime_to_epoch_us(jobspec.startTime)))
+            # archived jobs as batches of numpy arrays, as only their times and statuses are needed; added to the aggregator
+            # batch by batch as fetched. Jobs already added are updated in place, so a failed fetch is simply redone next cycle
+            with profiler.stage('live_job_fetch'):
+                n_archived_jobs = self.dbProxy.getJobArraysInAttempt_ATM(jediTaskID=jediTaskID, attemptNr=attemptNr,
+                                                                            attempt_start=v['startTime'], attempt_end=fetch_time,
+                                                                            batch_func=aggregator.add_job_arrays,
+                                                                            created_after=created_after)
+            if n_archived_jobs is None:
+                tmp_log.error('failed to get archived jobs of open task attempt {0}_{1:02}; skipped'.format(*k))
+                continue
+            profiler.count('live_jobs', len(active_jobspec_list) + n_archived_jobs)
+            with profiler.stage('live_statistics'):
+                time_now = datetime.datetime.utcnow()
+                time_now_us = core_utils.datetime_to_epoch_us(time_now)
+                attempt_start_us = core_utils.datetime_to_epoch_us(v['startTime'])
+                jobful_time_ratio, successful_run_time_ratio = aggregator.get_ratios(attempt_start_us, time_now_us)
+            cache_dict['fetch_time'] = fetch_time
+            cache_dict['active_id_set'] = active_id_set
+            # provisional slowness
+            attempt_duration_us = time_now_us - attempt_start_us
+            status, status_time = v['statusList'][-1]
+            status_duration_us = time_now_us - core_utils.datetime_to_epoch_us(status_time)
+            symptom_list = []
+            if attempt_duration_us > task_duration_max_us and successful_run_time_ratio*100 < self.taskSuccefulRunTimeMinPercent:
+                symptom_list.append('SlowTaskAttempt')
+            if status not in task_active_statuses and status_duration_us > status_duration_max_us:
+                symptom_list.append('TaskStatusLong')
+            slowness_score = attempt_duration_us * (1 - successful_run_time_ratio) / unproductive_time_max_us \
+                                if unproductive_time_max_us else float('inf')
+            live_row_list.append({
+                    'jediTaskID': jediTaskID,
+                    'attemptNr': attemptNr,
+                    'userName': v['userName'],
+                    'status': status,
+                    'statusDuration': core_utils.us_to_timedelta(status_duration_us),
+                    'startTime': v['startTime'],
+                    'attemptDuration': core_utils.us_to_timedelta(attempt_duration_us),
+                    'n_jobs': len(aggregator),
+                    'n_active_jobs': len(active_jobspec_list),
+                    'jobful_time_ratio': jobful_time_ratio,
+                    'successful_run_time_ratio': successful_run_time_ratio,
+                    'slowness_score': slowness_score,
+                    'symptoms': symptom_list,
+                })
+        profiler.count('live_slow_attempts', sum(1 for row_dict in live_row_list if row_dict['symptoms']))
+        return live_row_list
+
+    def _get_job_attr_dict(self, jobspec, wait_duration, run_duration):
         diag_display_str_list = []
         if jobspec.transExitCode not in (None, 0, 'NULL', '0'):
             diag_display_str_list.append('trans-{0}'.format(jobspec.transExitCode))
@@ -102,9 +266,10 @@ class SlowTaskAnalyzer(AgentBase):
 
     def _search_long_status(self, status_log_list):
         long_status_log_list = []
+        status_duration_max = datetime.timedelta(hours=self.taskEachStatusMaxHours)
         for status_log_dict in status_log_list:
             if status_log_dict['status'] not in ('scouting', 'running', 'processing') \
-                and status_log_dict['duration'] > datetime.timedelta(hours=self.taskEachStatusMaxHours):
+                and status_log_dict['duration'] > status_duration_max:
                 long_status_log_list.append(status_log_dict)
         return long_status_log_list
 
@@ -120,35 +285,37 @@ class SlowTaskAnalyzer(AgentBase):
             result_str_list.append(result_str_line_template.format(
                     status=status_log_dict['status'],
                     modificationTime=status_log_dict['modificationTime'].strftime('%y-%m-%d %H:%M:%S'),
-                    duration=core_utils.timedelta_parse_dict(status_log_dict['duration'])['str_dcolon'],
+                    duration=core_utils.timedelta_str(status_log_dict['duration']),
                 ))
         result_str = '\n'.join(result_str_list)
         return result_str
 
-    def _search_bad_intervals(self, jobspec_list, attempt_start):
+    def _search_bad_intervals(self, jobspec_list, job_arrays_dict, attempt_start):
+        # jobs in order of creationTime
+        order = np.argsort(job_arrays_dict['creationTime'], kind='stable')
+        creation_time_array = job_arrays_dict['creationTime'][order]
+        end_time_array = job_arrays_dict['endTime'][order]
+        # last jobful time before each job, i.e. latest endTime of previous jobs or attempt start
+        attempt_start_us = core_utils.datetime_to_epoch_us(attempt_start)
+        last_jobful_time_array = np.maximum.accumulate(np.concatenate(([attempt_start_us], end_time_array)))[:-1]
+        # jobs ending after last jobful time; the latest of them before each job is the last job
+        extending_mask = end_time_array > last_jobful_time_array
+        last_job_index_array = np.maximum.accumulate(np.where(extending_mask, np.arange(len(order)), -1))
+        last_job_index_array = np.concatenate(([-1], last_job_index_array))[:-1]
+        # jobless intervals
+        interval_max_us = self.joblessIntervalMaxHours*3600*10**6
+        interval_array = creation_time_array - last_jobful_time_array
         bad_interval_list = []
-        last_jobful_time = attempt_start
-        last_job_pandaid = None
-        for jobspec in sorted(jobspec_list, key=(lambda x: x.creationTime)):
-            if jobspec.endTime <= last_jobful_time:
-                continue
-            if jobspec.creationTime <= last_jobful_time:
-                # jobs duration overlap, good
-                pass
-            else:
-                # jobless interval
-                interval = jobspec.creationTime - last_jobful_time
-                if interval > datetime.timedelta(hours=self.joblessIntervalMaxHours):
-                    bad_interval_dict = {
-                            'duration': interval,
-                            'lastJobPandaID': last_job_pandaid,
-                            'lastJobEndTime': last_jobful_time,
-                            'nextJobPandaID': jobspec.PandaID,
-                            'nextJobCreationTime': jobspec.creationTime,
-                        }
-                    bad_interval_list.append(bad_interval_dict)
-            last_jobful_time = jobspec.endTime
-            last_job_pandaid = jobspec.PandaID
+        for i in np.flatnonzero(extending_mask & (interval_array > interval_max_us)):
+            last_job_index = last_job_index_array[i]
+            bad_interval_dict = {
+                    'duration': int(interval_array[i]),
+                    'lastJobPandaID': None if last_job_index < 0 else jobspec_list[order[last_job_index]].PandaID,
+                    'lastJobEndTime': int(last_jobful_time_array[i]),
+                    'nextJobPandaID': jobspec_list[order[i]].PandaID,
+                    'nextJobCreationTime': int(creation_time_array[i]),
+                }
+            bad_interval_list.append(bad_interval_dict)
         return bad_interval_list
 
     def _bad_intervals_display(self, bad_interval_list) -> str:
@@ -164,44 +331,67 @@ class SlowTaskAnalyzer(AgentBase):
         for gap in bad_interval_list:
             result_str_list.append(result_str_line_template.format(
                     lastJobPandaID=gap['lastJobPandaID'],
-                    lastJobEndTime_str=gap['lastJobEndTime'].strftime('%y-%m-%d %H:%M:%S'),
+                    lastJobEndTime_str=core_utils.epoch_us_to_datetime(gap['lastJobEndTime']).strftime('%y-%m-%d %H:%M:%S'),
                     nextJobPandaID=gap['nextJobPandaID'],
-                    nextJobCreationTime_str=gap['nextJobCreationTime'].strftime('%y-%m-%d %H:%M:%S'),
-                    duration_str=core_utils.timedelta_parse_dict(gap['duration'])['str_dcolon'],
+                    nextJobCreationTime_str=core_utils.epoch_us_to_datetime(gap['nextJobCreationTime']).strftime('%y-%m-%d %H:%M:%S'),
+                    duration_str=core_utils.duration_us_str(gap['duration']),
                 ))
         result_str = '\n'.join(result_str_list)
         return result_str
 
-    def _bad_job_time_consumed_set(self, task_attempt_duration, jobs_time_consumption_stats_dict):
+    def _bad_job_time_consumed_set(self, task_attempt_duration_us, jobs_time_consumption_stats_dict):
         ret_msg_set = set()
         for status in ['finished', 'failed', 'closed', 'cancelled']:
             for dur_type in ['wait', 'run']:
                 if (status, dur_type) == ('finished', 'run'):
                     continue
-                if jobs_time_consumption_stats_dict[status][dur_type]*100/task_attempt_duration >= self.jobBadTimeMaxPercent:
+                if jobs_time_consumption_stats_dict[status][dur_type]*100/task_attempt_duration_us >= self.jobBadTimeMaxPercent:
                     msg_tag = 'Job{0}{1}Long'.format(status.capitalize(), dur_type.capitalize())
                     ret_msg_set.add(msg_tag)
         return ret_msg_set
 
-    def _bad_job_qualify(self, job_attr_dict):
-        retVal = False
-        status = job_attr_dict['jobStatus']
-        # according to status
-        for status in ['finished', 'failed', 'closed', 'cancelled']:
-            if status != job_attr_dict['jobStatus']:
-                continue
-            for dur_type in ['wait', 'run']:
-                dur_name = '{0}Duration'.format(dur_type)
-                if job_attr_dict[dur_name] > datetime.timedelta(hours=self.jobMaxHoursMap[status][dur_type]):
-                    retVal = True
-        return retVal
+    def _bad_job_mask(self, job_arrays_dict):
+        """
+        get boolean array of jobs whose wait or run duration is longer than jobMaxHoursMap of their status
+        """
+        wait_duration_array, run_duration_array = get_job_durations_from_arrays(job_arrays_dict)
+        bad_job_mask = np.zeros(len(wait_duration_array), dtype=bool)
+        for status, status_code in job_status_code_map.items():
+            wait_duration_max = core_utils.timedelta_to_us(datetime.timedelta(hours=self.jobMaxHoursMap[status]['wait']))
+            run_duration_max = core_utils.timedelta_to_us(datetime.timedelta(hours=self.jobMaxHoursMap[status]['run']))
+            bad_job_mask |= (job_arrays_dict['jobStatus'] == status_code) \
+                            & ((wait_duration_array > wait_duration_max) | (run_duration_array > run_duration_max))
+        return bad_job_mask, wait_duration_array, run_duration_array
+
+    def _group_bad_jobs(self, jobspec_list, job_arrays_dict):
+        pandaid_list = []
+        err_info_dict = {}
+        bad_job_mask, wait_duration_array, run_duration_array = self._bad_job_mask(job_arrays_dict)
+        for i in np.flatnonzero(bad_job_mask).tolist():
+            # qualified bad job
+            jobspec = jobspec_list[i]
+            job_attr_dict = self._get_job_attr_dict(jobspec, int(wait_duration_array[i]), int(run_duration_array[i]))
+            pandaid_list.append(jobspec.PandaID)
+            err_info = job_attr_dict['errorInfo']
+            if err_info in err_info_dict:
+                err_info_dict[err_info]['n_jobs'] += 1
+                err_info_dict[err_info]['waitDuration'] += job_attr_dict['waitDuration']
+                err_info_dict[err_info]['runDuration'] += job_attr_dict['runDuration']
+                err_info_dict[err_info]['priority'] += job_attr_dict['priority']
+            else:
+                err_info_dict[err_info] = {}
+                err_info_dict[err_info]['n_jobs'] = 1
+                err_info_dict[err_info]['waitDuration'] = job_attr_dict['waitDuration']
+                err_info_dict[err_info]['runDuration'] = job_attr_dict['runDuration']
+                err_info_dict[err_info]['priority'] = job_attr_dict['priority']
+        return pandaid_list, err_info_dict
 
     def _bad_jobs_display(self, pandaid_list, err_info_dict) -> str:
         sorted_err_info_list = sorted(err_info_dict.items(), key=(lambda x: (x[1]['n_jobs'], x[1]['waitDuration'] + x[1]['runDuration'])), reverse=True)
         errors_str = '\n    '.join([ '{n_jobs:>6} | {avg_wait:>12} | {avg_run:>12} | {avg_prio:>7} | {info}'.format(
                                             n_jobs=x[1]['n_jobs'],
-                                            avg_wait=core_utils.timedelta_parse_dict(x[1]['waitDuration']/x[1]['n_jobs'])['str_dcolon'],
-                                            avg_run=core_utils.timedelta_parse_dict(x[1]['runDuration']/x[1]['n_jobs'])['str_dcolon'],
+                                            avg_wait=core_utils.duration_us_str(round(x[1]['waitDuration']/x[1]['n_jobs'])),
+                                            avg_run=core_utils.duration_us_str(round(x[1]['runDuration']/x[1]['n_jobs'])),
                                             avg_prio=int(x[1]['priority']/x[1]['n_jobs']),
                                             info=x[0]
                                         ) for x in sorted_err_info_list ])
@@ -215,12 +405,12 @@ class SlowTaskAnalyzer(AgentBase):
                 )
         return result_str
 
-    def _jobs_time_consumption_stats_display(self, task_attempt_duration, jobs_time_consumption_stats_dict) -> str:
-        # function to format one data record
+    def _jobs_time_consumption_stats_display(self, task_attempt_duration_us, jobs_time_consumption_stats_dict) -> str:
+        # function to format one data record of microseconds
         def get_data_str(data_time):
             data_str = '{duration:>13} ({percent:>2}%)'.format(
-                    duration=core_utils.timedelta_parse_dict(data_time)['str_dcolon'],
-                    percent=int(data_time*100/task_attempt_duration),
+                    duration=core_utils.duration_us_str(data_time),
+                    percent=int(data_time*100/task_attempt_duration_us),
                 )
             return data_str
         # dict result dict
@@ -259,186 +449,345 @@ class SlowTaskAnalyzer(AgentBase):
                 )
         return result_str
 
+    def _report_header_str(self, timeNow) -> str:
+        dump_str = (
+                    'Report created at {timestamp}\n\n'
+                    'Parameters:\n'
+                    'sinceHours = {sinceHours}\n'
+                    'taskDurationMaxHours = {taskDurationMaxHours}\n'
+                    'taskSuccefulRunTimeMinPercent = {taskSuccefulRunTimeMinPercent}\n'
+                    'taskEachStatusMaxHours = {taskEachStatusMaxHours}\n'
+                    'joblessIntervalMaxHours = {joblessIntervalMaxHours}\n'
+                    'jobBadTimeMaxPercent = {jobBadTimeMaxPercent}\n'
+                    'jobMaxHoursMap = {jobMaxHoursMap}\n'
+                    '{live_params}'
+                    '\n'
+                    ).format(
+                            timestamp=timeNow.strftime('%y-%m-%d %H:%M:%S'),
+                            sinceHours=self.sinceHours,
+                            taskDurationMaxHours=self.taskDurationMaxHours,
+                            taskSuccefulRunTimeMinPercent=self.taskSuccefulRunTimeMinPercent,
+                            taskEachStatusMaxHours=self.taskEachStatusMaxHours,
+                            joblessIntervalMaxHours=self.joblessIntervalMaxHours,
+                            jobBadTimeMaxPercent=self.jobBadTimeMaxPercent,
+                            jobMaxHoursMap=self.jobMaxHoursMap,
+                            live_params=('liveAttemptMinHours = {0}\n'.format(self.liveAttemptMinHours) if self.liveMode else ''),
+                        )
+        return dump_str
+
+    def _get_slow_task_attempts(self, profiler, tmp_log) -> dict:
+        # candidate slow task attempts
+        tmp_log.debug('fetching candidate slow task attempts created since {0} hours ago'.format(self.sinceHours))
+        created_since = datetime.datetime.utcnow() - datetime.timedelta(hours=self.sinceHours)
+        task_duration = datetime.timedelta(hours=self.taskDurationMaxHours)
+        shard = (self.shardIndex, self.nShards) if self.nShards > 1 else None
+        with profiler.stage('candidate_query'):
+            cand_ret_dict = self.dbProxy.slowTaskAttemptsFilter01_ATM(created_since=created_since, prod_source_label=None,
+                                                                        task_duration=task_duration, shard=shard)
+        if cand_ret_dict is None:
+            return None
+        profiler.count('candidate_attempts', len(cand_ret_dict))
+        # filter to get slow task attempts
+        tmp_log.debug('filtering slow task attempts')
+        ret_dict = {}
+        for k, v in cand_ret_dict.items():
+            jediTaskID, attemptNr = k
+            key_name = '{0}_{1:02}'.format(*k)
+            task_attempt_duration_us = core_utils.timedelta_to_us(v['attemptDuration'])
+            if self.aggregatePrefilter and not self.jobCache.has(jediTaskID, attemptNr):
+                with profiler.stage('aggregate_query'):
+                    n_archived_jobs = self.dbProxy.slowTaskJobsCountInAttempt_ATM(jediTaskID=jediTaskID,
+                                                                            attempt_start=v['startTime'], attempt_end=v['endTime'])
+                if n_archived_jobs is not None \
+                        and self.prefilteredAttemptDict.get(k) == (v['startTime'], v['endTime'], n_archived_jobs):
+                    # screened out in an earlier cycle with the same archived jobs
+                    profiler.count('prefiltered_attempts', 1)
+                    continue
+                with profiler.stage('aggregate_query'):
+                    aggregate_dict = self.dbProxy.slowTaskAttemptAggregate_ATM(jediTaskID=jediTaskID, attemptNr=attemptNr,
+                                                                            attempt_start=v['startTime'], attempt_end=v['endTime'])
+                if aggregate_dict is not None:
+                    if core_utils.timedelta_to_us(aggregate_dict['successful_run_time'])*100/task_attempt_duration_us \
+                            >= self.taskSuccefulRunTimeMinPercent + self.aggregatePrefilterMarginPercent:
+                        # surely not slow
+                        profiler.count('prefiltered_attempts', 1)
+                        if n_archived_jobs is not None:
+                            self.prefilteredAttemptDict[k] = (v['startTime'], v['endTime'], n_archived_jobs)
+                        continue
+                    self.prefilteredAttemptDict.pop(k, None)
+                    self.jobFetcher.set_n_jobs_hint(jediTaskID, attemptNr, aggregate_dict['n_jobs'])
+            new_v = copy.deepcopy(v)
+            with profiler.stage('job_fetch'):
+                jobspec_list = self.jobCache.get_jobs(self.jobFetcher, jediTaskID=jediTaskID, attemptNr=attemptNr,
+                                                        attempt_start=v['startTime'], attempt_end=v['endTime'])
+            profiler.count('jobs', len(jobspec_list))
+            # time consumption statistics of jobs, in microseconds
+            with profiler.stage('statistics'):
+                job_arrays_dict = jobspecs_to_time_arrays(jobspec_list)
+                jobs_time_consumption_stats_dict = get_jobs_time_consumption_statistics_from_arrays(job_arrays_dict, in_us=True)
+            jobful_time_ratio = jobs_time_consumption_stats_dict['total']['total'] / task_attempt_duration_us
+            successful_run_time_ratio = jobs_time_consumption_stats_dict['finished']['run'] / task_attempt_duration_us
+            jobs_time_consumption_stats_dict['_jobful_time_ratio'] = jobful_time_ratio
+            jobs_time_consumption_stats_dict['_successful_run_time_ratio'] = successful_run_time_ratio
+            # fill new value dictionary
+            new_v['jobspec_list'] = jobspec_list
+            new_v['job_arrays_dict'] = job_arrays_dict
+            new_v['jobs_time_consumption_stats_dict'] = jobs_time_consumption_stats_dict
+            # more criteria of slow task
+            if successful_run_time_ratio*100 < self.taskSuccefulRunTimeMinPercent:
+                # successful run time occupied too little percentage of task duration
+                ret_dict[k] = new_v
+                tmp_log.debug('got a slow task attempt {0}'.format(key_name))
+        # keep cached jobs only of current candidates
+        self.jobCache.retain(set(cand_ret_dict))
+        for k in list(self.prefilteredAttemptDict):
+            if k not in cand_ret_dict:
+                del self.prefilteredAttemptDict[k]
+        self.jobFetcher.retain(set(cand_ret_dict))
+        profiler.count('slow_attempts', len(ret_dict))
+        return ret_dict
+
+    def _get_culprits_str(self, k, new_v, profiler, tmp_log) -> str:
+        dump_str_list = []
+        jediTaskID, attemptNr = k
+        dump_str = 'About jediTaskID={0} , attemptNr={1} \n\n'.format(jediTaskID, attemptNr)
+        dump_str_list.append(dump_str)
+        key_name = '{0}_{1:02}'.format(*k)
+        slow_reason_set = set()
+        task_attempt_duration_us = core_utils.timedelta_to_us(new_v['attemptDuration'])
+        jobspec_list = new_v['jobspec_list']
+        jobs_time_consumption_stats_dict = new_v['jobs_time_consumption_stats_dict']
+        # culprit task status (stuck long)
+        with profiler.stage('culprit_search'):
+            long_status_log_list = self._search_long_status(self._get_task_status_log(new_v['statusList']))
+        n_long_status = len(long_status_log_list)
+        if n_long_status == 0:
+            tmp_log.debug('taskID_attempt={0} got 0 long status'.format(key_name))
+        else:
+            long_status_display_str = self._long_status_display(long_status_log_list)
+            dump_str = 'taskID_attempt={0} got {1} long status: \n{2}\n\n\n'.format(key_name, n_long_status, long_status_display_str)
+            dump_str_list.append(dump_str)
+            tmp_log.debug(dump_str)
+            slow_reason_set.add('TaskStatusLong')
+        # culprit intervals between jobs
+        with profiler.stage('culprit_search'):
+            bad_interval_list = self._search_bad_intervals(jobspec_list, new_v['job_arrays_dict'], new_v['startTime'])
+        n_bad_intervals = len(bad_interval_list)
+        if n_bad_intervals == 0:
+            tmp_log.debug('taskID_attempt={0} got 0 culprit intervals'.format(key_name))
+        else:
+            bad_intervals_display_str = self._bad_intervals_display(bad_interval_list)
+            slow_reason_set.add('JoblessIntervalLong')
+            dump_str = 'taskID_attempt={0} got {1} culprit intervals: \n{2}\n\n\n'.format(key_name, n_bad_intervals, bad_intervals_display_str)
+            dump_str_list.append(dump_str)
+            tmp_log.debug(dump_str)
+        # time consumption statistics of jobs
+        jobs_time_consumption_stats_display = self._jobs_time_consumption_stats_display(task_attempt_duration_us, jobs_time_consumption_stats_dict)
+        dump_str = 'taskID_attempt={0} time consumption stats of jobs: \n{1}\n'.format(key_name, jobs_time_consumption_stats_display)
+        dump_str_list.append(dump_str)
+        tmp_log.debug(dump_str)
+        # job symptom tags according to time consumption
+        with profiler.stage('culprit_search'):
+            job_slow_reason_set = self._bad_job_time_consumed_set(task_attempt_duration_us, jobs_time_consumption_stats_dict)
+        if not job_slow_reason_set:
+            tmp_log.debug('taskID_attempt={0} had no bad job symptom'.format(key_name))
+        else:
+            slow_reason_set |= job_slow_reason_set
+            dump_str = 'taskID_attempt={0} got bad job symptoms: {1}\n\n'.format(key_name, ','.join(sorted(job_slow_reason_set)))
+            dump_str_list.append(dump_str)
+            tmp_log.debug(dump_str)
+        # find some bad jobs as hint
+        with profiler.stage('culprit_search'):
+            pandaid_list, err_info_dict = self._group_bad_jobs(jobspec_list, new_v['job_arrays_dict'])
+        n_bad_jobs = len(pandaid_list)
+        if n_bad_jobs == 0:
+            tmp_log.debug('taskID_attempt={0} got 0 bad jobs'.format(key_name))
+        else:
+            bad_jobs_display_str = self._bad_jobs_display(pandaid_list, err_info_dict)
+            dump_str = 'taskID_attempt={0} got {1} bad jobs: \n{2}\n\n'.format(key_name, n_bad_jobs, bad_jobs_display_str)
+            dump_str_list.append(dump_str)
+            tmp_log.debug(dump_str)
+        # additional information about bad jobs
+        # additional_bad_job_info_msg_list = []
+        # additional_bad_job_info_list = bad_job_test_main(jobspec_list)
+        # for retVal, symptom_tag, retMsg in additional_bad_job_info_list:
+        #     if retVal:
+        #         slow_reason_set.add(symptom_tag)
+        #         msg = '{0}: {1}'.format(symptom_tag, retMsg)
+        #         additional_bad_job_info_msg_list.append(msg)
+        # if additional_bad_job_info_msg_list:
+        #     dump_str = 'taskID_attempt={0} additional info of culprit jobs: \n{1}\n\n\n'.format(key_name, '\n'.join(additional_bad_job_info_msg_list))
+        #     dump_str_list.append(dump_str)
+        #     tmp_log.debug(dump_str)
+        # summary of analysis of a task attempt
+        culprit_summary_str = 'taskID_attempt={key_name} slow reason: {slow_reasons}'.format(
+                                    key_name=key_name,
+                                    slow_reasons=' '.join(sorted(slow_reason_set)),
+                                 )
+        tmp_log.info(culprit_summary_str)
+        dump_str = culprit_summary_str + '\n'
+        dump_str_list.append(dump_str)
+        dump_str = '\n' + '_'*64 + '\n\n'
+        dump_str_list.append(dump_str)
+        return ''.join(dump_str_list)
+
+    def _write_report(self, dump_file, timeNow, ret_dict, culprits_str_dict, missing_shards=None, live_row_list=None):
+        dump_file.write(self._report_header_str(timeNow))
+        if missing_shards:
+            dump_file.write('Missing results of shards: {0} (of {1})\n\n'.format(
+                                ','.join(str(i) for i in missing_shards), self.nShards))
+        dump_str = 'got {0} slow task attempts: \n{1}\n'.format(len(ret_dict), self._slow_task_attempts_display(ret_dict))
+        dump_file.write(dump_str)
+        dump_str = '\n' + '='*64 + '\n' + 'Culprits of slowness:' + '\n\n'
+        dump_file.write(dump_str)
+        for k in sorted(ret_dict):
+            dump_file.write(culprits_str_dict[k])
+        if live_row_list is not None:
+            dump_str = '=' * 64 + '\n' + 'Provisional slowness of open task attempts:' + '\n\n'
+            dump_file.write(dump_str)
+            dump_str = 'got {0} open task attempts longer than {1} hours: \n{2}\n\n'.format(len(live_row_list), self.liveAttemptMinHours,
+                                                                                            self._live_attempts_display(live_row_list))
+            dump_file.write(dump_str)
+        dump_str = 'End of report \n'
+        dump_file.write(dump_str)
+
+    def _get_shard_file(self, cycle_tag, shard_index):
+        return os.path.join(self.reportDir, 'slow_tasks_{0}.shard_{1:03}_of_{2:03}.pickle'.format(cycle_tag, shard_index, self.nShards))
+
+    def _dump_shard_result(self, cycle_tag, ret_dict, culprits_str_dict, live_row_list=None):
+        # drop job specs and arrays which are not needed to merge
+        shard_ret_dict = {}
+        for k, v in ret_dict.items():
+            shard_ret_dict[k] = { kk: vv for kk, vv in v.items() if kk not in ('jobspec_list', 'job_arrays_dict') }
+        shard_file = self._get_shard_file(cycle_tag, self.shardIndex)
+        tmp_file = shard_file + '.tmp'
+        with open(tmp_file, 'wb') as _f:
+            pickle.dump((shard_ret_dict, culprits_str_dict, live_row_list), _f)
+        # rename only when complete, so that the merger never reads partial results
+        os.replace(tmp_file, shard_file)
+
+    def _merge_shard_results(self, cycle_tag, deadline, tmp_log):
+        """
+        wait until results of all other shards of the cycle are dumped or deadline (epoch seconds), and merge them
+        """
+        ret_dict = {}
+        culprits_str_dict = {}
+        live_row_list = []
+        missing_shards = set(range(1, self.nShards))
+        while True:
+            for shard_index in sorted(missing_shards):
+                shard_file = self._get_shard_file(cycle_tag, shard_index)
+                if not os.path.exists(shard_file):
+                    continue
+                with open(shard_file, 'rb') as _f:
+                    shard_ret_dict, shard_culprits_str_dict, shard_live_row_list = pickle.load(_f)
+                os.remove(shard_file)
+                ret_dict.update(shard_ret_dict)
+                culprits_str_dict.update(shard_culprits_str_dict)
+                if shard_live_row_list:
+                    live_row_list.extend(shard_live_row_list)
+                missing_shards.discard(shard_index)
+            if not missing_shards or time.time() >= deadline:
+                break
+            time.sleep(self.shardMergePollPeriod)
+        if missing_shards:
+            tmp_log.warning('got no result of shards {0} in cycle {1}'.format(sorted(missing_shards), cycle_tag))
+        self._remove_stale_shard_files(cycle_tag, tmp_log)
+        return ret_dict, culprits_str_dict, live_row_list, sorted(missing_shards)
+
+    def _remove_stale_shard_files(self, cycle_tag, tmp_log):
+        """
+        remove shard result files of cycles before the cycle, e.g. dumped by late shards after the merge of their cycle
+        """
+        for file_path in glob.glob(os.path.join(self.reportDir, 'slow_tasks_*.shard_*_of_*.pickle*')):
+            file_cycle_tag = os.path.basename(file_path)[len('slow_tasks_'):].split('.shard_')[0]
+            if file_cycle_tag < cycle_tag:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+                else:
+                    tmp_log.debug('removed stale shard result {0}'.format(file_path))
+
+    def _sleep_till_next_cycle(self):
+        if self.nShards > 1:
+            time.sleep(self.sleepPeriod - time.time() % self.sleepPeriod)
+        else:
+            time.sleep(self.sleepPeriod)
+
     def run(self):
-        tmp_log = logger_utils.make_logger(base_logger, method_name='SlowTaskAnalyzer.run')
+        profiler = CycleProfiler('slow_task_analyzer', metrics_file=self.metricsFile, trace_alloc=self.profileAllocations)
+        # time spent in logging is accounted to a stage of the profiler
+        tmp_log = profiler.timed(logger_utils.make_logger(base_logger, method_name='SlowTaskAnalyzer.run'),
+                                 'logging', ['debug', 'info', 'warning', 'error'])
+        if self.nShards > 1:
+            tmp_log.info('analyzing shard {0} of {1}'.format(self.shardIndex, self.nShards))
         while True:
             # start
+            profiler.start_cycle()
             tmp_log.info('start cycle')
-            # make report file
-            timeNow = datetime.datetime.utcnow()
-            report_file = os.path.join(self.reportDir, 'slow_tasks_{0}.txt'.format(timeNow.strftime('%y%m%d_%H%M%S')))
-            with open(report_file, 'w') as dump_file:
-                # dump opening information
-                dump_str = (
-                            'Report created at {timestamp}\n\n'
-                            'Parameters:\n'
-                            'sinceHours = {sinceHours}\n'
-                            'taskDurationMaxHours = {taskDurationMaxHours}\n'
-                            'taskSuccefulRunTimeMinPercent = {taskSuccefulRunTimeMinPercent}\n'
-                            'taskEachStatusMaxHours = {taskEachStatusMaxHours}\n'
-                            'joblessIntervalMaxHours = {joblessIntervalMaxHours}\n'
-                            'jobBadTimeMaxPercent = {jobBadTimeMaxPercent}\n'
-                            'jobMaxHoursMap = {jobMaxHoursMap}\n'
-                            '\n'
-                            ).format(
-                                    timestamp=timeNow.strftime('%y-%m-%d %H:%M:%S'),
-                                    sinceHours=self.sinceHours,
-                                    taskDurationMaxHours=self.taskDurationMaxHours,
-                                    taskSuccefulRunTimeMinPercent=self.taskSuccefulRunTimeMinPercent,
-                                    taskEachStatusMaxHours=self.taskEachStatusMaxHours,
-                                    joblessIntervalMaxHours=self.joblessIntervalMaxHours,
-                                    jobBadTimeMaxPercent=self.jobBadTimeMaxPercent,
-                                    jobMaxHoursMap=self.jobMaxHoursMap,
-                                )
-                dump_file.write(dump_str)
-                # candidate slow task attempts
-                tmp_log.debug('fetching candidate slow task attempts created since {0} hours ago'.format(self.sinceHours))
-                created_since = datetime.datetime.utcnow() - datetime.timedelta(hours=self.sinceHours)
-                task_duration = datetime.timedelta(hours=self.taskDurationMaxHours)
-                cand_ret_dict = self.dbProxy.slowTaskAttemptsFilter01_ATM(created_since=created_since, prod_source_label=None, task_duration=task_duration)
-                # filter to get slow task attempts
-                tmp_log.debug('filtering slow task attempts')
-                ret_dict = {}
-                for k, v in cand_ret_dict.items():
-                    jediTaskID, attemptNr = k
-                    key_name = '{0}_{1:02}'.format(*k)
-                    new_v = copy.deepcopy(v)
-                    jobspec_list = self.dbProxy.slowTaskJobsInAttempt_ATM(jediTaskID=jediTaskID, attemptNr=attemptNr,
-                                                                        attempt_start=v['startTime'], attempt_end=v['endTime'])
-                    # time consumption statistics of jobs
-                    task_attempt_duration = v['attemptDuration']
-                    jobs_time_consumption_stats_dict = get_jobs_time_consumption_statistics(jobspec_list)
-                    jobful_time_ratio = jobs_time_consumption_stats_dict['total']['total'] / task_attempt_duration
-                    successful_run_time_ratio = jobs_time_consumption_stats_dict['finished']['run'] / task_attempt_duration
-                    jobs_time_consumption_stats_dict['_jobful_time_ratio'] = jobful_time_ratio
-                    jobs_time_consumption_stats_dict['_successful_run_time_ratio'] = successful_run_time_ratio
-                    # fill new value dictionary
-                    new_v['jobspec_list'] = jobspec_list
-                    new_v['jobs_time_consumption_stats_dict'] = jobs_time_consumption_stats_dict
-                    # more criteria of slow task
-                    if successful_run_time_ratio*100 < self.taskSuccefulRunTimeMinPercent:
-                        # successful run time occupied too little percentage of task duration
-                        ret_dict[k] = new_v
-                        tmp_log.debug('got a slow task attempt {0}'.format(key_name))
-                n_slow_task_attempts = len(ret_dict)
-                dump_str = 'got {0} slow task attempts: \n{1}\n'.format(n_slow_task_attempts, self._slow_task_attempts_display(ret_dict))
-                dump_file.write(dump_str)
-                tmp_log.debug(dump_str)
-                # get culprits of slow task attempts
-                tmp_log.debug('fetching culprits')
-                dump_str = dump_str = '\n' + '='*64 + '\n' + 'Culprits of slowness:' + '\n\n'
-                dump_file.write(dump_str)
-                for k in sorted(ret_dict):
-                    jediTaskID, attemptNr = k
-                    dump_str = 'About jediTaskID={0} , attemptNr={1} \n\n'.format(jediTaskID, attemptNr)
-                    dump_file.write(dump_str)
-                    key_name = '{0}_{1:02}'.format(*k)
-                    new_v = ret_dict[k]
-                    slow_reason_set = set()
-                    task_attempt_duration = new_v['attemptDuration']
-                    jobspec_list = new_v['jobspec_list']
-                    jobs_time_consumption_stats_dict = new_v['jobs_time_consumption_stats_dict']
-                    # culprit task status (stuck long)
-                    long_status_log_list = self._search_long_status(self._get_task_status_log(new_v['statusList']))
-                    n_long_status = len(long_status_log_list)
-                    bad_status_str = ','.join(sorted({ x['status'] for x in long_status_log_list }))
-                    if n_long_status == 0:
-                        tmp_log.debug('taskID_attempt={0} got 0 long status'.format(key_name))
-                    else:
-                        long_status_display_str = self._long_status_display(long_status_log_list)
-                        dump_str = 'taskID_attempt={0} got {1} long status: \n{2}\n\n\n'.format(key_name, n_long_status, long_status_display_str)
-                        dump_file.write(dump_str)
-                        tmp_log.debug(dump_str)
-                        slow_reason_set.add('TaskStatusLong')
-                    # culprit intervals between jobs
-                    bad_interval_list = self._search_bad_intervals(jobspec_list, new_v['startTime'])
-                    n_bad_intervals = len(bad_interval_list)
-                    if n_bad_intervals == 0:
-                        tmp_log.debug('taskID_attempt={0} got 0 culprit intervals'.format(key_name))
-                    else:
-                        bad_intervals_display_str = self._bad_intervals_display(bad_interval_list)
-                        slow_reason_set.add('JoblessIntervalLong')
-                        dump_str = 'taskID_attempt={0} got {1} culprit intervals: \n{2}\n\n\n'.format(key_name, n_bad_intervals, bad_intervals_display_str)
-                        dump_file.write(dump_str)
-                        tmp_log.debug(dump_str)
-                    # time consumption statistics of jobs
-                    jobs_time_consumption_stats_display = self._jobs_time_consumption_stats_display(task_attempt_duration, jobs_time_consumption_stats_dict)
-                    dump_str = 'taskID_attempt={0} time consumption stats of jobs: \n{1}\n'.format(key_name, jobs_time_consumption_stats_display)
-                    dump_file.write(dump_str)
-                    tmp_log.debug(dump_str)
-                    # job symptom tags according to time consumption
-                    job_slow_reason_set = self._bad_job_time_consumed_set(task_attempt_duration, jobs_time_consumption_stats_dict)
-                    if not job_slow_reason_set:
-                        tmp_log.debug('taskID_attempt={0} had no bad job symptom'.format(key_name))
-                    else:
-                        slow_reason_set |= job_slow_reason_set
-                        dump_str = 'taskID_attempt={0} got bad job symptoms: {1}\n\n'.format(key_name, ','.join(sorted(job_slow_reason_set)))
-                        dump_file.write(dump_str)
-                        tmp_log.debug(dump_str)
-                    # find some bad jobs as hint
-                    pandaid_list = []
-                    err_info_dict = {}
-                    for jobspec in jobspec_list:
-                        job_attr_dict = self._get_job_attr_dict(jobspec)
-                        retVal = self._bad_job_qualify(job_attr_dict)
-                        if retVal:
-                            # qualified bad job
-                            pandaid_list.append(jobspec.PandaID)
-                            err_info = job_attr_dict['errorInfo']
-                            if err_info in err_info_dict:
-                                err_info_dict[err_info]['n_jobs'] += 1
-                                err_info_dict[err_info]['waitDuration'] += job_attr_dict['waitDuration']
-                                err_info_dict[err_info]['runDuration'] += job_attr_dict['runDuration']
-                                err_info_dict[err_info]['priority'] += job_attr_dict['priority']
-                            else:
-                                err_info_dict[err_info] = {}
-                                err_info_dict[err_info]['n_jobs'] = 1
-                                err_info_dict[err_info]['waitDuration'] = job_attr_dict['waitDuration']
-                                err_info_dict[err_info]['runDuration'] = job_attr_dict['runDuration']
-                                err_info_dict[err_info]['priority'] = job_attr_dict['priority']
-                    n_bad_jobs = len(pandaid_list)
-                    if n_bad_jobs == 0:
-                        tmp_log.debug('taskID_attempt={0} got 0 bad jobs'.format(key_name))
-                    else:
-                        bad_jobs_display_str = self._bad_jobs_display(pandaid_list, err_info_dict)
-                        dump_str = 'taskID_attempt={0} got {1} bad jobs: \n{2}\n\n'.format(key_name, n_bad_jobs, bad_jobs_display_str)
-                        dump_file.write(dump_str)
-                        tmp_log.debug(dump_str)
-                    # additional information about bad jobs
-                    # additional_bad_job_info_msg_list = []
-                    # additional_bad_job_info_list = bad_job_test_main(jobspec_list)
-                    # for retVal, symptom_tag, retMsg in additional_bad_job_info_list:
-                    #     if retVal:
-                    #         slow_reason_set.add(symptom_tag)
-                    #         msg = '{0}: {1}'.format(symptom_tag, retMsg)
-                    #         additional_bad_job_info_msg_list.append(msg)
-                    # if additional_bad_job_info_msg_list:
-                    #     dump_str = 'taskID_attempt={0} additional info of culprit jobs: \n{1}\n\n\n'.format(key_name, '\n'.join(additional_bad_job_info_msg_list))
-                    #     dump_file.write(dump_str)
-                    #     tmp_log.debug(dump_str)
-                    # summary of analysis of a task attempt
-                    culprit_summary_str = 'taskID_attempt={key_name} slow reason: {slow_reasons}'.format(
-                                                key_name=key_name,
-                                                slow_reasons=' '.join(sorted(slow_reason_set)),
-                                             )
-                    tmp_log.info(culprit_summary_str)
-                    dump_str = culprit_summary_str + '\n'
-                    dump_file.write(dump_str)
-                    dump_str = '\n' + '_'*64 + '\n\n'
-                    dump_file.write(dump_str)
-                tmp_log.debug('fetched culprits of all tasks')
-                dump_str = 'End of report \n'
-                dump_file.write(dump_str)
+            if self.nShards > 1:
+                # shards run cycles aligned to the sleep period, so that results of a cycle share its start time
+                cycle_start = int(time.time()) // self.sleepPeriod * self.sleepPeriod
+                timeNow = datetime.datetime.utcfromtimestamp(cycle_start)
+            else:
+                timeNow = datetime.datetime.utcnow()
+            cycle_tag = timeNow.strftime('%y%m%d_%H%M%S')
+            # slow task attempts and their culprits
+            ret_dict = self._get_slow_task_attempts(profiler, tmp_log)
+            if ret_dict is None:
+                tmp_log.error('failed to get candidate slow task attempts; skipped cycle')
+                profiler.end_cycle(shard_index=self.shardIndex, n_shards=self.nShards)
+                self._sleep_till_next_cycle()
+                continue
+            tmp_log.debug('got {0} slow task attempts: \n{1}\n'.format(len(ret_dict), self._slow_task_attempts_display(ret_dict)))
+            tmp_log.debug('fetching culprits')
+            culprits_str_dict = {}
+            for k in sorted(ret_dict):
+                culprits_str_dict[k] = self._get_culprits_str(k, ret_dict[k], profiler, tmp_log)
+            tmp_log.debug('fetched culprits of all tasks')
+            # open task attempts
+            live_row_list = None
+            if self.liveMode:
+                live_row_list = self._get_live_attempt_rows(profiler, tmp_log)
+                tmp_log.debug('got {0} open task attempts: \n{1}\n'.format(len(live_row_list), self._live_attempts_display(live_row_list)))
+            # report
+            report_file = None
+            missing_shards = None
+            if self.nShards > 1 and self.shardIndex != 0:
+                # dump results of the shard for the merger
+                with profiler.stage('report_writing'):
+                    self._dump_shard_result(cycle_tag, ret_dict, culprits_str_dict, live_row_list)
+            else:
+                if self.nShards > 1:
+                    # merge results of other shards
+                    with profiler.stage('shard_merge'):
+                        shard_ret_dict, shard_culprits_str_dict, shard_live_row_list, missing_shards = self._merge_shard_results(
+                                                                                    cycle_tag, cycle_start + self.sleepPeriod, tmp_log)
+                    ret_dict.update(shard_ret_dict)
+                    culprits_str_dict.update(shard_culprits_str_dict)
+                    if live_row_list is not None:
+                        live_row_list.extend(shard_live_row_list)
+                report_file = os.path.join(self.reportDir, 'slow_tasks_{0}.txt'.format(cycle_tag))
+                with open(report_file, 'w') as _dump_file:
+                    # time spent in report writing is accounted to a stage of the profiler
+                    dump_file = profiler.timed(_dump_file, 'report_writing', ['write'])
+                    self._write_report(dump_file, timeNow, ret_dict, culprits_str_dict, missing_shards, live_row_list)
             # done
-            tmp_log.info('done cycle')
+            cycle_record = profiler.end_cycle(report_file=report_file, shard_index=self.shardIndex, n_shards=self.nShards)
+            tmp_log.info('done cycle in {0:.1f} s ; {1}'.format(cycle_record['duration_seconds'],
+                                                                ' , '.join('{0}={1:.1f}s'.format(name, stage['seconds'])
+                                                                            for name, stage in cycle_record['stages'].items())))
+            if cycle_record['duration_seconds'] > self.sleepPeriod:
+                tmp_log.warning('cycle took longer than sleep period {0} s'.format(self.sleepPeriod))
             # sleep
-            time.sleep(self.sleepPeriod)
+            self._sleep_till_next_cycle()
 
 
 
 
 # launch
-def launcher():
+def launcher(shard_index=0, n_shards=1):
     tmp_log = logger_utils.make_logger(base_logger, method_name='launcher')
     tmp_log.debug('start')
     try:
@@ -447,5 +796,5 @@ def launcher():
         # tmp_log.error('failed to read config json file; should not happen... {0}: {1}'.format(e.__class__.__name__, e))
         raise e
     else:
-        agent = SlowTaskAnalyzer()
+        agent = SlowTaskAnalyzer(shard_index=shard_index, n_shards=n_shards)
         agent.run()
@@ -32,7 +32,7 @@ class TestingAgent(AgentBase):
 
 
 # launch
-def launcher():
+def launcher(shard_index=0, n_shards=1):
     tmp_log = logger_utils.make_logger(base_logger, method_name='launcher')
     tmp_log.debug('start')
     try:
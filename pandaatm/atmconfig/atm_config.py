@@ -1,34 +1,55 @@
 import re
 import sys
+import threading
 
-from pandacommon.liveconfigparser.LiveConfigParser import LiveConfigParser
+# the config file is read when a section is accessed for the first time, so that importing this module is cheap
 
-# get ConfigParser
-tmpConf = LiveConfigParser()
-
-# read
-tmpConf.read('panda_atm.cfg')
+# lock and flag of loading
+_load_lock = threading.Lock()
+_loaded = False
 
 # dummy section class
 class _SectionClass(object):
     pass
 
-# loop over all sections
-for tmpSection in tmpConf.sections():
-    # read section
-    tmpDict = getattr(tmpConf, tmpSection)
-    # make section class
-    tmpSelf = _SectionClass()
-    # update module dict
-    sys.modules[ __name__ ].__dict__[tmpSection] = tmpSelf
-    # expand all values
-    for tmpKey, tmpVal in tmpDict.items():
-        # convert string to bool/int
-        if tmpVal in ('True', 'true'):
-            tmpVal = True
-        elif tmpVal in ('False', 'false'):
-            tmpVal = False
-        elif re.match('^\d+$', tmpVal):
-            tmpVal = int(tmpVal)
-        # update dict
-        setattr(tmpSelf, tmpKey, tmpVal)
+# read config file and set sections as attributes of this module
+def _load():
+    global _loaded
+    with _load_lock:
+        if _loaded:
+            return
+        from pandacommon.liveconfigparser.LiveConfigParser import LiveConfigParser
+        # get ConfigParser
+        tmpConf = LiveConfigParser()
+        # read
+        tmpConf.read('panda_atm.cfg')
+        # loop over all sections
+        for tmpSection in tmpConf.sections():
+            # read section
+            tmpDict = getattr(tmpConf, tmpSection)
+            # make section class
+            tmpSelf = _SectionClass()
+            # update module dict
+            sys.modules[ __name__ ].__dict__[tmpSection] = tmpSelf
+            # expand all values
+            for tmpKey, tmpVal in tmpDict.items():
+                # convert string to bool/int
+                if tmpVal in ('True', 'true'):
+                    tmpVal = True
+                elif tmpVal in ('False', 'false'):
+                    tmpVal = False
+                elif re.match('^\d+$', tmpVal):
+                    tmpVal = int(tmpVal)
+                # update dict
+                setattr(tmpSelf, tmpKey, tmpVal)
+        _loaded = True
+
+# get section; called only when the attribute is not set yet
+def __getattr__(name):
+    if name.startswith('__') or _loaded:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+    _load()
+    try:
+        return sys.modules[ __name__ ].__dict__[name]
+    except KeyError:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name)) from None
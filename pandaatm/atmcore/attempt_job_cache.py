@@ -0,0 +1,105 @@
+import collections
+
+from pandaatm.atmcore.metrics import get_metrics_sender
+
+
+#=== Classes ===================================================
+
+# in-memory cache of jobs of task attempts, updated incrementally from archived jobs
+class AttemptJobCache(object):
+    """
+    Jobs of each task attempt are kept by PandaID with the watermark of the max creationTime seen. The first
+    get_jobs() of an attempt fetches all its jobs, and later calls fetch only archived jobs created since the
+    watermark and merge them, as rows of the same PandaID replace the cached ones. Jobs created before the
+    watermark but archived after the last fetch are not seen, so it is meant for complete attempts, whose jobs
+    are all archived already. An attempt is fetched fully again if its start changes or its end goes back.
+    Least recently used attempts are evicted beyond max_jobs cached jobs; max_jobs=0 disables caching
+    """
+
+    def __init__(self, max_jobs=500000):
+        self.max_jobs = max_jobs
+        # (jediTaskID, attemptNr, concise): {attempt_start, attempt_end, watermark, jobspec_dict}
+        self.entry_dict = collections.OrderedDict()
+        self.n_jobs = 0
+        self.stats_dict = {
+                'n_hits': 0,
+                'n_misses': 0,
+                'n_fetched_jobs': 0,
+            }
+
+    def __len__(self):
+        return len(self.entry_dict)
+
+    def _drop(self, key):
+        entry = self.entry_dict.pop(key)
+        self.n_jobs -= len(entry['jobspec_dict'])
+
+    def has(self, jediTaskID, attemptNr, concise=False):
+        """
+        whether jobs of a task attempt are cached
+        """
+        return (jediTaskID, attemptNr, concise) in self.entry_dict
+
+    def get_jobs(self, db_proxy, jediTaskID, attemptNr, attempt_start, attempt_end, concise=False):
+        """
+        get list of jobspecs of a task attempt as slowTaskJobsInAttempt_ATM of db_proxy, or None if failed
+        """
+        key = (jediTaskID, attemptNr, concise)
+        entry = self.entry_dict.get(key)
+        if entry is not None and (entry['attempt_start'] != attempt_start or attempt_end < entry['attempt_end']):
+            # window changed
+            self._drop(key)
+            entry = None
+        created_after = None if entry is None else entry['watermark']
+        jobspec_list = db_proxy.slowTaskJobsInAttempt_ATM(jediTaskID=jediTaskID, attemptNr=attemptNr,
+                                                        attempt_start=attempt_start, attempt_end=attempt_end,
+                                                        concise=concise, created_after=created_after)
+        if jobspec_list is None:
+            return None
+        metrics_sender = get_metrics_sender()
+        metrics_sender.inc('atm_attempt_job_cache_requests_total', result=('miss' if entry is None else 'hit'))
+        metrics_sender.inc('atm_attempt_job_cache_fetched_jobs_total', len(jobspec_list))
+        self.stats_dict['n_misses' if entry is None else 'n_hits'] += 1
+        self.stats_dict['n_fetched_jobs'] += len(jobspec_list)
+        if not self.max_jobs:
+            return jobspec_list
+        # merge
+        if entry is None:
+            entry = {
+                    'attempt_start': attempt_start,
+                    'attempt_end': attempt_end,
+                    'watermark': None,
+                    'jobspec_dict': {},
+                }
+            self.entry_dict[key] = entry
+        jobspec_dict = entry['jobspec_dict']
+        n_jobs_before = len(jobspec_dict)
+        for jobspec in jobspec_list:
+            jobspec_dict[jobspec.PandaID] = jobspec
+            if entry['watermark'] is None or jobspec.creationTime > entry['watermark']:
+                entry['watermark'] = jobspec.creationTime
+        entry['attempt_end'] = attempt_end
+        self.n_jobs += len(jobspec_dict) - n_jobs_before
+        self.entry_dict.move_to_end(key)
+        ret_list = list(jobspec_dict.values())
+        # evict least recently used attempts
+        while self.n_jobs > self.max_jobs and self.entry_dict:
+            self._drop(next(iter(self.entry_dict)))
+        return ret_list
+
+    def retain(self, key_set):
+        """
+        drop attempts whose (jediTaskID, attemptNr) are not in key_set
+        """
+        for key in list(self.entry_dict):
+            if key[:2] not in key_set:
+                self._drop(key)
+
+    def get_stats(self):
+        """
+        get dict of statistics so far
+        """
+        stats_dict = dict(self.stats_dict)
+        stats_dict['n_attempts'] = len(self.entry_dict)
+        stats_dict['n_jobs'] = self.n_jobs
+        return stats_dict
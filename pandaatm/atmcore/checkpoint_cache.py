@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+
+from pandaatm import panda_pkg_info
+from pandaatm.atmcore.metrics import get_metrics_sender
+
+
+#=== Constants =================================================
+
+# version of the on-disk layout; bump it when the layout changes
+CACHE_FORMAT_VERSION = 1
+
+# name of the metadata file in each entry
+META_FILE_NAME = 'meta.json'
+
+# name of the pickle file of object entries
+OBJECT_FILE_NAME = 'object.pickle'
+
+
+#=== Functions =================================================
+
+def make_cache_key(name, params, code_version=None):
+    """
+    get cache key from name, query parameters and code version
+    """
+    if code_version is None:
+        code_version = panda_pkg_info.release_version
+    key_dict = {
+            'name': name,
+            'params': params,
+            'code_version': code_version,
+            'format_version': CACHE_FORMAT_VERSION,
+        }
+    key_str = json.dumps(key_dict, sort_keys=True, default=str)
+    digest = hashlib.sha256(key_str.encode()).hexdigest()
+    key = '{0}-{1}'.format(name, digest[:24])
+    return key
+
+def _get_dir_size(dir_path):
+    """
+    get total size in bytes of files in a directory
+    """
+    total_size = 0
+    for file_name in os.listdir(dir_path):
+        try:
+            total_size += os.path.getsize(os.path.join(dir_path, file_name))
+        except OSError:
+            pass
+    return total_size
+
+
+#=== Classes ===================================================
+
+# checkpoint cache keyed by hash of query parameters and code version
+class CheckpointCache(object):
+    """
+    Each entry is a directory named by the key, holding meta.json and either
+    one .npy file per array (loaded memory-mapped) or a pickle of an object.
+    Entries are written into a temporary directory and renamed in place; an
+    existing entry is first moved aside to a trash directory and removed after,
+    so readers never see it half removed. Least recently used entries are
+    evicted beyond max_size bytes, down to evict_ratio of max_size. The total
+    size is tracked as a running estimate from written entries, and the cache
+    directory is scanned only when the estimate exceeds max_size or every
+    rescan_interval writes (to catch up with other writers of the directory).
+    """
+
+    def __init__(self, cache_dir, max_size=None, evict_ratio=0.9, rescan_interval=1000):
+        self.cache_dir = os.path.normpath(cache_dir)
+        self.max_size = max_size
+        self.evict_ratio = evict_ratio
+        self.rescan_interval = rescan_interval
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # running estimate of total size; None until the first scan
+        self._size_estimate = None
+        self._n_writes_since_scan = 0
+        self._size_lock = threading.Lock()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _read_meta(self, key):
+        """
+        get metadata of the entry, or None if missing or mismatched
+        """
+        meta_file = os.path.join(self._entry_path(key), META_FILE_NAME)
+        try:
+            with open(meta_file, 'r') as _f:
+                meta = json.load(_f)
+        except (OSError, ValueError):
+            return None
+        if meta.get('key') != key or meta.get('format_version') != CACHE_FORMAT_VERSION:
+            return None
+        # update access time for eviction
+        try:
+            os.utime(meta_file)
+        except OSError:
+            pass
+        return meta
+
+    def _write_entry(self, key, meta, write_func):
+        """
+        write an entry atomically; write_func(tmp_dir) fills the payload files
+        """
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-{0}-'.format(key), dir=self.cache_dir)
+        try:
+            write_func(tmp_dir)
+            meta.update({
+                    'key': key,
+                    'format_version': CACHE_FORMAT_VERSION,
+                    'created_at': time.time(),
+                })
+            with open(os.path.join(tmp_dir, META_FILE_NAME), 'w') as _f:
+                json.dump(meta, _f)
+            entry_size = _get_dir_size(tmp_dir)
+            entry_path = self._entry_path(key)
+            trash_dir = None
+            old_entry_size = 0
+            if os.path.isdir(entry_path):
+                # move existing entry aside, so that readers never see a partially removed entry
+                trash_dir = os.path.join(self.cache_dir, '.trash-{0}-{1}'.format(key, os.urandom(4).hex()))
+                try:
+                    os.rename(entry_path, trash_dir)
+                except FileNotFoundError:
+                    # removed concurrently
+                    trash_dir = None
+                else:
+                    old_entry_size = _get_dir_size(trash_dir)
+            try:
+                os.rename(tmp_dir, entry_path)
+            except OSError:
+                if not os.path.isdir(entry_path):
+                    raise
+                # written concurrently by another writer; keep it
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                entry_size = 0
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        if trash_dir is not None:
+            shutil.rmtree(trash_dir, ignore_errors=True)
+        # evict old entries if needed
+        if self.max_size is None:
+            return
+        with self._size_lock:
+            self._n_writes_since_scan += 1
+            if self._size_estimate is not None:
+                # the replaced entry is gone
+                self._size_estimate += entry_size - old_entry_size
+            to_scan = (self._size_estimate is None or self._size_estimate > self.max_size
+                        or self._n_writes_since_scan >= self.rescan_interval)
+        if to_scan:
+            self.evict(keep_key=key)
+
+    def has(self, key):
+        """
+        whether a valid entry of the key exists
+        """
+        return self._read_meta(key) is not None
+
+    def remove(self, key):
+        """
+        remove the entry of the key
+        """
+        shutil.rmtree(self._entry_path(key), ignore_errors=True)
+
+    def _remove_broken(self, key, meta):
+        """
+        remove the broken entry of the key unless it has been replaced since meta was read
+        """
+        current_meta = self._read_meta(key)
+        if current_meta is not None and current_meta.get('created_at') != meta.get('created_at'):
+            return
+        self.remove(key)
+
+    def dump_arrays(self, key, arrays_dict, extra_meta=None):
+        """
+        store a dict of numpy arrays; extra_meta must be json serializable
+        """
+        def write_func(tmp_dir):
+            for array_name, array in arrays_dict.items():
+                np.save(os.path.join(tmp_dir, '{0}.npy'.format(array_name)), np.asarray(array))
+        meta = {
+                'type': 'arrays',
+                'arrays': sorted(arrays_dict),
+                'extra': extra_meta,
+            }
+        self._write_entry(key, meta, write_func)
+
+    def load_arrays(self, key, mmap=True):
+        """
+        get (arrays_dict, extra_meta) of the key, or None if not cached
+        """
+        meta = self._read_meta(key)
+        if meta is None or meta.get('type') != 'arrays':
+            get_metrics_sender().inc('atm_checkpoint_cache_requests_total', result='miss')
+            return None
+        mmap_mode = 'r' if mmap else None
+        arrays_dict = {}
+        try:
+            for array_name in meta['arrays']:
+                array_file = os.path.join(self._entry_path(key), '{0}.npy'.format(array_name))
+                arrays_dict[array_name] = np.load(array_file, mmap_mode=mmap_mode, allow_pickle=False)
+        except (OSError, ValueError):
+            # broken entry
+            self._remove_broken(key, meta)
+            get_metrics_sender().inc('atm_checkpoint_cache_requests_total', result='miss')
+            return None
+        get_metrics_sender().inc('atm_checkpoint_cache_requests_total', result='hit')
+        return arrays_dict, meta['extra']
+
+    def dump_object(self, key, obj):
+        """
+        store a python object with pickle
+        """
+        def write_func(tmp_dir):
+            with open(os.path.join(tmp_dir, OBJECT_FILE_NAME), 'wb') as _f:
+                pickle.dump(obj, _f, protocol=pickle.HIGHEST_PROTOCOL)
+        meta = {'type': 'object'}
+        self._write_entry(key, meta, write_func)
+
+    def load_object(self, key):
+        """
+        get the python object of the key, or None if not cached
+        """
+        meta = self._read_meta(key)
+        if meta is None or meta.get('type') != 'object':
+            get_metrics_sender().inc('atm_checkpoint_cache_requests_total', result='miss')
+            return None
+        try:
+            with open(os.path.join(self._entry_path(key), OBJECT_FILE_NAME), 'rb') as _f:
+                obj = pickle.load(_f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # broken entry
+            self._remove_broken(key, meta)
+            get_metrics_sender().inc('atm_checkpoint_cache_requests_total', result='miss')
+            return None
+        get_metrics_sender().inc('atm_checkpoint_cache_requests_total', result='hit')
+        return obj
+
+    def evict(self, keep_key=None):
+        """
+        scan the cache directory and, if total size exceeds max_size, remove least recently used entries
+        until it is within evict_ratio of max_size
+        """
+        if self.max_size is None:
+            return
+        entry_list = []
+        total_size = 0
+        for entry_name in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, entry_name)
+            if entry_name.startswith(('.tmp-', '.trash-')) or not os.path.isdir(entry_path):
+                continue
+            try:
+                access_time = os.path.getmtime(os.path.join(entry_path, META_FILE_NAME))
+            except OSError:
+                access_time = 0
+            entry_size = _get_dir_size(entry_path)
+            total_size += entry_size
+            entry_list.append((access_time, entry_name, entry_size))
+        # oldest first
+        entry_list.sort()
+        target_size = self.max_size if total_size <= self.max_size else self.max_size*self.evict_ratio
+        for access_time, entry_name, entry_size in entry_list:
+            if total_size <= target_size:
+                break
+            if entry_name == keep_key:
+                continue
+            self.remove(entry_name)
+            total_size -= entry_size
+        with self._size_lock:
+            self._size_estimate = total_size
+            self._n_writes_since_scan = 0
@@ -0,0 +1,183 @@
+import datetime
+
+import numpy as np
+
+from pandaatm.atmcore.core_utils import NULL_EPOCH_US, datetime_to_epoch_us
+
+
+#=== Constants =================================================
+
+# placeholder of null value in integer columns
+NULL_INT = -1
+
+# dtypes of columns; timestamps are int64 microseconds since epoch
+column_dtype_map = {
+        'PandaID': np.int64,
+        'jediTaskID': np.int64,
+        'attemptNr': np.int32,
+        'userName': np.int32,
+        'jobStatus': np.int16,
+        'actualCoreCount': np.int32,
+        'creationTime': np.int64,
+        'startTime': np.int64,
+        'endTime': np.int64,
+        'computingSite': np.int32,
+    }
+
+# dictionary-encoded columns
+encoded_columns = ('userName', 'jobStatus', 'computingSite')
+
+# timestamp columns
+time_columns = ('creationTime', 'startTime', 'endTime')
+
+
+#=== Functions =================================================
+
+def _encode_value(column, value, vocab_dict):
+    """
+    encode one value of a column into its integer representation
+    """
+    if column in encoded_columns:
+        return vocab_dict[column].setdefault(value, len(vocab_dict[column]))
+    elif column in time_columns:
+        if value in (None, 'NULL'):
+            return NULL_EPOCH_US
+        return datetime_to_epoch_us(value)
+    elif value in (None, 'NULL'):
+        return NULL_INT
+    return value
+
+def make_job_store_arrays(column_names, row_iter, chunk_size=100000):
+    """
+    get a tuple (arrays_dict, extra_meta) of a columnar job store from job rows (e.g. from JobspecsDB).
+    Jobs are sorted by (userName, startTime); endMax is the running maximum of endTime within each user,
+    and userOffset[i]:userOffset[i+1] is the range of jobs of i-th user
+    """
+    vocab_dict = { column: {} for column in encoded_columns if column in column_names }
+    chunk_list_dict = { column: [] for column in column_names }
+    tmp_list_dict = { column: [] for column in column_names }
+    n_tmp_rows = 0
+    # encode rows chunk by chunk
+    for row in row_iter:
+        for column, value in zip(column_names, row):
+            tmp_list_dict[column].append(_encode_value(column, value, vocab_dict))
+        n_tmp_rows += 1
+        if n_tmp_rows >= chunk_size:
+            for column in column_names:
+                chunk_list_dict[column].append(np.array(tmp_list_dict[column], dtype=column_dtype_map[column]))
+                tmp_list_dict[column] = []
+            n_tmp_rows = 0
+    for column in column_names:
+        chunk_list_dict[column].append(np.array(tmp_list_dict[column], dtype=column_dtype_map[column]))
+    arrays_dict = { column: np.concatenate(chunk_list) for column, chunk_list in chunk_list_dict.items() }
+    del chunk_list_dict, tmp_list_dict
+    # recode userName so that codes follow sorted user names
+    user_vocab = sorted(vocab_dict['userName'], key=(lambda x: (x is None, x)))
+    recode_array = np.empty(len(user_vocab), dtype=column_dtype_map['userName'])
+    for new_code, user_name in enumerate(user_vocab):
+        recode_array[vocab_dict['userName'][user_name]] = new_code
+    arrays_dict['userName'] = recode_array[arrays_dict['userName']]
+    # sort by userName and startTime
+    order = np.lexsort((arrays_dict['startTime'], arrays_dict['userName']))
+    for column in column_names:
+        arrays_dict[column] = arrays_dict[column][order]
+    # offsets of users
+    user_offset_array = np.searchsorted(arrays_dict['userName'], np.arange(len(user_vocab) + 1), side='left')
+    arrays_dict['userOffset'] = user_offset_array.astype(np.int64)
+    # running max of endTime in each user (interval index augmentation)
+    end_max_array = np.empty_like(arrays_dict['endTime'])
+    for i in range(len(user_vocab)):
+        segment = slice(user_offset_array[i], user_offset_array[i+1])
+        end_max_array[segment] = np.maximum.accumulate(arrays_dict['endTime'][segment])
+    arrays_dict['endMax'] = end_max_array
+    # vocabularies
+    extra_meta = {
+            'column_names': list(column_names),
+            'vocab': {
+                    column: (user_vocab if column == 'userName' else sorted(vocab, key=vocab.get))
+                    for column, vocab in vocab_dict.items()
+                },
+        }
+    return arrays_dict, extra_meta
+
+
+#=== Classes ===================================================
+
+# columnar job store with interval index
+class ColumnarJobStore(object):
+    """
+    Read-only view over arrays of make_job_store_arrays (typically memory-mapped from CheckpointCache).
+    Columns returned by queries are slices of the arrays, not copies, unless a filter mask is applied
+    """
+
+    def __init__(self, arrays_dict, extra_meta):
+        self.arrays_dict = arrays_dict
+        self.column_names = extra_meta['column_names']
+        self.vocab_dict = extra_meta['vocab']
+        self.code_dict = { column: { value: code for code, value in enumerate(vocab) }
+                            for column, vocab in self.vocab_dict.items() }
+        self.user_offset_array = arrays_dict['userOffset']
+
+    def __len__(self):
+        return len(self.arrays_dict['PandaID'])
+
+    def user_names(self):
+        """
+        get list of user names in the store
+        """
+        return list(self.vocab_dict['userName'])
+
+    def get_code(self, column, value):
+        """
+        get code of a value of a dictionary-encoded column; None if not in the store
+        """
+        return self.code_dict[column].get(value)
+
+    def decode(self, column, code_array):
+        """
+        get list of values from codes of a dictionary-encoded column
+        """
+        vocab = self.vocab_dict[column]
+        return [ vocab[code] for code in code_array.tolist() ]
+
+    def _user_segment(self, user_name):
+        user_code = self.get_code('userName', user_name)
+        if user_code is None:
+            return 0, 0
+        return int(self.user_offset_array[user_code]), int(self.user_offset_array[user_code+1])
+
+    def _slice_columns(self, start, stop, columns=None):
+        if columns is None:
+            columns = self.column_names
+        return { column: self.arrays_dict[column][start:stop] for column in columns }
+
+    def get_user_jobs(self, user_name, columns=None):
+        """
+        get dict of column arrays of all jobs of the user, sorted by startTime
+        """
+        start, stop = self._user_segment(user_name)
+        return self._slice_columns(start, stop, columns)
+
+    def get_overlapping_jobs(self, user_name, time_min, time_max, columns=None):
+        """
+        get dict of column arrays of jobs of the user which ran within the period,
+        i.e. startTime <= time_max and endTime >= time_min; time_min and time_max are datetime or epoch microseconds
+        """
+        if isinstance(time_min, datetime.datetime):
+            time_min = datetime_to_epoch_us(time_min)
+        if isinstance(time_max, datetime.datetime):
+            time_max = datetime_to_epoch_us(time_max)
+        start, stop = self._user_segment(user_name)
+        # jobs before the first with running max of endTime >= time_min all ended before the period
+        lower = start + int(np.searchsorted(self.arrays_dict['endMax'][start:stop], time_min, side='left'))
+        # jobs from the first with startTime > time_max all started after the period
+        upper = start + int(np.searchsorted(self.arrays_dict['startTime'][start:stop], time_max, side='right'))
+        if lower >= upper:
+            return self._slice_columns(lower, lower, columns)
+        # filter candidates
+        start_time_array = self.arrays_dict['startTime'][lower:upper]
+        end_time_array = self.arrays_dict['endTime'][lower:upper]
+        mask = (end_time_array >= time_min) & (start_time_array != NULL_EPOCH_US)
+        if mask.all():
+            return self._slice_columns(lower, upper, columns)
+        return { column: array[mask] for column, array in self._slice_columns(lower, upper, columns).items() }
@@ -1,15 +1,66 @@
 import os
+import time
+import struct
+import pickle
 import datetime
+import operator
+import itertools
 import pathlib
+import queue
 import threading
 import sqlite3
 
+from pandaatm.atmcore.metrics import get_metrics_sender
+
+#=== Constants =================================================
+
+# epoch of naive UTC datetime
+epoch = datetime.datetime(1970, 1, 1)
+
+# placeholder of null timestamp in int64 epoch microseconds (min of int64)
+NULL_EPOCH_US = -2**63
+
+# one microsecond, the unit of integer durations
+one_microsecond = datetime.timedelta(microseconds=1)
+
+
 #=== Functions =================================================
 
-def timedelta_parse_dict(delta_t: datetime.timedelta) -> dict:
-    total_seconds = delta_t.total_seconds()
-    seconds = int(total_seconds)
-    microseconds = int((total_seconds - seconds)*10**6)
+def datetime_to_epoch_us(timestamp: datetime.datetime) -> int:
+    """
+    get integer microseconds since epoch from naive UTC datetime
+    """
+    return (timestamp - epoch) // one_microsecond
+
+def epoch_us_to_datetime(timestamp_us: int) -> datetime.datetime:
+    """
+    get naive UTC datetime from integer microseconds since epoch
+    """
+    return epoch + datetime.timedelta(microseconds=int(timestamp_us))
+
+def timedelta_to_us(delta_t: datetime.timedelta) -> int:
+    """
+    get integer microseconds of timedelta
+    """
+    return delta_t // one_microsecond
+
+def us_to_timedelta(duration_us) -> datetime.timedelta:
+    """
+    get timedelta from microseconds, rounded to integer
+    """
+    return datetime.timedelta(microseconds=round(duration_us))
+
+
+def duration_us_parse_dict(duration_us: int) -> dict:
+    """
+    get dict of components of a duration in integer microseconds, as timedelta_parse_dict
+    """
+    duration_us = int(duration_us)
+    # seconds truncated towards zero
+    seconds = abs(duration_us) // 10**6
+    if duration_us < 0:
+        seconds = -seconds
+    microseconds = duration_us - seconds*10**6
     days, seconds = divmod(seconds, 60*60*24)
     hours, seconds = divmod(seconds, 60*60)
     minutes, seconds = divmod(seconds, 60)
@@ -19,11 +70,80 @@ def timedelta_parse_dict(delta_t: datetime.timedelta) -> dict:
                     'minutes': minutes,
                     'seconds': seconds,
                     'microseconds': microseconds,
-                    'total_seconds': total_seconds,
+                    'total_seconds': duration_us / 10**6,
                     'str_dcolon': f'{days}d {hours:02}:{minutes:02}:{seconds:02}',
                 }
     return ret_dict
 
+def timedelta_parse_dict(delta_t: datetime.timedelta) -> dict:
+    return duration_us_parse_dict(delta_t // one_microsecond)
+
+def duration_us_str(duration_us: int) -> str:
+    """
+    get string "<days>d HH:MM:SS" of a duration in integer microseconds, as str_dcolon of timedelta_parse_dict
+    """
+    duration_us = int(duration_us)
+    seconds = abs(duration_us) // 10**6
+    if duration_us < 0:
+        seconds = -seconds
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    return f'{days}d {hours:02}:{minutes:02}:{seconds:02}'
+
+def timedelta_str(delta_t: datetime.timedelta) -> str:
+    """
+    get string "<days>d HH:MM:SS" of timedelta, as str_dcolon of timedelta_parse_dict
+    """
+    return duration_us_str(delta_t // one_microsecond)
+
+def iter_fetched_batches(cur, fetch_size=10000):
+    """
+    iterate over batches (lists of rows) of an executed query
+    """
+    while True:
+        rows = cur.fetchmany(fetch_size)
+        if not rows:
+            break
+        yield rows
+
+def iter_fetched_rows(cur, fetch_size=10000):
+    """
+    iterate over rows of an executed query, fetching rows in batches
+    """
+    for rows in iter_fetched_batches(cur, fetch_size):
+        yield from rows
+
+def iter_fetched_array_batches(cur, column_dtype_list, fetch_size=10000):
+    """
+    iterate over batches of an executed query of integer columns as dict {column name: numpy array};
+    rows of each fetch are converted at once into a record buffer of the column dtypes, allocated once and
+    reused, so the arrays of a batch are views valid only till the next batch
+    """
+    # import here not to load numpy with the core utilities
+    import numpy as np
+    buffer = np.empty(fetch_size, dtype=np.dtype(list(column_dtype_list)))
+    while True:
+        rows = cur.fetchmany(fetch_size)
+        if not rows:
+            break
+        n_rows = len(rows)
+        if n_rows > len(buffer):
+            buffer = np.empty(n_rows, dtype=buffer.dtype)
+        buffer[:n_rows] = rows
+        del rows
+        yield { name: buffer[name][:n_rows] for name, _ in column_dtype_list }
+
+def iter_column_batches_by_key(cur, column_names, key_column, fetch_size=10000):
+    """
+    iterate over rows of an executed query ordered by key_column, yielding (key, columns_dict)
+    where columns_dict maps column name to the list of values of the rows with the key
+    """
+    key_getter = operator.itemgetter(column_names.index(key_column))
+    for key, rows in itertools.groupby(iter_fetched_rows(cur, fetch_size), key=key_getter):
+        columns_dict = dict(zip(column_names, map(list, zip(*rows))))
+        yield key, columns_dict
+
 
 #=== Classes ===================================================
 
@@ -35,29 +155,171 @@ class SQLiteProxy(object):
                                     detect_types=(sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES),
                                     check_same_thread=False)
         self.cur = self.con.cursor()
+        if self.wal:
+            self._set_pragmas()
 
     def _connect_readonly(self):
         self.con = sqlite3.connect( '{0}?mode=ro'.format(pathlib.PurePath(self.db_file).as_uri()),
                                     detect_types=(sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES),
                                     check_same_thread=False, uri=True)
         self.cur = self.con.cursor()
+        if self.wal:
+            self._set_pragmas(readonly=True)
+
+    def _set_pragmas(self, readonly=False):
+        """
+        set WAL journaling and tune sync and page cache; journal mode is persistent in the db file
+        """
+        if not readonly:
+            self.cur.execute('PRAGMA journal_mode=WAL')
+            self.cur.execute('PRAGMA synchronous=NORMAL')
+        self.cur.execute('PRAGMA cache_size=-{0}'.format(self.cache_size_kib))
+        self.cur.execute('PRAGMA temp_store=MEMORY')
+
+    # connection; one per thread in per_thread mode
+    @property
+    def con(self):
+        if self.per_thread:
+            if getattr(self.thread_local, 'con', None) is None:
+                self._connect_readonly()
+            return self.thread_local.con
+        return self._con
+
+    @con.setter
+    def con(self, con):
+        if self.per_thread:
+            self.thread_local.con = con
+            with self.lock:
+                self.thread_con_list.append(con)
+        else:
+            self._con = con
+
+    # cursor; one per thread in per_thread mode
+    @property
+    def cur(self):
+        if self.per_thread:
+            if getattr(self.thread_local, 'cur', None) is None:
+                self._connect_readonly()
+            return self.thread_local.cur
+        return self._cur
+
+    @cur.setter
+    def cur(self, cur):
+        if self.per_thread:
+            self.thread_local.cur = cur
+        else:
+            self._cur = cur
 
-    def __init__(self, db_file, readonly=False):
+    def __init__(self, db_file, readonly=False, wal=False, cache_size_kib=262144, per_thread=False):
+        """
+        per_thread: readonly connection pool mode; each thread lazily opens its own readonly connection,
+                    and proxies do not lock, so that readers run in parallel (on a WAL db)
+        """
+        if per_thread and not readonly:
+            raise RuntimeError('SQLiteProxy: per_thread mode requires readonly')
         self.db_file = os.path.normpath(db_file)
         self.lock = threading.Lock()
+        self.per_thread = per_thread
+        self.thread_local = threading.local()
+        self.thread_con_list = []
+        self.wal = wal
+        self.cache_size_kib = cache_size_kib
+        self.write_queue = None
+        self.writer_thread = None
+        self.writer_error = None
         if readonly:
             self._connect_readonly()
         else:
             self._connect()
 
     def get_proxy(self):
-        proxy_obj = SQLiteProxyObj(proxy=self, to_lock=True)
+        proxy_obj = SQLiteProxyObj(proxy=self, to_lock=(not self.per_thread))
         return proxy_obj
 
+    def executemany(self, sql, var_map_list):
+        """
+        execute a statement for all var maps in one transaction
+        """
+        with self.get_proxy() as cur:
+            cur.executemany(sql, var_map_list)
+
+    def _writer_loop(self):
+        """
+        loop of the writer thread; execute batches from the queue, merging queued batches into one transaction
+        """
+        to_stop = False
+        while not to_stop:
+            batch_list = [self.write_queue.get()]
+            while True:
+                try:
+                    batch_list.append(self.write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch_list:
+                # stop after the batches queued before
+                to_stop = True
+                batch_list = batch_list[:batch_list.index(None)]
+            if not batch_list or self.writer_error is not None:
+                # nothing to write, or keep draining after an error so that producers never block
+                continue
+            try:
+                with self.get_proxy() as cur:
+                    for sql, var_map_list in batch_list:
+                        cur.executemany(sql, var_map_list)
+            except Exception as e:
+                self.writer_error = e
+
+    def start_writer(self, max_queue_size=64):
+        """
+        start a dedicated writer thread fed by put_batch
+        """
+        if self.writer_thread is not None:
+            return
+        self.write_queue = queue.Queue(max_queue_size)
+        self.writer_error = None
+        self.writer_thread = threading.Thread(target=self._writer_loop,
+                                              name='SQLiteWriter-{0}'.format(os.path.basename(self.db_file)),
+                                              daemon=True)
+        self.writer_thread.start()
+
+    def put_batch(self, sql, var_map_list):
+        """
+        hand over a batch to the writer thread; write directly if no writer thread
+        """
+        if self.writer_thread is None:
+            self.executemany(sql, var_map_list)
+            return
+        if self.writer_error is not None:
+            raise RuntimeError('SQLiteProxy: writer thread failed: {0}'.format(self.writer_error))
+        self.write_queue.put((sql, var_map_list))
+        get_metrics_sender().set('atm_sqlite_write_queue_depth', self.write_queue.qsize(),
+                                    db=os.path.basename(self.db_file))
+
+    def stop_writer(self):
+        """
+        flush queued batches and stop the writer thread
+        """
+        if self.writer_thread is None:
+            return
+        self.write_queue.put(None)
+        self.writer_thread.join()
+        self.writer_thread = None
+        self.write_queue = None
+        if self.writer_error is not None:
+            raise RuntimeError('SQLiteProxy: writer thread failed: {0}'.format(self.writer_error))
+
     def close(self):
-        with self.lock:
-            self.cur.close()
-            self.con.close()
+        try:
+            self.stop_writer()
+        finally:
+            with self.lock:
+                if self.per_thread:
+                    for con in self.thread_con_list:
+                        con.close()
+                    self.thread_con_list = []
+                else:
+                    self.cur.close()
+                    self.con.close()
 
 
 # object of context manager for sqlite proxy for lock
@@ -77,3 +339,108 @@ class SQLiteProxyObj(object):
         if self.to_lock:
             self.proxy.lock.release()
         self.proxy = None
+
+
+# append-only file of (key, value) records, for resumable output
+class AppendOnlyRecordFile(object):
+    """
+    Each record is a pickle of (key, value) prefixed with its length. A truncated record at the end
+    (e.g. process killed while writing) is dropped when reading
+    """
+
+    # struct of length prefix
+    _length_struct = struct.Struct('<Q')
+
+    def __init__(self, file_path):
+        self.file_path = os.path.normpath(file_path)
+        self.lock = threading.Lock()
+        self.fd = None
+
+    def read_records(self):
+        """
+        iterate over (key, value) of complete records in the file, and truncate any broken tail
+        """
+        if not os.path.exists(self.file_path):
+            return
+        good_offset = 0
+        with open(self.file_path, 'rb') as _f:
+            while True:
+                header = _f.read(self._length_struct.size)
+                if len(header) < self._length_struct.size:
+                    break
+                length, = self._length_struct.unpack(header)
+                payload = _f.read(length)
+                if len(payload) < length:
+                    break
+                try:
+                    key, value = pickle.loads(payload)
+                except Exception:
+                    break
+                good_offset = _f.tell()
+                yield key, value
+        if good_offset < os.path.getsize(self.file_path):
+            with open(self.file_path, 'r+b') as _f:
+                _f.truncate(good_offset)
+
+    def read_keys(self):
+        """
+        get set of keys of complete records in the file
+        """
+        return { key for key, _ in self.read_records() }
+
+    def append(self, key, value):
+        """
+        append a record and flush it to the file
+        """
+        payload = pickle.dumps((key, value), protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            if self.fd is None:
+                self.fd = open(self.file_path, 'ab')
+            self.fd.write(self._length_struct.pack(len(payload)) + payload)
+            self.fd.flush()
+            os.fsync(self.fd.fileno())
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                self.fd.close()
+                self.fd = None
+
+
+# reporter of progress with throughput and ETA
+class ProgressReporter(object):
+
+    def __init__(self, n_total, unit='items', interval=60, print_func=print):
+        self.n_total = n_total
+        self.n_done = 0
+        self.unit = unit
+        self.interval = interval
+        self.print_func = print_func
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.last_report_time = self.start_time
+
+    def get_status_str(self):
+        """
+        get string of progress, throughput and ETA
+        """
+        elapsed = time.monotonic() - self.start_time
+        rate = self.n_done / elapsed if elapsed > 0 else 0.
+        if rate > 0:
+            eta_str = str(datetime.timedelta(seconds=int((self.n_total - self.n_done) / rate)))
+        else:
+            eta_str = 'unknown'
+        status_str = 'progress: {n_done}/{n_total} ; {rate:.2f} {unit}/s ; ETA {eta}'.format(
+                            n_done=self.n_done, n_total=self.n_total, rate=rate, unit=self.unit, eta=eta_str)
+        return status_str
+
+    def add(self, n=1):
+        """
+        count n more done, and report if interval passed
+        """
+        with self.lock:
+            self.n_done += n
+            now = time.monotonic()
+            if now - self.last_report_time >= self.interval or self.n_done >= self.n_total:
+                self.last_report_time = now
+                self.print_func(self.get_status_str())
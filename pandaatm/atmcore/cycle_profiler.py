@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import socket
+import datetime
+import resource
+import tracemalloc
+import contextlib
+
+from pandaatm.atmcore.metrics import get_metrics_sender
+
+
+#=== Functions =================================================
+
+def get_current_rss():
+    """
+    get current resident set size in bytes of the process; None if unavailable
+    """
+    try:
+        with open('/proc/self/statm', 'r') as _f:
+            return int(_f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def get_peak_rss():
+    """
+    get peak resident set size in bytes of the process so far
+    """
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+#=== Classes ===================================================
+
+# proxy of an object whose methods are timed as a light stage of the profiler
+class _TimedProxy(object):
+
+    def __init__(self, obj, profiler, stage_name, method_names):
+        self._obj = obj
+        self._profiler = profiler
+        self._stage_name = stage_name
+        self._method_names = set(method_names)
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if name not in self._method_names:
+            return attr
+        def timed_method(*args, **kwargs):
+            with self._profiler.stage(self._stage_name, light=True):
+                return attr(*args, **kwargs)
+        return timed_method
+
+
+# profiler of agent cycles
+class CycleProfiler(object):
+    """
+    Per-cycle instrumentation of an agent. Stages are timed with stage() and may be entered many times per cycle,
+    in which case time and calls are summed. Full stages also record RSS and, with trace_alloc, the delta of
+    python allocations traced by tracemalloc; light stages (e.g. around every log or write call) record only
+    time and calls. Stages may nest, and time of the outer stage includes the inner one.
+    end_cycle() appends one JSON record of the cycle to metrics_file
+    """
+
+    def __init__(self, agent_name, metrics_file=None, trace_alloc=False):
+        self.agent_name = agent_name
+        self.metrics_file = metrics_file
+        self.trace_alloc = trace_alloc
+        self.cycle_number = 0
+        self.last_record = None
+        self._reset()
+
+    def _reset(self):
+        self.cycle_start_time = None
+        self.cycle_start_wall = None
+        self.stage_dict = {}
+        self.count_dict = {}
+
+    def start_cycle(self):
+        """
+        start a new cycle
+        """
+        self._reset()
+        self.cycle_number += 1
+        self.cycle_start_time = time.monotonic()
+        self.cycle_start_wall = datetime.datetime.utcnow()
+        if self.trace_alloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _get_stage_record(self, name):
+        stage_record = self.stage_dict.get(name)
+        if stage_record is None:
+            stage_record = {
+                    'seconds': 0.,
+                    'calls': 0,
+                }
+            self.stage_dict[name] = stage_record
+        return stage_record
+
+    @contextlib.contextmanager
+    def stage(self, name, light=False):
+        """
+        context manager to account the enclosed code to a stage
+        """
+        stage_record = self._get_stage_record(name)
+        to_trace = (not light and tracemalloc.is_tracing())
+        if to_trace:
+            alloc_before = tracemalloc.get_traced_memory()[0]
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - t0
+            stage_record['seconds'] += elapsed
+            stage_record['calls'] += 1
+            if not light:
+                get_metrics_sender().observe('atm_stage_duration_seconds', elapsed, stage=name)
+                rss = get_current_rss()
+                if rss is not None:
+                    stage_record['rss_max_bytes'] = max(stage_record.get('rss_max_bytes', 0), rss)
+                if to_trace:
+                    alloc_delta = tracemalloc.get_traced_memory()[0] - alloc_before
+                    stage_record['alloc_delta_bytes'] = stage_record.get('alloc_delta_bytes', 0) + alloc_delta
+
+    def count(self, name, n=1):
+        """
+        add n to a counter of the cycle
+        """
+        self.count_dict[name] = self.count_dict.get(name, 0) + n
+
+    def timed(self, obj, stage_name, method_names):
+        """
+        get a proxy of obj whose methods in method_names are timed as a light stage, e.g. logger or report file
+        """
+        return _TimedProxy(obj, self, stage_name, method_names)
+
+    def end_cycle(self, **extra):
+        """
+        finish the cycle, append its record to metrics file, and return the record
+        """
+        record = {
+                'agent': self.agent_name,
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'cycle': self.cycle_number,
+                'start_time': self.cycle_start_wall.isoformat() if self.cycle_start_wall else None,
+                'duration_seconds': (time.monotonic() - self.cycle_start_time) if self.cycle_start_time else None,
+                'stages': self.stage_dict,
+                'counts': self.count_dict,
+                'rss_bytes': get_current_rss(),
+                'peak_rss_bytes': get_peak_rss(),
+            }
+        if tracemalloc.is_tracing():
+            record['traced_alloc_bytes'], record['traced_alloc_peak_bytes'] = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        record.update(extra)
+        # metrics to the master
+        metrics_sender = get_metrics_sender()
+        if record['duration_seconds'] is not None:
+            metrics_sender.observe('atm_cycle_duration_seconds', record['duration_seconds'])
+        for name, n in self.count_dict.items():
+            metrics_sender.inc('atm_cycle_items_total', n, item=name)
+        if record['rss_bytes'] is not None:
+            metrics_sender.set('atm_process_rss_bytes', record['rss_bytes'])
+        if self.metrics_file is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.metrics_file)), exist_ok=True)
+            with open(self.metrics_file, 'a') as _f:
+                _f.write(json.dumps(record, default=str) + '\n')
+        self.last_record = record
+        self._reset()
+        return record
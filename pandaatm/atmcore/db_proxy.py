@@ -2,16 +2,20 @@ import os
 import sys
 import re
 import copy
+import time
+import functools
 import logging
 import datetime
 import traceback
 import itertools
-
-import cx_Oracle
+import contextlib
 
 from pandaatm.atmconfig import atm_config
 from pandaatm.atmcore import core_utils
-from pandaatm.atmutils.generic_utils import TaskAttempt
+from pandaatm.atmcore.metrics import get_metrics_sender
+from pandaatm.atmutils.generic_utils import task_attempt_final_statuses
+from pandaatm.atmutils.slow_task_analyzer_utils import job_status_code_map, job_array_column_dtypes
+from pandaatm.atmutils.task_status_log_parser import TaskStatusLogParser, task_attempt_to_dict
 
 from pandacommon.pandalogger import logger_utils
 
@@ -30,8 +34,31 @@ base_logger = logger_utils.setup_logger(__name__.split('.')[-1])
 OraDBProxy._logger = base_logger
 
 
+# output type handler of cursors to get numbers as native integers rather than Decimal or float
+def _native_int_output_type_handler(cursor, name, default_type, size, precision, scale):
+    # import here not to load the DB client with this module
+    import cx_Oracle
+    if default_type == cx_Oracle.DB_TYPE_NUMBER:
+        return cursor.var(cx_Oracle.NATIVE_INT, arraysize=cursor.arraysize)
+
+
+# decorator to record latency of ATM queries
+def record_query_time(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        t0 = time.monotonic()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            get_metrics_sender().observe('atm_db_query_duration_seconds', time.monotonic() - t0, method=method.__name__)
+    return wrapper
+
+
 class DBProxy(OraDBProxy.DBProxy):
 
+    # number of rows per fetch of large queries
+    fetch_size = 10000
+
     # constructor
     def __init__(self, useOtherError=False):
         OraDBProxy.DBProxy.__init__(self, useOtherError)
@@ -79,15 +106,18 @@ class DBProxy(OraDBProxy.DBProxy):
 
     #====================================================================
 
+    @record_query_time
     def slowTaskAttemptsFilter01_ATM(self,
                                     created_since: datetime.datetime,
                                     created_before=None,
                                     prod_source_label: str = 'user',
                                     gshare=None,
                                     task_duration=None,
+                                    shard=None,
                                     ) -> dict :
         """
         First filter to get possible slow tasks
+        shard is (shard_index, n_shards) to get only tasks with jediTaskID % n_shards == shard_index
         """
         comment = ' /* atmcore.db_proxy.slowTaskAttemptsFilter01_ATM */'
         method_name = self.getMethodName(comment)
@@ -95,25 +125,19 @@ class DBProxy(OraDBProxy.DBProxy):
         tmp_log = logger_utils.make_logger(base_logger, method_name=method_name)
         tmp_log.debug('start')
         try:
-            taskAttemptsDict = {}
             retDict = {}
-            # sql to get tasks with the first filter
-            sqlT = (
-                    "SELECT jediTaskID,creationDate,userName "
-                    "FROM ATLAS_PANDA.JEDI_Tasks "
-                    "WHERE prodSourceLabel=:prodSourceLabel "
-                        "AND creationDate>=:creationDateMin "
+            # sql to get task status log of tasks with the first filter
+            sqlSLT = (
+                    'SELECT sl.jediTaskID,sl.modificationTime,sl.status,t.userName '
+                    'FROM ATLAS_PANDA.Tasks_StatusLog sl, ATLAS_PANDA.JEDI_Tasks t '
+                    'WHERE sl.jediTaskID=t.jediTaskID '
+                        "AND t.prodSourceLabel=:prodSourceLabel "
+                        "AND t.creationDate>=:creationDateMin "
                         "{created_before_filter} "
                         "{gshare_filter} "
                         "{task_duration_filter} "
-                    "ORDER BY jediTaskID DESC "
-                )
-            # sql to get task status log
-            sqlSL = (
-                    'SELECT modificationTime,status '
-                    'FROM ATLAS_PANDA.Tasks_StatusLog '
-                    'WHERE jediTaskID=:jediTaskID '
-                    'ORDER BY modificationTime '
+                        "{shard_filter} "
+                    'ORDER BY sl.jediTaskID, sl.modificationTime '
                 )
             # get tasks
             varMap = dict()
@@ -122,52 +146,34 @@ class DBProxy(OraDBProxy.DBProxy):
             created_before_filter = ''
             gshare_filter = ''
             task_duration_filter = ''
+            shard_filter = ''
             if created_before is not None:
                 varMap[':creationDateMax'] = created_before
-                created_before_filter = 'AND creationDate<:creationDateMax'
+                created_before_filter = 'AND t.creationDate<:creationDateMax'
             if gshare is not None:
                 varMap[':gshare'] = gshare
-                gshare_filter = 'AND gshare=:gshare'
+                gshare_filter = 'AND t.gshare=:gshare'
             if task_duration is not None:
                 varMap[':taskDurationMax'] = task_duration
-                task_duration_filter = 'AND (CAST(endTime AS TIMESTAMP) - creationDate) >:taskDurationMax '
-            sqlT = sqlT.format( created_before_filter=created_before_filter,
-                                gshare_filter=gshare_filter,
-                                task_duration_filter=task_duration_filter)
-            self.cur.execute(sqlT + comment, varMap)
-            tmpTasksRes = self.cur.fetchall()
-            tmp_log.debug('got tasks to parse')
-            # loop over tasks to parse status log
-            for jediTaskID, creationDate, userName in tmpTasksRes:
-                varMap = dict()
-                varMap[':jediTaskID'] = jediTaskID
-                self.cur.execute(sqlSL + comment, varMap)
-                tmpSLRes = self.cur.fetchall()
-                # parse status log
-                # (jediTaskID,attemptNr): {startTime, endTime, attemptDuration, finalStatus, statusList, userName}
-                attemptNr = 1
-                toGetAttempt = True
-                for modificationTime, status in tmpSLRes:
-                    if toGetAttempt:
-                        taskAttemptsDict[(jediTaskID, attemptNr)] = {}
-                        taskAttemptsDict[(jediTaskID, attemptNr)]['startTime'] = modificationTime
-                        taskAttemptsDict[(jediTaskID, attemptNr)]['statusList'] = []
-                        taskAttemptsDict[(jediTaskID, attemptNr)]['userName'] = userName
-                        toGetAttempt = False
-                    taskAttemptsDict[(jediTaskID, attemptNr)]['statusList'].append((status, modificationTime))
-                    taskAttemptsDict[(jediTaskID, attemptNr)]['finalStatus'] = status
-                    if status in ('finished', 'done', 'failed', 'aborted', 'broken'):
-                        taskAttemptsDict[(jediTaskID, attemptNr)]['endTime'] = modificationTime
-                        try:
-                            taskAttemptsDict[(jediTaskID, attemptNr)]['attemptDuration'] = modificationTime - taskAttemptsDict[(jediTaskID, attemptNr)]['startTime']
-                        except KeyError:
-                            pass
-                        toGetAttempt = True
-                        attemptNr += 1
-                # filter for return dict
-                for k, v in taskAttemptsDict.items():
-                    if 'attemptDuration' in v and v['attemptDuration'] > task_duration:
-                        retDict[k] = v
+                task_duration_filter = 'AND (CAST(t.endTime AS TIMESTAMP) - t.creationDate) >:taskDurationMax '
+            if shard is not None:
+                varMap[':shardIndex'], varMap[':nShards'] = shard
+                shard_filter = 'AND MOD(t.jediTaskID,:nShards)=:shardIndex'
+            sqlSLT = sqlSLT.format( created_before_filter=created_before_filter,
+                                    gshare_filter=gshare_filter,
+                                    task_duration_filter=task_duration_filter,
+                                    shard_filter=shard_filter)
+            self.cur.execute(sqlSLT + comment, varMap)
+            # parse status log into task attempts
+            parser = TaskStatusLogParser()
+            for tmpSLRes in core_utils.iter_fetched_batches(self.cur, self.fetch_size):
+                parser.feed(tmpSLRes)
+            tmp_log.debug('parsed task status logs')
+            # filter for return dict
+            # (jediTaskID,attemptNr): {startTime, endTime, attemptDuration, finalStatus, statusList, userName}
+            for k, task_attempt in parser.get_task_attempts_dict(complete_only=True).items():
+                if task_duration is None or task_attempt.attemptDuration > task_duration:
+                    retDict[k] = task_attempt_to_dict(task_attempt)
             tmp_log.debug('done, got {0} slow task attempts'.format(len(retDict)))
             # return
             return retDict
@@ -178,6 +184,80 @@ class DBProxy(OraDBProxy.DBProxy):
             self.dumpErrorMessage(tmp_log)
             return None
 
+    @record_query_time
+    def openTaskAttempts_ATM(self,
+                            created_since: datetime.datetime,
+                            prod_source_label: str = 'user',
+                            gshare=None,
+                            attempt_duration=None,
+                            shard=None,
+                            ) -> dict :
+        """
+        Attempts still open (last attempts of tasks not in a final status), to be analyzed provisionally
+        attempt_duration is the min duration from the attempt start till now
+        shard is (shard_index, n_shards) to get only tasks with jediTaskID % n_shards == shard_index
+        """
+        comment = ' /* atmcore.db_proxy.openTaskAttempts_ATM */'
+        method_name = self.getMethodName(comment)
+        tmp_log = logger_utils.make_logger(base_logger, method_name=method_name)
+        tmp_log.debug('start')
+        try:
+            retDict = {}
+            timeNow = datetime.datetime.utcnow()
+            # sql to get task status log of tasks not in final status
+            final_status_var_names_str = ','.join([ ':finalStatus{0}'.format(i) for i in range(len(task_attempt_final_statuses)) ])
+            sqlSLT = (
+                    'SELECT sl.jediTaskID,sl.modificationTime,sl.status,t.userName '
+                    'FROM ATLAS_PANDA.Tasks_StatusLog sl, ATLAS_PANDA.JEDI_Tasks t '
+                    'WHERE sl.jediTaskID=t.jediTaskID '
+                        "AND t.prodSourceLabel=:prodSourceLabel "
+                        "AND t.creationDate>=:creationDateMin "
+                        "AND t.status NOT IN ({final_status_var_names_str}) "
+                        "{gshare_filter} "
+                        "{shard_filter} "
+                    'ORDER BY sl.jediTaskID, sl.modificationTime '
+                )
+            # get tasks
+            varMap = dict()
+            varMap[':prodSourceLabel'] = prod_source_label
+            varMap[':creationDateMin'] = created_since
+            for i, status in enumerate(task_attempt_final_statuses):
+                varMap[':finalStatus{0}'.format(i)] = status
+            gshare_filter = ''
+            shard_filter = ''
+            if gshare is not None:
+                varMap[':gshare'] = gshare
+                gshare_filter = 'AND t.gshare=:gshare'
+            if shard is not None:
+                varMap[':shardIndex'], varMap[':nShards'] = shard
+                shard_filter = 'AND MOD(t.jediTaskID,:nShards)=:shardIndex'
+            sqlSLT = sqlSLT.format( final_status_var_names_str=final_status_var_names_str,
+                                    gshare_filter=gshare_filter,
+                                    shard_filter=shard_filter)
+            self.cur.execute(sqlSLT + comment, varMap)
+            # parse status log into task attempts
+            parser = TaskStatusLogParser()
+            for tmpSLRes in core_utils.iter_fetched_batches(self.cur, self.fetch_size):
+                parser.feed(tmpSLRes)
+            tmp_log.debug('parsed task status logs')
+            # filter for return dict; finalStatus is the current status of open attempts
+            # (jediTaskID,attemptNr): {startTime, finalStatus, statusList, userName}
+            for k, task_attempt in parser.get_task_attempts_dict().items():
+                if task_attempt.is_complete():
+                    continue
+                if attempt_duration is None or timeNow - task_attempt.startTime > attempt_duration:
+                    retDict[k] = task_attempt_to_dict(task_attempt)
+            tmp_log.debug('done, got {0} open task attempts'.format(len(retDict)))
+            # return
+            return retDict
+        except Exception:
+            # roll back
+            self._rollback()
+            # error
+            self.dumpErrorMessage(tmp_log)
+            return None
+
+    @record_query_time
     def getTaskAttempts_ATM(self,
                             created_since: datetime.datetime,
                             created_before=None,
@@ -193,7 +273,6 @@ class DBProxy(OraDBProxy.DBProxy):
         tmp_log = logger_utils.make_logger(base_logger, method_name=method_name)
         tmp_log.debug('start')
         try:
-            taskAttemptsDict = {}
             retDict = {}
             # sql to get attempt from task status log and tasks table
             sqlSLT = (
@@ -221,36 +300,14 @@ class DBProxy(OraDBProxy.DBProxy):
             sqlSLT = sqlSLT.format( created_before_filter=created_before_filter,
                                     gshare_filter=gshare_filter)
             self.cur.execute(sqlSLT + comment, varMap)
-            tmpTasksRes = self.cur.fetchall()
-            tmp_log.debug('got task status logs to parse')
-            # loop over task status logs to parse task attempts
-            task_attempt_record_dict = {}
-            for jediTaskID, modificationTime, status, userName in tmpTasksRes:
-                if jediTaskID not in task_attempt_record_dict:
-                    # new task, mark attempt = 1
-                    task_attempt_record_dict[jediTaskID] = 1
-                # current attempt number of the task
-                attemptNr = task_attempt_record_dict[jediTaskID]
-                key = (jediTaskID, attemptNr)
-                # fill the dict with the task attempt
-                if key not in taskAttemptsDict:
-                    # new task attempt
-                    taskAttemptsDict[key] = TaskAttempt(jediTaskID=jediTaskID,
-                                                        attemptNr=attemptNr,
-                                                        startTime=modificationTime,
-                                                        userName=userName)
-                # current task attempt
-                task_attempt = taskAttemptsDict[key]
-                # update task attempt
-                task_attempt.update_status(status=status, modificationTime=modificationTime)
-                # check whether the task attempt is complete
-                if task_attempt.is_complete():
-                    # increase attemptNr fot the task
-                    task_attempt_record_dict[jediTaskID] += 1
+            # parse status log into task attempts
+            parser = TaskStatusLogParser()
+            for tmpSLRes in core_utils.iter_fetched_batches(self.cur, self.fetch_size):
+                parser.feed(tmpSLRes)
+            tmp_log.debug('parsed task status logs')
             # filter for return dict
-            for key, task_attempt in taskAttemptsDict.items():
-                if task_attempt.is_complete() \
-                        and task_attempt.startTime >= created_since \
+            for key, task_attempt in parser.get_task_attempts_dict(complete_only=True).items():
+                if task_attempt.startTime >= created_since \
                         and (created_before is None or task_attempt.startTime < created_before):
                     retDict[key] = task_attempt
             tmp_log.debug('done, got {0} task attempts'.format(len(retDict)))
@@ -263,11 +320,13 @@ class DBProxy(OraDBProxy.DBProxy):
             self.dumpErrorMessage(tmp_log)
             return None
 
+    @record_query_time
     def slowTaskJobsInAttempt_ATM(self, jediTaskID: int, attemptNr: int,
                                     attempt_start: datetime.datetime, attempt_end: datetime.datetime,
-                                    concise=False) -> list :
+                                    concise=False, created_after=None) -> list :
         """
         Jobs of a slow task attempt
+        created_after is to get only jobs created since then, to update jobs fetched before
         """
         comment = ' /* atmcore.db_proxy.slowTaskJobsInAttempt_ATM */'
         method_name = self.getMethodName(comment)
@@ -281,22 +340,29 @@ class DBProxy(OraDBProxy.DBProxy):
                 job_columns = ','.join(important_attrs)
             else:
                 job_columns = str(JobSpec.columnNames())
+            created_after_filter = ''
+            if created_after is not None:
+                created_after_filter = 'AND creationTime>=:created_after'
             # sql to get archived jobs
             sqlJA1 = (
                     'SELECT {job_columns} '
                     'FROM ATLAS_PANDAARCH.JOBSARCHIVED '
                     'WHERE jediTaskID=:jediTaskID AND creationTime>=:attempt_start AND creationTime<=:attempt_end '
-                ).format(job_columns=job_columns)
+                        '{created_after_filter} '
+                ).format(job_columns=job_columns, created_after_filter=created_after_filter)
             sqlJA2 = (
                     'SELECT {job_columns} '
                     'FROM ATLAS_PANDA.JOBSARCHIVED4 '
                     'WHERE jediTaskID=:jediTaskID AND creationTime>=:attempt_start AND creationTime<=:attempt_end '
-                ).format(job_columns=job_columns)
+                        '{created_after_filter} '
+                ).format(job_columns=job_columns, created_after_filter=created_after_filter)
             # get jobs
             varMap = dict()
             varMap[':jediTaskID'] = jediTaskID
             varMap[':attempt_start'] = attempt_start
             varMap[':attempt_end'] = attempt_end
+            if created_after is not None:
+                varMap[':created_after'] = created_after
             self.cur.execute(sqlJA1 + comment, varMap)
             tmpJRes1 = self.cur.fetchall()
             self.cur.execute(sqlJA2 + comment, varMap)
@@ -327,11 +393,279 @@ class DBProxy(OraDBProxy.DBProxy):
             self.dumpErrorMessage(tmp_log)
             return None
 
+    @contextlib.contextmanager
+    def _cursor_fetch_settings(self, arraysize, outputtypehandler=None):
+        """
+        set arraysize (and prefetchrows) and output type handler of the cursor, restored on exit
+        """
+        old_arraysize = self.cur.arraysize
+        old_prefetchrows = getattr(self.cur, 'prefetchrows', None)
+        old_output_type_handler = getattr(self.cur, 'outputtypehandler', None)
+        try:
+            self.cur.arraysize = arraysize
+            if old_prefetchrows is not None:
+                self.cur.prefetchrows = arraysize + 1
+            self.cur.outputtypehandler = outputtypehandler
+            yield self.cur
+        finally:
+            self.cur.arraysize = old_arraysize
+            if old_prefetchrows is not None:
+                self.cur.prefetchrows = old_prefetchrows
+            self.cur.outputtypehandler = old_output_type_handler
+
+    @record_query_time
+    def getJobArraysInAttempt_ATM(self, jediTaskID: int, attemptNr: int,
+                                    attempt_start: datetime.datetime, attempt_end: datetime.datetime,
+                                    batch_func, created_after=None, batch_size=None) -> int :
+        """
+        Archived jobs of a task attempt as slowTaskJobsInAttempt_ATM with concise=True, but as batches of
+        dict of numpy arrays of job_array_column_dtypes, without datetime or JobSpec objects.
+        batch_func(arrays_dict) is called for each batch as it is fetched; the arrays are views of a buffer
+        reused for the next batch, so copy them to keep them.
+        Timestamps are converted into epoch microseconds in DB, and numbers are fetched as native integers
+        with an output type handler. Return number of jobs, or None if failed
+        """
+        comment = ' /* atmcore.db_proxy.getJobArraysInAttempt_ATM */'
+        method_name = self.getMethodName(comment)
+        method_name += ' < jediTaskID={0} attemptNr={1} > '.format(jediTaskID, attemptNr)
+        tmp_log = logger_utils.make_logger(base_logger, method_name=method_name)
+        tmp_log.debug('start')
+        if batch_size is None:
+            batch_size = self.fetch_size
+        try:
+            created_after_filter = ''
+            created_after_filter_j4 = ''
+            if created_after is not None:
+                created_after_filter = 'AND creationTime>=:created_after'
+                created_after_filter_j4 = 'AND j4.creationTime>=:created_after'
+            status_case_str = ' '.join([ 'WHEN :jobStatus{0} THEN {1}'.format(i, status_code)
+                                        for i, status_code in enumerate(job_status_code_map.values()) ])
+            # sql to get archived jobs; jobs of both tables are taken once as in slowTaskJobsInAttempt_ATM
+            sqlJA = (
+                    'SELECT PandaID,'
+                        'CASE jobStatus {status_case_str} ELSE -1 END,'
+                        'NVL(actualCoreCount,-1),'
+                        'ROUND((creationTime-:epoch)*86400)*1000000,'
+                        'NVL(ROUND((startTime-:epoch)*86400)*1000000,:null_epoch_us),'
+                        'NVL(ROUND((endTime-:epoch)*86400)*1000000,:null_epoch_us) '
+                    'FROM ('
+                        'SELECT PandaID,jobStatus,actualCoreCount,creationTime,startTime,endTime '
+                        'FROM ATLAS_PANDAARCH.JOBSARCHIVED '
+                        'WHERE jediTaskID=:jediTaskID AND creationTime>=:attempt_start AND creationTime<=:attempt_end '
+                            '{created_after_filter} '
+                        'UNION ALL '
+                        'SELECT j4.PandaID,j4.jobStatus,j4.actualCoreCount,j4.creationTime,j4.startTime,j4.endTime '
+                        'FROM ATLAS_PANDA.JOBSARCHIVED4 j4 '
+                        'WHERE j4.jediTaskID=:jediTaskID AND j4.creationTime>=:attempt_start AND j4.creationTime<=:attempt_end '
+                            '{created_after_filter_j4} '
+                            'AND NOT EXISTS ('
+                                'SELECT 1 FROM ATLAS_PANDAARCH.JOBSARCHIVED ja '
+                                'WHERE ja.PandaID=j4.PandaID AND ja.jediTaskID=:jediTaskID '
+                                    'AND ja.creationTime>=:attempt_start AND ja.creationTime<=:attempt_end) '
+                    ') '
+                ).format(status_case_str=status_case_str, created_after_filter=created_after_filter,
+                            created_after_filter_j4=created_after_filter_j4)
+            varMap = dict()
+            varMap[':jediTaskID'] = jediTaskID
+            varMap[':attempt_start'] = attempt_start
+            varMap[':attempt_end'] = attempt_end
+            varMap[':epoch'] = core_utils.epoch
+            varMap[':null_epoch_us'] = core_utils.NULL_EPOCH_US
+            for i, status in enumerate(job_status_code_map):
+                varMap[':jobStatus{0}'.format(i)] = status
+            if created_after is not None:
+                varMap[':created_after'] = created_after
+            # fetch a batch per round trip, with numbers as native integers
+            with self._cursor_fetch_settings(arraysize=batch_size, outputtypehandler=_native_int_output_type_handler):
+                self.cur.execute(sqlJA + comment, varMap)
+                n_jobs = 0
+                for arrays_dict in core_utils.iter_fetched_array_batches(self.cur, job_array_column_dtypes, batch_size):
+                    n_jobs += len(arrays_dict['PandaID'])
+                    batch_func(arrays_dict)
+            # return
+            tmp_log.debug('done, got {0} jobs'.format(n_jobs))
+            return n_jobs
+        except Exception:
+            # roll back
+            self._rollback()
+            # error
+            self.dumpErrorMessage(tmp_log)
+            return None
+
+    @record_query_time
+    def slowTaskJobsCountInAttempt_ATM(self, jediTaskID: int, attempt_start: datetime.datetime,
+                                        attempt_end: datetime.datetime) -> int :
+        """
+        Number of archived jobs of a task attempt, to estimate the size of slowTaskJobsInAttempt_ATM;
+        jobs in both archive tables are counted twice
+        """
+        comment = ' /* atmcore.db_proxy.slowTaskJobsCountInAttempt_ATM */'
+        method_name = self.getMethodName(comment)
+        method_name += ' < jediTaskID={0} > '.format(jediTaskID)
+        tmp_log = logger_utils.make_logger(base_logger, method_name=method_name)
+        tmp_log.debug('start')
+        try:
+            # sql to count archived jobs
+            sqlJC = (
+                    'SELECT (SELECT COUNT(*) FROM ATLAS_PANDAARCH.JOBSARCHIVED '
+                            'WHERE jediTaskID=:jediTaskID AND creationTime>=:attempt_start AND creationTime<=:attempt_end),'
+                        '(SELECT COUNT(*) FROM ATLAS_PANDA.JOBSARCHIVED4 '
+                            'WHERE jediTaskID=:jediTaskID AND creationTime>=:attempt_start AND creationTime<=:attempt_end) '
+                    'FROM dual '
+                )
+            # count
+            varMap = dict()
+            varMap[':jediTaskID'] = jediTaskID
+            varMap[':attempt_start'] = attempt_start
+            varMap[':attempt_end'] = attempt_end
+            self.cur.execute(sqlJC + comment, varMap)
+            n_jobs = sum(self.cur.fetchone())
+            # return
+            tmp_log.debug('done, got {0} jobs'.format(n_jobs))
+            return n_jobs
+        except Exception:
+            # roll back
+            self._rollback()
+            # error
+            self.dumpErrorMessage(tmp_log)
+            return None
+
+    @record_query_time
+    def slowTaskAttemptAggregate_ATM(self, jediTaskID: int, attemptNr: int,
+                                        attempt_start: datetime.datetime, attempt_end: datetime.datetime) -> dict :
+        """
+        Aggregates of jobs of a task attempt computed in DB, to screen attempts before fetching their jobs
+        successful_run_time is the run time of finished jobs shared with concurrent jobs, as in
+        get_jobs_time_consumption_statistics; finished_run_time is the plain sum, an upper bound of it
+        """
+        comment = ' /* atmcore.db_proxy.slowTaskAttemptAggregate_ATM */'
+        method_name = self.getMethodName(comment)
+        method_name += ' < jediTaskID={0} attemptNr={1} > '.format(jediTaskID, attemptNr)
+        tmp_log = logger_utils.make_logger(base_logger, method_name=method_name)
+        tmp_log.debug('start')
+        try:
+            # sql to sweep chronicle points of archived jobs; jobs of both tables are taken once as in slowTaskJobsInAttempt_ATM
+            status_var_names_str = ','.join([ ':jobStatus{0}'.format(i) for i in range(len(job_status_code_map)) ])
+            sqlJAA = (
+                    'WITH jj AS ('
+                        'SELECT jobStatus,creationTime,endTime,'
+                            'CASE WHEN startTime IS NULL OR startTime>endTime THEN endTime '
+                                'WHEN startTime<creationTime THEN creationTime ELSE startTime END AS runStartTime '
+                        'FROM ('
+                            'SELECT jobStatus,creationTime,startTime,endTime '
+                            'FROM ATLAS_PANDAARCH.JOBSARCHIVED '
+                            'WHERE jediTaskID=:jediTaskID AND creationTime>=:attempt_start AND creationTime<=:attempt_end '
+                            'UNION ALL '
+                            'SELECT j4.jobStatus,j4.creationTime,j4.startTime,j4.endTime '
+                            'FROM ATLAS_PANDA.JOBSARCHIVED4 j4 '
+                            'WHERE j4.jediTaskID=:jediTaskID AND j4.creationTime>=:attempt_start AND j4.creationTime<=:attempt_end '
+                                'AND NOT EXISTS ('
+                                    'SELECT 1 FROM ATLAS_PANDAARCH.JOBSARCHIVED ja '
+                                    'WHERE ja.PandaID=j4.PandaID AND ja.jediTaskID=:jediTaskID '
+                                        'AND ja.creationTime>=:attempt_start AND ja.creationTime<=:attempt_end) '
+                        ') '
+                        'WHERE jobStatus IN ({status_var_names_str}) AND endTime>=creationTime '
+                    '), '
+                    'ev AS ('
+                        'SELECT creationTime AS t,1 AS dTotal,0 AS dFinRun FROM jj '
+                        'UNION ALL '
+                        'SELECT runStartTime,0,CASE WHEN jobStatus=:finished THEN 1 ELSE 0 END FROM jj '
+                        'UNION ALL '
+                        'SELECT endTime,-1,CASE WHEN jobStatus=:finished THEN -1 ELSE 0 END FROM jj '
+                    '), '
+                    'pt AS ('
+                        'SELECT t,SUM(dTotal) AS dTotal,SUM(dFinRun) AS dFinRun FROM ev GROUP BY t '
+                    '), '
+                    'seg AS ('
+                        'SELECT (LEAD(t) OVER (ORDER BY t) - t)*86400 AS duration,'
+                            'SUM(dTotal) OVER (ORDER BY t) AS nTotal,'
+                            'SUM(dFinRun) OVER (ORDER BY t) AS nFinRun '
+                        'FROM pt '
+                    ') '
+                    'SELECT (SELECT COUNT(*) FROM jj),'
+                        '(SELECT COUNT(*) FROM jj WHERE jobStatus=:finished),'
+                        '(SELECT NVL(SUM((endTime-runStartTime)*86400),0) FROM jj WHERE jobStatus=:finished),'
+                        'NVL(SUM(CASE WHEN nTotal>0 THEN duration*nFinRun/nTotal ELSE 0 END),0) '
+                    'FROM seg '
+                ).format(status_var_names_str=status_var_names_str)
+            # get aggregates
+            varMap = dict()
+            varMap[':jediTaskID'] = jediTaskID
+            varMap[':attempt_start'] = attempt_start
+            varMap[':attempt_end'] = attempt_end
+            varMap[':finished'] = 'finished'
+            for i, status in enumerate(job_status_code_map):
+                varMap[':jobStatus{0}'.format(i)] = status
+            self.cur.execute(sqlJAA + comment, varMap)
+            n_jobs, n_finished_jobs, finished_run_seconds, successful_run_seconds = self.cur.fetchone()
+            retDict = {
+                    'n_jobs': int(n_jobs),
+                    'n_finished_jobs': int(n_finished_jobs),
+                    'finished_run_time': datetime.timedelta(seconds=float(finished_run_seconds)),
+                    'successful_run_time': datetime.timedelta(seconds=float(successful_run_seconds)),
+                }
+            # return
+            tmp_log.debug('done, got {0}'.format(retDict))
+            return retDict
+        except Exception:
+            # roll back
+            self._rollback()
+            # error
+            self.dumpErrorMessage(tmp_log)
+            return None
+
+    @record_query_time
+    def activeJobsInTask_ATM(self, jediTaskID: int, created_since: datetime.datetime) -> list :
+        """
+        Jobs of a task not terminated yet, i.e. in defined/waiting/active tables, created since created_since
+        Only concise attributes are filled
+        """
+        comment = ' /* atmcore.db_proxy.activeJobsInTask_ATM */'
+        method_name = self.getMethodName(comment)
+        method_name += ' < jediTaskID={0} > '.format(jediTaskID)
+        tmp_log = logger_utils.make_logger(base_logger, method_name=method_name)
+        tmp_log.debug('start')
+        try:
+            important_attrs = [ 'PandaID', 'jediTaskID', 'jobStatus', 'actualCoreCount',
+                                'creationTime', 'startTime', 'computingSite']
+            job_columns = ','.join(important_attrs)
+            # get jobs
+            varMap = dict()
+            varMap[':jediTaskID'] = jediTaskID
+            varMap[':created_since'] = created_since
+            pandaidSet = set()
+            retList = []
+            for table_name in ('ATLAS_PANDA.JOBSDEFINED4', 'ATLAS_PANDA.JOBSWAITING4', 'ATLAS_PANDA.JOBSACTIVE4'):
+                sqlJ = (
+                        'SELECT {job_columns} '
+                        'FROM {table_name} '
+                        'WHERE jediTaskID=:jediTaskID AND creationTime>=:created_since '
+                    ).format(job_columns=job_columns, table_name=table_name)
+                self.cur.execute(sqlJ + comment, varMap)
+                for one_job in self.cur.fetchall():
+                    jobspec = JobSpec()
+                    for attr, value in zip(important_attrs, one_job):
+                        setattr(jobspec, attr, value)
+                    # prevent duplicate jobspec of jobs moved between tables
+                    if jobspec.PandaID not in pandaidSet:
+                        pandaidSet.add(jobspec.PandaID)
+                        retList.append(jobspec)
+            # return
+            tmp_log.debug('done, got {0} jobs'.format(len(retList)))
+            return retList
+        except Exception:
+            # roll back
+            self._rollback()
+            # error
+            self.dumpErrorMessage(tmp_log)
+            return None
+
 
 
 
 
 
+    @record_query_time
     def slowTaskFileAttempts_ATM(self, jediTaskID: int):
         """
         Attempts of file processing of a slow task
@@ -1,5 +1,9 @@
+import time
+
 from pandaserver.taskbuffer import DBProxyPool as panda_db_proxy_pool
 
+from pandaatm.atmcore.metrics import get_metrics_sender
+
 # use customized proxy
 from . import db_proxy
 panda_db_proxy_pool.DBProxy = db_proxy
@@ -10,6 +14,13 @@ class DBProxyPool(panda_db_proxy_pool.DBProxyPool):
     def __init__(self, dbhost, dbpasswd, nConnection, useTimeout=False):
         super().__init__(dbhost, dbpasswd, nConnection, useTimeout)
 
+    # get a proxy, recording the wait time
+    def getProxy(self):
+        t0 = time.monotonic()
+        proxy = super().getProxy()
+        get_metrics_sender().observe('atm_db_pool_wait_seconds', time.monotonic() - t0)
+        return proxy
+
     # get a DBProxyObj containing a proxy
     def get(self):
         proxy_obj = DBProxyObj(db_proxy_pool=self)
@@ -0,0 +1,129 @@
+import math
+import collections
+import concurrent.futures
+
+from pandaatm.atmcore.metrics import get_metrics_sender
+
+
+#=== Classes ===================================================
+
+# fetcher of jobs of task attempts split into windows of creationTime over connections of the DB proxy pool
+class ParallelJobFetcher(object):
+    """
+    The number of jobs of an attempt is estimated from the hint set before (e.g. the number of the last fetch, or
+    aggregates of the attempt), or else from a count query. Attempts of up to chunk_rows jobs are fetched at once;
+    bigger ones are split into equal windows of creationTime of about chunk_rows jobs, fetched in parallel by
+    up to n_workers proxies of the pool, and streamed in time order with at most n_workers windows in flight,
+    so the memory peak is of a few windows of rows rather than the whole attempt. Fetches with created_after
+    are incremental updates and always fetched at once.
+    It has slowTaskJobsInAttempt_ATM of DBProxy, so that it can be used in place of the DB proxy
+    """
+
+    def __init__(self, db_proxy_pool, chunk_rows=100000, n_workers=4, max_windows=1000):
+        self.db_proxy_pool = db_proxy_pool
+        self.chunk_rows = chunk_rows
+        self.n_workers = n_workers
+        self.max_windows = max_windows
+        # estimated numbers of jobs; (jediTaskID, attemptNr): n_jobs
+        self.n_jobs_hint_dict = {}
+
+    def set_n_jobs_hint(self, jediTaskID, attemptNr, n_jobs):
+        """
+        set the estimated number of jobs of a task attempt
+        """
+        self.n_jobs_hint_dict[(jediTaskID, attemptNr)] = n_jobs
+
+    def retain(self, key_set):
+        """
+        drop hints of attempts whose (jediTaskID, attemptNr) are not in key_set
+        """
+        for key in list(self.n_jobs_hint_dict):
+            if key not in key_set:
+                del self.n_jobs_hint_dict[key]
+
+    def _fetch(self, jediTaskID, attemptNr, attempt_start, attempt_end, concise, created_after=None):
+        with self.db_proxy_pool.get() as proxy:
+            return proxy.slowTaskJobsInAttempt_ATM(jediTaskID=jediTaskID, attemptNr=attemptNr,
+                                                    attempt_start=attempt_start, attempt_end=attempt_end,
+                                                    concise=concise, created_after=created_after)
+
+    def _get_windows(self, jediTaskID, attemptNr, attempt_start, attempt_end):
+        """
+        get list of (window_start, window_end) of creationTime to fetch, or None if failed to estimate
+        """
+        n_jobs = self.n_jobs_hint_dict.get((jediTaskID, attemptNr))
+        if n_jobs is None:
+            with self.db_proxy_pool.get() as proxy:
+                n_jobs = proxy.slowTaskJobsCountInAttempt_ATM(jediTaskID=jediTaskID, attempt_start=attempt_start,
+                                                                attempt_end=attempt_end)
+            if n_jobs is None:
+                return None
+        n_windows = min(max(1, math.ceil(n_jobs / self.chunk_rows)), self.max_windows)
+        if n_windows == 1:
+            return [(attempt_start, attempt_end)]
+        window_length = (attempt_end - attempt_start) / n_windows
+        boundary_list = [ attempt_start + window_length * i for i in range(n_windows) ] + [attempt_end]
+        return list(zip(boundary_list[:-1], boundary_list[1:]))
+
+    def iter_job_chunks(self, jediTaskID, attemptNr, attempt_start, attempt_end, concise=False, created_after=None):
+        """
+        iterate over lists of jobspecs of windows of the task attempt in time order; a job on a window boundary
+        comes only in the first window. Yield None and stop if failed
+        """
+        if created_after is not None:
+            yield self._fetch(jediTaskID, attemptNr, attempt_start, attempt_end, concise, created_after)
+            return
+        window_list = self._get_windows(jediTaskID, attemptNr, attempt_start, attempt_end)
+        if window_list is None:
+            yield None
+            return
+        get_metrics_sender().observe('atm_job_fetch_windows', len(window_list))
+        if len(window_list) == 1:
+            jobspec_list = self._fetch(jediTaskID, attemptNr, attempt_start, attempt_end, concise)
+            if jobspec_list is not None:
+                self.set_n_jobs_hint(jediTaskID, attemptNr, len(jobspec_list))
+            yield jobspec_list
+            return
+        n_jobs = 0
+        # jobs of window boundaries are fetched by both windows
+        pandaid_set = set()
+        window_iter = iter(window_list)
+        future_deque = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            try:
+                for window_start, window_end in window_iter:
+                    future_deque.append(executor.submit(self._fetch, jediTaskID, attemptNr, window_start, window_end, concise))
+                    if len(future_deque) >= self.n_workers:
+                        break
+                while future_deque:
+                    jobspec_list = future_deque.popleft().result()
+                    if jobspec_list is None:
+                        yield None
+                        return
+                    # keep the next window in flight
+                    for window_start, window_end in window_iter:
+                        future_deque.append(executor.submit(self._fetch, jediTaskID, attemptNr, window_start, window_end, concise))
+                        break
+                    chunk = []
+                    for jobspec in jobspec_list:
+                        if jobspec.PandaID not in pandaid_set:
+                            pandaid_set.add(jobspec.PandaID)
+                            chunk.append(jobspec)
+                    n_jobs += len(chunk)
+                    yield chunk
+            finally:
+                for future in future_deque:
+                    future.cancel()
+        self.set_n_jobs_hint(jediTaskID, attemptNr, n_jobs)
+
+    def slowTaskJobsInAttempt_ATM(self, jediTaskID, attemptNr, attempt_start, attempt_end, concise=False,
+                                    created_after=None):
+        """
+        get list of jobspecs of a task attempt as slowTaskJobsInAttempt_ATM of DBProxy, or None if failed
+        """
+        ret_list = []
+        for jobspec_list in self.iter_job_chunks(jediTaskID, attemptNr, attempt_start, attempt_end, concise, created_after):
+            if jobspec_list is None:
+                return None
+            ret_list.extend(jobspec_list)
+        return ret_list
@@ -0,0 +1,311 @@
+import os
+import math
+import time
+import queue
+import tempfile
+import threading
+import multiprocessing.connection
+
+
+#=== Constants =================================================
+
+# kinds of metrics
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# default buckets of histograms in seconds
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60., 120., 300., 600.)
+
+# help texts of metrics
+metric_help_map = {
+        'atm_cycle_duration_seconds': 'Duration of agent cycles',
+        'atm_cycle_items_total': 'Items processed in agent cycles',
+        'atm_stage_duration_seconds': 'Duration of stages of agent cycles',
+        'atm_process_rss_bytes': 'Resident set size of agent processes at end of cycle',
+        'atm_db_query_duration_seconds': 'Latency of ATM DB queries',
+        'atm_db_pool_wait_seconds': 'Wait time to get a proxy from the DB proxy pool',
+        'atm_sqlite_write_queue_depth': 'Number of batches queued to the SQLite writer thread',
+        'atm_checkpoint_cache_requests_total': 'Checkpoint cache lookups by result',
+        'atm_agent_restarts_total': 'Restarts of agent processes by the master',
+        'atm_msg_queue_depth': 'Number of messages queued in the micro-batcher',
+        'atm_msg_lag_seconds': 'Lag from queuing of the first message of a batch to its apply',
+        'atm_msg_batch_size': 'Number of messages per applied batch',
+        'atm_msg_batch_apply_seconds': 'Time to apply a batch of messages',
+        'atm_attempt_job_cache_requests_total': 'Lookups of jobs of task attempts in the attempt job cache by result',
+        'atm_attempt_job_cache_fetched_jobs_total': 'Jobs fetched from DB through the attempt job cache',
+        'atm_job_fetch_windows': 'Number of creationTime windows per fetch of jobs of a task attempt',
+        'atm_metrics_dropped_total': 'Metric updates dropped by agents as the queue to the master was full',
+    }
+
+
+#=== Functions =================================================
+
+def _format_labels(label_items):
+    if not label_items:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                            for k, v in label_items) + '}'
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+#=== Classes ===================================================
+
+# registry of metrics with prometheus text exposition
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name: {'kind', 'buckets', 'series': {label_items: value or histogram state}}
+        self.metric_dict = {}
+
+    def _get_series_dict(self, kind, name, buckets=None):
+        metric = self.metric_dict.get(name)
+        if metric is None:
+            metric = {
+                    'kind': kind,
+                    'buckets': tuple(buckets or default_buckets) if kind == HISTOGRAM else None,
+                    'series': {},
+                }
+            self.metric_dict[name] = metric
+        elif metric['kind'] != kind:
+            raise RuntimeError('MetricsRegistry: {0} is a {1}, not {2}'.format(name, metric['kind'], kind))
+        return metric
+
+    def apply(self, kind, name, labels, value):
+        """
+        apply an update; add value to a counter, set a gauge, or observe value with a histogram
+        """
+        label_items = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            metric = self._get_series_dict(kind, name)
+            series_dict = metric['series']
+            if kind == COUNTER:
+                series_dict[label_items] = series_dict.get(label_items, 0.) + value
+            elif kind == GAUGE:
+                series_dict[label_items] = value
+            elif kind == HISTOGRAM:
+                state = series_dict.get(label_items)
+                if state is None:
+                    state = {'counts': [0] * len(metric['buckets']), 'sum': 0., 'count': 0}
+                    series_dict[label_items] = state
+                for i, upper in enumerate(metric['buckets']):
+                    if value <= upper:
+                        state['counts'][i] += 1
+                state['sum'] += value
+                state['count'] += 1
+            else:
+                raise RuntimeError('MetricsRegistry: unknown kind {0}'.format(kind))
+
+    def render_text(self):
+        """
+        get metrics in prometheus text exposition format
+        """
+        line_list = []
+        with self.lock:
+            for name in sorted(self.metric_dict):
+                metric = self.metric_dict[name]
+                line_list.append('# HELP {0} {1}'.format(name, metric_help_map.get(name, name)))
+                line_list.append('# TYPE {0} {1}'.format(name, metric['kind']))
+                for label_items, value in sorted(metric['series'].items()):
+                    if metric['kind'] == HISTOGRAM:
+                        for upper, count in zip(metric['buckets'] + (math.inf,), value['counts'] + [value['count']]):
+                            line_list.append('{0}_bucket{1} {2}'.format(
+                                        name, _format_labels(label_items + (('le', _format_value(upper)),)), count))
+                        line_list.append('{0}_sum{1} {2}'.format(name, _format_labels(label_items), _format_value(value['sum'])))
+                        line_list.append('{0}_count{1} {2}'.format(name, _format_labels(label_items), value['count']))
+                    else:
+                        line_list.append('{0}{1} {2}'.format(name, _format_labels(label_items), _format_value(value)))
+        line_list.append('')
+        return '\n'.join(line_list)
+
+    def write_textfile(self, file_path):
+        """
+        write metrics atomically into a file, e.g. for the textfile collector of node exporter
+        """
+        dir_path = os.path.dirname(os.path.abspath(file_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=dir_path)
+        try:
+            with os.fdopen(fd, 'w') as _f:
+                _f.write(self.render_text())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, file_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
+# sender of metric updates from an agent process to the master through a pipe
+class MetricsSender(object):
+    """
+    All methods are no-op without connection (e.g. in scripts). Updates are put into a bounded queue without
+    blocking, and a sender thread sends them in batches to the master; updates are dropped (and counted) when
+    the queue is full, e.g. when the master is slow to collect, and sending stops silently once the pipe breaks
+    """
+
+    def __init__(self, conn=None, base_labels=None, max_queue_size=10000, max_batch_size=1000):
+        self.conn = conn
+        self.base_labels = dict(base_labels or {})
+        self.max_batch_size = max_batch_size
+        self.queue = queue.Queue(max_queue_size)
+        self.n_dropped = 0
+        self.drop_lock = threading.Lock()
+        self.thread = None
+        if self.conn is not None:
+            self.thread = threading.Thread(target=self._send_loop, name='MetricsSender', daemon=True)
+            self.thread.start()
+
+    def _send_loop(self):
+        n_dropped_sent = 0
+        while self.conn is not None:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            n_dropped = self.n_dropped
+            if n_dropped > n_dropped_sent:
+                batch.append((COUNTER, 'atm_metrics_dropped_total', dict(self.base_labels), n_dropped - n_dropped_sent))
+                n_dropped_sent = n_dropped
+            try:
+                self.conn.send(batch)
+            except (OSError, EOFError, ValueError):
+                self.conn = None
+
+    def _send(self, kind, name, value, labels):
+        if self.conn is None:
+            return
+        all_labels = dict(self.base_labels)
+        all_labels.update(labels)
+        try:
+            self.queue.put_nowait((kind, name, all_labels, value))
+        except queue.Full:
+            with self.drop_lock:
+                self.n_dropped += 1
+
+    def inc(self, name, value=1, **labels):
+        self._send(COUNTER, name, value, labels)
+
+    def set(self, name, value, **labels):
+        self._send(GAUGE, name, value, labels)
+
+    def observe(self, name, value, **labels):
+        self._send(HISTOGRAM, name, value, labels)
+
+
+# collector of metric updates from agents into a registry, in a thread of the master
+class MetricsCollector(object):
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.conn_list = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add_connection(self, conn):
+        with self.lock:
+            self.conn_list.append(conn)
+
+    def _loop(self):
+        while True:
+            with self.lock:
+                conn_list = list(self.conn_list)
+            if not conn_list:
+                time.sleep(1)
+                continue
+            for conn in multiprocessing.connection.wait(conn_list, timeout=1):
+                try:
+                    update_list = conn.recv()
+                except (EOFError, OSError):
+                    # agent process gone
+                    with self.lock:
+                        self.conn_list.remove(conn)
+                    continue
+                for kind, name, labels, value in update_list:
+                    try:
+                        self.registry.apply(kind, name, labels, value)
+                    except Exception:
+                        pass
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, name='MetricsCollector', daemon=True)
+        self.thread.start()
+
+
+# http endpoint serving /metrics of a registry
+class MetricsHTTPServer(object):
+
+    def __init__(self, registry, port, host='127.0.0.1'):
+        # import here as only the master serves metrics
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        self.registry = registry
+        registry_ = registry
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry_.render_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, format, *args):
+                pass
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='MetricsHTTPServer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# periodic writer of textfile of a registry
+class MetricsTextfileWriter(object):
+
+    def __init__(self, registry, file_path, interval=60):
+        self.registry = registry
+        self.file_path = file_path
+        self.interval = interval
+        self.thread = None
+
+    def _loop(self):
+        while True:
+            try:
+                self.registry.write_textfile(self.file_path)
+            except Exception:
+                pass
+            time.sleep(self.interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, name='MetricsTextfileWriter', daemon=True)
+        self.thread.start()
+
+
+#=== Global sender of the process ==============================
+
+_sender = MetricsSender()
+
+def set_metrics_connection(conn, **base_labels):
+    """
+    set pipe connection (to the master) of the global sender of this process
+    """
+    global _sender
+    _sender = MetricsSender(conn, base_labels)
+
+def get_metrics_sender():
+    """
+    get global sender of this process
+    """
+    return _sender
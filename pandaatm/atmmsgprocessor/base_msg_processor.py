@@ -1,8 +1,6 @@
 
 from pandacommon.pandamsgbkr.msg_processor import SimpleMsgProcPluginBase
 
-from pandajedi.jedicore.JediTaskBufferInterface import JediTaskBufferInterface
-
 # Base simple message processing plugin
 class BaseMsgProcPlugin(SimpleMsgProcPluginBase):
 
@@ -10,7 +8,8 @@ class BaseMsgProcPlugin(SimpleMsgProcPluginBase):
         """
         initialize plugin instance, run once before loop in thread
         """
-        # set up JEDI TaskBuffer interface
+        # set up JEDI TaskBuffer interface; import here as pandajedi is heavy
+        from pandajedi.jedicore.JediTaskBufferInterface import JediTaskBufferInterface
         self.tbIF = JediTaskBufferInterface()
         self.tbIF.setupInterface()
 
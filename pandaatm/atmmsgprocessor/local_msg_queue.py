@@ -0,0 +1,85 @@
+import json
+import queue
+import itertools
+
+
+#=== Classes ===================================================
+
+# message object as given to process() of message processor plugins
+class LocalMsgObj(object):
+
+    def __init__(self, data, msg_id=None, sub_id='local'):
+        self.sub_id = sub_id
+        self.msg_id = msg_id
+        self.data = data
+
+
+# in-process queue standing in for the message broker
+class LocalMsgQueue(object):
+
+    def __init__(self, maxsize=0):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._msg_id_iter = itertools.count()
+
+    def put(self, data, block=True, timeout=None):
+        """
+        put a message body; dict is dumped into JSON as messages from the broker
+        """
+        if isinstance(data, dict):
+            data = json.dumps(data)
+        self.queue.put(LocalMsgObj(data, msg_id=next(self._msg_id_iter)), block=block, timeout=timeout)
+
+    def get(self, timeout=None):
+        """
+        get a message object, or None if no message till timeout
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+#=== Functions =================================================
+
+def iter_msg_file(file_path):
+    """
+    iterate over message objects from a file of one JSON message body per line, e.g. recorded from the broker
+    """
+    with open(file_path) as _f:
+        for i, line in enumerate(_f):
+            line = line.strip()
+            if line:
+                yield LocalMsgObj(line, msg_id=i, sub_id=file_path)
+
+def record_msg(file_path, data):
+    """
+    append a message body to a file for replay
+    """
+    if isinstance(data, dict):
+        data = json.dumps(data)
+    with open(file_path, 'a') as _f:
+        _f.write(data + '\n')
+
+def run_plugin_locally(plugin, msg_obj_iter):
+    """
+    feed message objects to process() of a plugin as the message processor agent does; get list of returned values
+    """
+    ret_list = []
+    for msg_obj in msg_obj_iter:
+        ret = plugin.process(msg_obj)
+        if ret is not None:
+            ret_list.append(ret)
+    return ret_list
+
+def drain_queue(msg_queue, timeout=1):
+    """
+    iterate over message objects of a local queue until no message comes within timeout
+    """
+    while True:
+        msg_obj = msg_queue.get(timeout=timeout)
+        if msg_obj is None:
+            return
+        yield msg_obj
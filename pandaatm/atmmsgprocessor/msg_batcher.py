@@ -0,0 +1,138 @@
+import time
+import queue
+import threading
+
+from pandaatm.atmcore.metrics import get_metrics_sender
+
+
+#=== Classes ===================================================
+
+# micro-batcher of messages between the consumer of the broker and a bulk apply function
+class MicroBatcher(object):
+    """
+    Messages put are queued and applied in batches by a worker thread, calling apply_func(list of messages).
+    A batch is applied when it reaches max_batch_size or max_batch_seconds after its first message.
+    The queue is bounded by max_queue_size, so put() blocks when apply_func is slow; i.e. backpressure to the
+    consumer, which then stops taking messages from the broker.
+    Queue depth, lag from put to apply, batch size, and apply time are sent as metrics
+    """
+
+    def __init__(self, apply_func, max_batch_size=1000, max_batch_seconds=1.0, max_queue_size=10000, name='msg'):
+        self.apply_func = apply_func
+        self.max_batch_size = max_batch_size
+        self.max_batch_seconds = max_batch_seconds
+        self.name = name
+        # items are (put time, message); None to stop
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats_dict = {
+                'n_msgs': 0,
+                'n_batches': 0,
+                'n_errors': 0,
+                'n_blocked_puts': 0,
+                'blocked_seconds': 0.,
+                'apply_seconds': 0.,
+                'max_lag_seconds': 0.,
+                'last_error': None,
+            }
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, name='MicroBatcher-{0}'.format(self.name), daemon=True)
+        self.thread.start()
+
+    def put(self, msg, timeout=None):
+        """
+        put a message; block while the queue is full, up to timeout. Return False if timed out
+        """
+        item = (time.monotonic(), msg)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # backpressure
+            t0 = time.monotonic()
+            try:
+                self.queue.put(item, timeout=timeout)
+            except queue.Full:
+                return False
+            finally:
+                with self.lock:
+                    self.stats_dict['n_blocked_puts'] += 1
+                    self.stats_dict['blocked_seconds'] += time.monotonic() - t0
+        return True
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def _get_batch(self):
+        """
+        get a batch of items; None in the batch means to stop after it
+        """
+        batch = [self.queue.get()]
+        if batch[0] is None:
+            return batch
+        deadline = time.monotonic() + self.max_batch_seconds
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is None:
+                break
+        return batch
+
+    def _apply(self, batch):
+        metrics_sender = get_metrics_sender()
+        now = time.monotonic()
+        lag = now - batch[0][0]
+        t0 = time.monotonic()
+        try:
+            self.apply_func([ msg for put_time, msg in batch ])
+        except Exception as e:
+            # failure of a batch is counted; go on with next batches
+            with self.lock:
+                self.stats_dict['n_errors'] += 1
+                self.stats_dict['last_error'] = '{0}: {1}'.format(e.__class__.__name__, e)
+        finally:
+            apply_seconds = time.monotonic() - t0
+            with self.lock:
+                self.stats_dict['n_msgs'] += len(batch)
+                self.stats_dict['n_batches'] += 1
+                self.stats_dict['apply_seconds'] += apply_seconds
+                self.stats_dict['max_lag_seconds'] = max(self.stats_dict['max_lag_seconds'], lag)
+            metrics_sender.set('atm_msg_queue_depth', self.queue.qsize(), batcher=self.name)
+            metrics_sender.observe('atm_msg_lag_seconds', lag, batcher=self.name)
+            metrics_sender.observe('atm_msg_batch_size', len(batch), batcher=self.name)
+            metrics_sender.observe('atm_msg_batch_apply_seconds', apply_seconds, batcher=self.name)
+
+    def _loop(self):
+        while True:
+            batch = self._get_batch()
+            to_stop = (batch[-1] is None)
+            if to_stop:
+                batch.pop()
+            if batch:
+                self._apply(batch)
+            if to_stop:
+                return
+
+    def stop(self, timeout=None):
+        """
+        apply all queued messages and stop the worker thread
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def get_stats(self):
+        """
+        get dict of statistics so far
+        """
+        with self.lock:
+            stats_dict = dict(self.stats_dict)
+        stats_dict['queue_depth'] = self.queue.qsize()
+        return stats_dict
@@ -0,0 +1,122 @@
+import os
+import json
+import queue
+import datetime
+
+from pandacommon.pandalogger import logger_utils
+
+from pandaatm.atmmsgprocessor.base_msg_processor import BaseMsgProcPlugin
+from pandaatm.atmmsgprocessor.msg_batcher import MicroBatcher
+from pandaatm.atmutils.live_task_tracker import LiveTaskTracker
+
+
+base_logger = logger_utils.setup_logger('slow_task_msg_processor')
+
+
+# message processing plugin to flag slow task attempts from task status and job termination events
+class SlowTaskMsgProcPlugin(BaseMsgProcPlugin):
+
+    def initialize(self):
+        """
+        initialize plugin instance, run once before loop in thread
+        """
+        # no DB access per message, so skip JEDI TaskBuffer interface of the base
+        # parameters as of SlowTaskAnalyzer
+        self.taskDurationMaxHours = 168
+        self.taskSuccefulRunTimeMinPercent = 80
+        self.taskEachStatusMaxHours = 12
+        self.flagFile = '/tmp/slow_task_dumps/slow_task_flags.jsonl'
+        # micro-batching; 0 batch size to process message by message. In batches, flags are sent to the outgoing MQ
+        # with the return value of the process() call after their batch is applied
+        self.batchMaxSize = 1000
+        self.batchMaxSeconds = 1.0
+        self.batchMaxQueueSize = 10000
+        self.batchPutWarnSeconds = 60
+        # live state
+        self.tracker = LiveTaskTracker(task_duration_max=datetime.timedelta(hours=self.taskDurationMaxHours),
+                                        successful_run_time_min_percent=self.taskSuccefulRunTimeMinPercent,
+                                        each_status_max=datetime.timedelta(hours=self.taskEachStatusMaxHours))
+        # batcher, which alone touches the tracker once started
+        self.batcher = None
+        # flags of applied batches, sent to the outgoing MQ with the return value of the next process()
+        self.flag_queue = queue.Queue()
+        if self.batchMaxSize:
+            self.batcher = MicroBatcher(self._apply_batch, max_batch_size=self.batchMaxSize,
+                                        max_batch_seconds=self.batchMaxSeconds,
+                                        max_queue_size=self.batchMaxQueueSize, name='slow_task')
+            self.batcher.start()
+
+    def _record_flags(self, flag_list):
+        tmp_log = logger_utils.make_logger(base_logger, method_name='SlowTaskMsgProcPlugin.process')
+        flag_str_list = [ json.dumps(flag_dict, default=str) for flag_dict in flag_list ]
+        for flag_str in flag_str_list:
+            tmp_log.info(flag_str)
+        if self.flagFile is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.flagFile)), exist_ok=True)
+            with open(self.flagFile, 'a') as _f:
+                _f.write(''.join(flag_str + '\n' for flag_str in flag_str_list))
+        return flag_str_list
+
+    def _apply_batch(self, msg_data_list):
+        """
+        apply a batch of message bodies to the tracker, and record flags at once
+        """
+        flag_list = self.tracker.process_msg_batch(msg_data_list)
+        if flag_list:
+            for flag_str in self._record_flags(flag_list):
+                self.flag_queue.put(flag_str)
+
+    def _get_queued_flags(self):
+        """
+        get flags of applied batches not sent yet, as a string to send to the outgoing MQ; None if no flags
+        """
+        flag_str_list = []
+        while True:
+            try:
+                flag_str_list.append(self.flag_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not flag_str_list:
+            return None
+        return '\n'.join(flag_str_list)
+
+    def terminate(self):
+        """
+        terminate plugin instance, run before stopping the thread; apply all queued messages
+        """
+        if self.batcher is None:
+            return
+        tmp_log = logger_utils.make_logger(base_logger, method_name='SlowTaskMsgProcPlugin.terminate')
+        self.batcher.stop()
+        tmp_log.info('stopped batcher with {0}'.format(self.batcher.get_stats()))
+        # no more process() to send them; they are still in the log and the flag file
+        n_unsent_flags = self.flag_queue.qsize()
+        if n_unsent_flags:
+            tmp_log.warning('{0} flags not sent to the outgoing MQ'.format(n_unsent_flags))
+
+    def process(self, msg_obj):
+        """
+        process the message
+        Get msg_obj from the incoming MQ (if any; otherwise msg_obj is None)
+        Returned value will be sent to the outgoing MQ (if any)
+        """
+        if msg_obj is None:
+            return None
+        if self.batcher is not None:
+            # blocks while the batcher is behind, which holds off the consumer of the broker
+            while not self.batcher.put(msg_obj.data, timeout=self.batchPutWarnSeconds):
+                tmp_log = logger_utils.make_logger(base_logger, method_name='SlowTaskMsgProcPlugin.process')
+                tmp_log.warning('batcher is behind; blocked for {0} s with {1}'.format(self.batchPutWarnSeconds,
+                                                                                    self.batcher.get_stats()))
+            # send flags of batches applied so far to the outgoing MQ, as in the message by message mode
+            return self._get_queued_flags()
+        try:
+            flag_list = self.tracker.process_msg(msg_obj.data)
+        except Exception as e:
+            tmp_log = logger_utils.make_logger(base_logger, method_name='SlowTaskMsgProcPlugin.process')
+            tmp_log.error('failed to process msg_id={0} : {1}: {2}'.format(msg_obj.msg_id, e.__class__.__name__, e))
+            return None
+        if not flag_list:
+            return None
+        # send flags to the outgoing MQ
+        return '\n'.join(self._record_flags(flag_list))
@@ -0,0 +1,281 @@
+import os
+import sys
+import time
+import json
+import shutil
+import socket
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+from pandaatm import panda_pkg_info
+from pandaatm.atmutils.synthetic_workload import SyntheticWorkload
+
+
+# parameters
+default_scales = [1000, 10000, 100000, 1000000]
+default_repeat = 3
+
+
+# global variables
+global_dict = {
+        'tmp_dir': None,
+    }
+
+
+# benchmark functions; each takes (n_rows, seed) and returns a tuple (func, description);
+# func is the timed callable, and set up work is done before returning it
+
+def bench_jobs_time_consumption_statistics(n_rows, seed):
+    from pandaatm.atmutils.slow_task_analyzer_utils import get_jobs_time_consumption_statistics
+    jobspec_list = SyntheticWorkload(n_jobs=n_rows, seed=seed).get_jobspecs(slice(0, n_rows))
+    return (lambda: get_jobs_time_consumption_statistics(jobspec_list)), 'jobs'
+
+def bench_jobs_time_consumption_statistics_from_arrays(n_rows, seed):
+    from pandaatm.atmutils.slow_task_analyzer_utils import jobspecs_to_time_arrays, \
+                                                            get_jobs_time_consumption_statistics_from_arrays
+    arrays_dict = jobspecs_to_time_arrays(SyntheticWorkload(n_jobs=n_rows, seed=seed).get_jobspecs(slice(0, n_rows)))
+    return (lambda: get_jobs_time_consumption_statistics_from_arrays(arrays_dict)), 'jobs'
+
+def bench_jobs_time_consumption_aggregator(n_rows, seed):
+    from pandaatm.atmutils.slow_task_analyzer_utils import JobsTimeConsumptionAggregator
+    jobspec_list = SyntheticWorkload(n_jobs=n_rows, seed=seed).get_jobspecs(slice(0, n_rows))
+    jobspec_list.sort(key=(lambda x: x.endTime))
+    # new terminated jobs come in batches of 1% in order of endTime, with statistics evaluated after each
+    batch_size = max(1, n_rows // 100)
+    def func():
+        aggregator = JobsTimeConsumptionAggregator()
+        for head in range(0, n_rows, batch_size):
+            aggregator.add_jobspecs(jobspec_list[head:head+batch_size])
+            aggregator.get_statistics()
+    return func, 'jobs'
+
+def _get_task_attempts_dict(n_rows, seed):
+    # about n_rows task attempts
+    workload = SyntheticWorkload(n_jobs=n_rows, seed=seed, mean_task_size=1)
+    task_attempts_dict = workload.get_task_attempts_dict()
+    return dict(list(task_attempts_dict.items())[:n_rows])
+
+def bench_task_attempts_in_each_duration(n_rows, seed):
+    from pandaatm.atmutils.slow_task_analyzer_utils import get_task_attempts_in_each_duration
+    from pandaatm.atmutils.task_status_log_parser import task_attempt_to_dict
+    task_attempt_dict = { k: task_attempt_to_dict(v) for k, v in _get_task_attempts_dict(n_rows, seed).items() }
+    return (lambda: get_task_attempts_in_each_duration(task_attempt_dict)), 'task attempts'
+
+def bench_tasks_users_in_each_duration(n_rows, seed):
+    from pandaatm.atmutils.slow_task_analyzer_utils import get_tasks_users_in_each_duration
+    all_task_attempts_dict = _get_task_attempts_dict(n_rows, seed)
+    return (lambda: get_tasks_users_in_each_duration(all_task_attempts_dict)), 'task attempts'
+
+def bench_task_status_log_parser(n_rows, seed):
+    from pandaatm.atmutils.task_status_log_parser import parse_task_status_log
+    workload = SyntheticWorkload(n_jobs=n_rows, seed=seed, mean_task_size=1)
+    batch_list = list(workload.iter_status_log_batches())
+    return (lambda: parse_task_status_log(batch_list)), 'status log rows ~ {0}'.format(sum(map(len, batch_list)))
+
+def _get_analyzer():
+    from pandaatm.atmbody.slow_task_analyzer import SlowTaskAnalyzer
+    # parameters only; no DB connection
+    analyzer = SlowTaskAnalyzer.__new__(SlowTaskAnalyzer)
+    analyzer.joblessIntervalMaxHours = 16
+    analyzer.jobMaxHoursMap = {
+            'finished': {'wait': 16, 'run': 96},
+            'failed': {'wait': 16, 'run': 16},
+            'cancelled': {'wait': 16, 'run': 16},
+            'closed': {'wait': 12, 'run': 16},
+        }
+    return analyzer
+
+def bench_search_bad_intervals(n_rows, seed):
+    from pandaatm.atmutils.slow_task_analyzer_utils import jobspecs_to_time_arrays
+    analyzer = _get_analyzer()
+    jobspec_list = SyntheticWorkload(n_jobs=n_rows, seed=seed).get_jobspecs(slice(0, n_rows))
+    job_arrays_dict = jobspecs_to_time_arrays(jobspec_list)
+    attempt_start = min(jobspec.creationTime for jobspec in jobspec_list)
+    return (lambda: analyzer._search_bad_intervals(jobspec_list, job_arrays_dict, attempt_start)), 'jobs'
+
+def bench_group_bad_jobs(n_rows, seed):
+    analyzer = _get_analyzer()
+    jobspec_list = SyntheticWorkload(n_jobs=n_rows, seed=seed).get_jobspecs(slice(0, n_rows))
+    return (lambda: analyzer._group_bad_jobs(jobspec_list)), 'jobs'
+
+def _get_jobspecs_db_inputs(n_rows, seed):
+    workload = SyntheticWorkload(n_jobs=n_rows, seed=seed)
+    input_list = []
+    for index in range(workload.n_attempts):
+        head, tail = workload.job_offset_array[index], workload.job_offset_array[index+1]
+        if head >= n_rows:
+            break
+        jobspec_list = workload.get_jobspecs(slice(head, min(tail, n_rows)))
+        user_name = workload.user_vocab[workload.task_user_array[workload.attempt_task_index[index]]]
+        input_list.append((jobspec_list, user_name, int(workload.attempt_nr_array[index])))
+    return input_list
+
+def bench_jobspecs_db_insert(n_rows, seed):
+    from pandaatm.atmscripts import users_run_wait_analysis_adv as rwa
+    input_list = _get_jobspecs_db_inputs(n_rows, seed)
+    def func():
+        db_file = os.path.join(global_dict['tmp_dir'], 'jobspecs-{0}.db'.format(time.monotonic_ns()))
+        rwa.global_dict['jobspecs_db'] = db_file
+        jdb = rwa.JobspecsDB()
+        for jobspec_list, user_name, attempt_nr in input_list:
+            jdb.insert(jobspec_list, user_name, attempt_nr)
+        jdb.close()
+        os.remove(db_file)
+    return func, 'jobs'
+
+def bench_jobspecs_db_read(n_rows, seed):
+    from pandaatm.atmscripts import users_run_wait_analysis_adv as rwa
+    input_list = _get_jobspecs_db_inputs(n_rows, seed)
+    rwa.global_dict['jobspecs_db'] = os.path.join(global_dict['tmp_dir'], 'jobspecs-read-{0}.db'.format(n_rows))
+    jdb = rwa.JobspecsDB()
+    for jobspec_list, user_name, attempt_nr in input_list:
+        jdb.insert(jobspec_list, user_name, attempt_nr)
+    jdb.close()
+    def func():
+        jdb = rwa.JobspecsDB(readonly=True)
+        n_read = sum(len(columns_dict['PandaID']) for _, columns_dict in jdb.read_jobspecs_by_user())
+        jdb.close()
+        return n_read
+    return func, 'jobs'
+
+def bench_run_wait_weighting(n_rows, seed):
+    from pandaatm.atmscripts import users_run_wait_analysis_adv as rwa
+    from pandaatm.atmcore.columnar_job_store import ColumnarJobStore, make_job_store_arrays
+    from pandaatm.atmcore.core_utils import epoch_us_to_datetime
+    workload = SyntheticWorkload(n_jobs=n_rows, seed=seed)
+    job_store = ColumnarJobStore(*make_job_store_arrays(rwa.JobspecsDB.column_names,
+                                                        workload.iter_job_rows(rwa.JobspecsDB.column_names)))
+    rwa.global_dict['job_store'] = job_store
+    # one day in the middle of the workload
+    period_start = epoch_us_to_datetime(int(np.median(workload.job_creation_array)))
+    period_end = period_start + datetime.timedelta(days=1)
+    n_seconds = int((period_end - period_start).total_seconds())
+    cum_multipler_array = np.concatenate(([0.], np.cumsum(np.ones(n_seconds))))
+    user_name_list = job_store.user_names()
+    return (lambda: rwa._get_users_weighted_run_time_in_period(user_name_list, period_start, period_end,
+                                                                cum_multipler_array)), 'jobs'
+
+
+# map of benchmarks
+benchmark_map = {
+        'jobs_time_consumption_statistics': bench_jobs_time_consumption_statistics,
+        'jobs_time_consumption_statistics_from_arrays': bench_jobs_time_consumption_statistics_from_arrays,
+        'jobs_time_consumption_aggregator': bench_jobs_time_consumption_aggregator,
+        'task_attempts_in_each_duration': bench_task_attempts_in_each_duration,
+        'tasks_users_in_each_duration': bench_tasks_users_in_each_duration,
+        'task_status_log_parser': bench_task_status_log_parser,
+        'search_bad_intervals': bench_search_bad_intervals,
+        'group_bad_jobs': bench_group_bad_jobs,
+        'jobspecs_db_insert': bench_jobspecs_db_insert,
+        'jobspecs_db_read': bench_jobspecs_db_read,
+        'run_wait_weighting': bench_run_wait_weighting,
+    }
+
+
+# get git commit of the working tree if available
+def get_git_commit():
+    try:
+        ret = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return ret.stdout.strip() or None
+    except Exception:
+        return None
+
+# run one benchmark at one scale
+def run_one(name, n_rows, seed, repeat):
+    result = {
+            'benchmark': name,
+            'n_rows': n_rows,
+        }
+    try:
+        func, unit = benchmark_map[name](n_rows, seed)
+        result['unit'] = unit
+        # timing; best of repeats
+        time_list = []
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            func()
+            time_list.append(time.perf_counter() - t0)
+        result['seconds'] = min(time_list)
+        result['seconds_list'] = time_list
+        result['rows_per_second'] = n_rows / result['seconds'] if result['seconds'] > 0 else None
+        # memory; peak of traced allocations within one more run
+        tracemalloc.start()
+        func()
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    except Exception as e:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        result['error'] = '{0}: {1}'.format(e.__class__.__name__, e)
+    return result
+
+# print comparison against results of another run
+def print_comparison(result_list, baseline_file):
+    with open(baseline_file, 'r') as _f:
+        baseline = json.load(_f)
+    baseline_map = { (r['benchmark'], r['n_rows']): r for r in baseline['results'] if 'seconds' in r }
+    print('comparison with {0} (commit {1}):'.format(baseline_file, baseline['meta'].get('git_commit')))
+    for result in result_list:
+        old = baseline_map.get((result['benchmark'], result['n_rows']))
+        if old is None or 'seconds' not in result:
+            continue
+        print('  {0:<48} {1:>9}  {2:>10.4f}s -> {3:>10.4f}s  x{4:.2f}'.format(
+                result['benchmark'], result['n_rows'], old['seconds'], result['seconds'], old['seconds'] / result['seconds']))
+
+
+# main
+def main():
+    parser = argparse.ArgumentParser(description='benchmark ATM hot paths on synthetic workloads')
+    parser.add_argument('output', help='json file to write results into')
+    parser.add_argument('--scales', type=int, nargs='+', default=default_scales, help='numbers of rows')
+    parser.add_argument('--benchmarks', nargs='+', choices=sorted(benchmark_map), default=list(benchmark_map))
+    parser.add_argument('--repeat', type=int, default=default_repeat)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', metavar='BASELINE_JSON', help='json file of a previous run to compare with')
+    args = parser.parse_args()
+    # meta data of the run
+    meta = {
+            'git_commit': get_git_commit(),
+            'release_version': panda_pkg_info.release_version,
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'host': socket.gethostname(),
+            'cpu_count': os.cpu_count(),
+            'time': datetime.datetime.utcnow().isoformat(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+        }
+    # run
+    result_list = []
+    global_dict['tmp_dir'] = tempfile.mkdtemp(prefix='atm_bench_')
+    try:
+        for name in args.benchmarks:
+            for n_rows in args.scales:
+                result = run_one(name, n_rows, args.seed, args.repeat)
+                result_list.append(result)
+                if 'error' in result:
+                    print('{0:<48} {1:>9}  error: {2}'.format(name, n_rows, result['error']))
+                else:
+                    print('{0:<48} {1:>9}  {2:>10.4f}s  {3:>12.0f} rows/s  peak {4:>8.1f} MiB'.format(
+                            name, n_rows, result['seconds'], result['rows_per_second'] or 0,
+                            result['peak_memory_bytes']/1024**2))
+    finally:
+        shutil.rmtree(global_dict['tmp_dir'], ignore_errors=True)
+    # write
+    with open(args.output, 'w') as _f:
+        json.dump({'meta': meta, 'results': result_list}, _f, indent=2)
+    if args.compare:
+        print_comparison(result_list, args.compare)
+    print('done')
+
+
+if __name__ == '__main__':
+    main()
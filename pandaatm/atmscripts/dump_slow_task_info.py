@@ -5,14 +5,17 @@ import datetime
 import copy
 import json
 import pickle
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from pandacommon.pandalogger import logger_utils
 
 from pandaatm.atmconfig import atm_config
 from pandaatm.atmcore import core_utils
+from pandaatm.atmcore.checkpoint_cache import CheckpointCache, make_cache_key
 from pandaatm.atmbody.agent_base import AgentBase
-from pandaatm.atmutils.slow_task_analyzer_utils import get_job_durations, get_jobs_time_consumption_statistics, bad_job_test_main
+from pandaatm.atmutils.slow_task_analyzer_utils import get_job_durations, get_jobs_time_consumption_statistics, bad_job_test_main, \
+                                                        jobspecs_to_time_arrays, get_jobs_time_consumption_statistics_from_arrays
 
 
 # parameters
@@ -23,6 +26,23 @@ created_before = ts_now
 # created_before = datetime.datetime(2020, 9, 15)
 task_duration = datetime.timedelta(hours=120)
 prod_source_label = 'user'
+# compute statistics in a process pool, passing jobs through memory-mapped arrays of checkpoint cache
+use_process_pool = True
+n_threads = 8
+n_processes = 8
+checkpoint_cache_dir = os.path.join('/tmp', 'atm_checkpoint_cache')
+checkpoint_cache_max_size = 50*1024**3
+# seconds between progress reports
+progress_interval = 60
+
+
+# compute time consumption statistics of jobs from arrays in checkpoint cache, in a worker process
+def _get_stats_from_cached_arrays(cache_dir, key):
+    cached_arrays = CheckpointCache(cache_dir).load_arrays(key)
+    if cached_arrays is None:
+        raise RuntimeError('job arrays not in checkpoint cache: {0}'.format(key))
+    arrays_dict, _ = cached_arrays
+    return get_jobs_time_consumption_statistics_from_arrays(arrays_dict)
 
 
 # main
@@ -36,7 +56,17 @@ def main():
                                                                 created_before=created_before,
                                                                 prod_source_label=prod_source_label,
                                                                 task_duration=task_duration)
-    ret_dict = {}
+    # append-only record file of done task attempts; skip those done in previous runs
+    record_file = core_utils.AppendOnlyRecordFile('{0}.records'.format(dump_file))
+    done_key_set = record_file.read_keys()
+    todo_items = [ item for item in cand_ret_dict.items() if item[0] not in done_key_set ]
+    print('{0} task attempts done in previous runs, {1} to do'.format(len(cand_ret_dict) - len(todo_items), len(todo_items)))
+    progress = core_utils.ProgressReporter(len(todo_items), unit='attempts', interval=progress_interval)
+    # checkpoint cache and process pool
+    checkpoint_cache = CheckpointCache(checkpoint_cache_dir, max_size=checkpoint_cache_max_size)
+    process_pool = None
+    if use_process_pool:
+        process_pool = ProcessPoolExecutor(n_processes, mp_context=multiprocessing.get_context('spawn'))
     # function to handle one task
     def _handle_one_task(item):
         # start
@@ -44,31 +74,64 @@ def main():
         jediTaskID, attemptNr = k
         key_name = '{0}_{1:02}'.format(*k)
         new_v = copy.deepcopy(v)
-        # get a dbProxy
-        tmp_dbProxy = agent.dbProxyPool.getProxy()
-        # call dbProxy
-        jobspec_list = tmp_dbProxy.slowTaskJobsInAttempt_ATM(jediTaskID=jediTaskID, attemptNr=attemptNr,
-                                                            attempt_start=v['startTime'], attempt_end=v['endTime'])
-        # put back dbProxy
-        agent.dbProxyPool.putProxy(tmp_dbProxy)
-        # time consumption statistics of jobs
         task_attempt_duration = v['attemptDuration']
-        jobs_time_consumption_stats_dict = get_jobs_time_consumption_statistics(jobspec_list)
+        if process_pool is not None:
+            # jobs of a complete attempt do not change, so keep their arrays in checkpoint cache
+            job_arrays_key = make_cache_key('attempt_job_time_arrays', {'jediTaskID': jediTaskID, 'attemptNr': attemptNr,
+                                                                        'startTime': v['startTime'], 'endTime': v['endTime']})
+            if not checkpoint_cache.has(job_arrays_key):
+                with agent.dbProxyPool.get() as proxy:
+                    jobspec_list = proxy.slowTaskJobsInAttempt_ATM(jediTaskID=jediTaskID, attemptNr=attemptNr,
+                                                                    attempt_start=v['startTime'], attempt_end=v['endTime'],
+                                                                    concise=True)
+                checkpoint_cache.dump_arrays(job_arrays_key, jobspecs_to_time_arrays(jobspec_list))
+                del jobspec_list
+            # time consumption statistics of jobs in a worker process
+            jobs_time_consumption_stats_dict = process_pool.submit(_get_stats_from_cached_arrays,
+                                                                   checkpoint_cache_dir, job_arrays_key).result()
+        else:
+            # get a dbProxy
+            tmp_dbProxy = agent.dbProxyPool.getProxy()
+            # call dbProxy
+            jobspec_list = tmp_dbProxy.slowTaskJobsInAttempt_ATM(jediTaskID=jediTaskID, attemptNr=attemptNr,
+                                                                attempt_start=v['startTime'], attempt_end=v['endTime'])
+            # put back dbProxy
+            agent.dbProxyPool.putProxy(tmp_dbProxy)
+            # time consumption statistics of jobs
+            jobs_time_consumption_stats_dict = get_jobs_time_consumption_statistics(jobspec_list)
+            # help to release memory
+            del jobspec_list
         jobful_time_ratio = jobs_time_consumption_stats_dict['total']['total'] / task_attempt_duration
         successful_run_time_ratio = jobs_time_consumption_stats_dict['finished']['run'] / task_attempt_duration
         jobs_time_consumption_stats_dict['_jobful_time_ratio'] = jobful_time_ratio
         jobs_time_consumption_stats_dict['_successful_run_time_ratio'] = successful_run_time_ratio
         # fill new value dictionary
         new_v['jobs_time_consumption_stats_dict'] = jobs_time_consumption_stats_dict
-        # help to release memory
-        del jobspec_list
         # return
         return k, new_v
+    # function to handle one task and record the result; failed ones are left for the next run
+    def _handle_and_record_one_task(item):
+        try:
+            k, new_v = _handle_one_task(item)
+        except Exception as e:
+            sys.stderr.write('_handle_one_task {0} , {1}: {2}\n'.format(item[0], e.__class__.__name__, e))
+            sys.stderr.flush()
+            n_failed = 1
+        else:
+            record_file.append(k, new_v)
+            n_failed = 0
+        progress.add()
+        return n_failed
     # parallel run with multithreading
-    with ThreadPoolExecutor(4) as thread_pool:
-        result_iter = thread_pool.map(_handle_one_task, cand_ret_dict.items())
-    # fill ret_dict
-    ret_dict.update(result_iter)
+    with ThreadPoolExecutor(n_threads) as thread_pool:
+        n_failed = sum(thread_pool.map(_handle_and_record_one_task, todo_items))
+    record_file.close()
+    if process_pool is not None:
+        process_pool.shutdown()
+    if n_failed > 0:
+        print('{0} task attempts failed; run again to retry them'.format(n_failed))
+    # consolidate records into ret_dict
+    ret_dict = dict(record_file.read_records())
     # pickle
     with open(dump_file, 'wb') as _f:
         pickle.dump(ret_dict, _f)
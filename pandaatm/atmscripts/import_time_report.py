@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import platform
+import datetime
+import subprocess
+
+import pandaatm
+from pandaatm import panda_pkg_info
+
+
+# parameters
+default_modules = [
+        'pandaatm.atmconfig.atm_config',
+        'pandaatm.atmcore.core_utils',
+        'pandaatm.atmcore.checkpoint_cache',
+        'pandaatm.atmcore.db_proxy',
+        'pandaatm.atmutils.slow_task_analyzer_utils',
+        'pandaatm.atmbody.slow_task_analyzer',
+        'pandaatm.atmmsgprocessor.base_msg_processor',
+        'pandaatm.atmscripts.dump_slow_task_info',
+        'pandaatm.atmscripts.users_run_wait_analysis_adv',
+        'pandaatm.atmscripts.users_run_wait_analysis_in_range',
+    ]
+default_repeat = 3
+default_top = 10
+default_threshold_percent = 20
+
+
+#=== Functions =================================================
+
+def measure_import(module_name):
+    """
+    import a module in a fresh interpreter with -X importtime, and get dict of result
+    """
+    env = dict(os.environ)
+    pkg_parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(pandaatm.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([pkg_parent_dir] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {0}'.format(module_name)],
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    # lines like "import time:       self [us] |  cumulative | imported package"
+    import_list = []
+    other_line_list = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            other_line_list.append(line)
+            continue
+        items = line[len('import time:'):].split('|')
+        try:
+            self_us, cumulative_us = int(items[0]), int(items[1])
+        except ValueError:
+            # header
+            continue
+        name = items[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        import_list.append((name.strip(), depth, self_us, cumulative_us))
+    result = {
+            'module': module_name,
+            'n_imports': len(import_list),
+        }
+    if proc.returncode != 0:
+        result['error'] = other_line_list[-1] if other_line_list else 'exit code {0}'.format(proc.returncode)
+    # the module itself is the last line at depth 0 on success
+    result['seconds'] = sum(x[3] for x in import_list if x[1] == 0) / 1e6
+    result['imports'] = import_list
+    return result
+
+def run_one(module_name, repeat, top):
+    """
+    measure import of a module repeat times, and get result of the fastest run with the heaviest imports
+    """
+    best = None
+    for i in range(repeat):
+        result = measure_import(module_name)
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    import_list = best.pop('imports')
+    best['top_cumulative'] = [ {'module': x[0], 'seconds': x[3]/1e6}
+                                for x in sorted(import_list, key=(lambda x: x[3]), reverse=True)[:top] ]
+    best['top_self'] = [ {'module': x[0], 'seconds': x[2]/1e6}
+                            for x in sorted(import_list, key=(lambda x: x[2]), reverse=True)[:top] ]
+    return best
+
+def print_comparison(result_list, baseline_file, threshold_percent):
+    """
+    print comparison with a baseline and get list of modules whose import got slower than threshold
+    """
+    with open(baseline_file) as _f:
+        baseline_dict = { x['module']: x for x in json.load(_f)['results'] }
+    regression_list = []
+    print('\ncomparison with {0}:'.format(baseline_file))
+    for result in result_list:
+        base = baseline_dict.get(result['module'])
+        if base is None or 'error' in result or 'error' in base or not base['seconds']:
+            continue
+        change_percent = (result['seconds'] / base['seconds'] - 1) * 100
+        is_regression = (change_percent > threshold_percent)
+        if is_regression:
+            regression_list.append(result['module'])
+        print('{0:<56} {1:>8.3f}s -> {2:>8.3f}s  {3:+7.1f}%{4}'.format(
+                result['module'], base['seconds'], result['seconds'], change_percent, '  REGRESSION' if is_regression else ''))
+    return regression_list
+
+
+#=== Main ======================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='report import time of ATM modules, measured by python -X importtime')
+    parser.add_argument('--output', help='json file to write results into')
+    parser.add_argument('--modules', nargs='+', default=default_modules)
+    parser.add_argument('--repeat', type=int, default=default_repeat)
+    parser.add_argument('--top', type=int, default=default_top, help='number of heaviest imports to show')
+    parser.add_argument('--compare', metavar='BASELINE_JSON', help='json file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=default_threshold_percent,
+                        help='percent of slowdown against baseline regarded as regression, making exit code 1')
+    args = parser.parse_args()
+    # meta data of the run
+    meta = {
+            'release_version': panda_pkg_info.release_version,
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'host': socket.gethostname(),
+            'time': datetime.datetime.utcnow().isoformat(),
+            'repeat': args.repeat,
+        }
+    # run
+    result_list = []
+    for module_name in args.modules:
+        result = run_one(module_name, args.repeat, args.top)
+        result_list.append(result)
+        if 'error' in result:
+            print('{0:<56} {1:>8.3f}s  error: {2}'.format(module_name, result['seconds'], result['error']))
+        else:
+            print('{0:<56} {1:>8.3f}s  {2:>4} imports'.format(module_name, result['seconds'], result['n_imports']))
+        for x in result['top_cumulative']:
+            print('    {0:<52} {1:>8.3f}s'.format(x['module'], x['seconds']))
+    # write
+    if args.output:
+        with open(args.output, 'w') as _f:
+            json.dump({'meta': meta, 'results': result_list}, _f, indent=2)
+    if args.compare:
+        regression_list = print_comparison(result_list, args.compare, args.threshold)
+        if regression_list:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
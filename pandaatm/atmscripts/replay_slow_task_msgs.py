@@ -0,0 +1,91 @@
+import sys
+import json
+import time
+import argparse
+import datetime
+
+from pandaatm.atmmsgprocessor.local_msg_queue import iter_msg_file, record_msg
+from pandaatm.atmmsgprocessor.msg_batcher import MicroBatcher
+from pandaatm.atmutils.live_task_tracker import LiveTaskTracker
+
+
+# parameters
+default_batch_size = 1000
+default_batch_seconds = 1.0
+default_queue_size = 10000
+
+
+#=== Functions =================================================
+
+def iter_synthetic_msg_data(n_jobs, seed):
+    """
+    iterate over message bodies of a synthetic workload
+    """
+    from pandaatm.atmutils.synthetic_workload import SyntheticWorkload
+    workload = SyntheticWorkload(n_jobs=n_jobs, seed=seed)
+    for msg_dict in workload.iter_messages():
+        yield json.dumps(msg_dict)
+
+
+#=== Main ======================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='replay task status and job termination messages through '
+                                                    'the micro-batcher and live slow task tracker')
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('--file', help='replay file of one JSON message body per line')
+    source_group.add_argument('--synthetic', type=int, metavar='N_JOBS', help='messages of a synthetic workload')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--record', help='file to record replayed messages into')
+    parser.add_argument('--flags', help='file to write flags into')
+    parser.add_argument('--batch-size', type=int, default=default_batch_size)
+    parser.add_argument('--batch-seconds', type=float, default=default_batch_seconds)
+    parser.add_argument('--queue-size', type=int, default=default_queue_size)
+    parser.add_argument('--apply-delay', type=float, default=0., help='extra seconds per batch to emulate slow downstream')
+    parser.add_argument('--task-duration-max-hours', type=float, default=168)
+    args = parser.parse_args()
+    # source
+    if args.file:
+        msg_data_iter = ( msg_obj.data for msg_obj in iter_msg_file(args.file) )
+    else:
+        msg_data_iter = iter_synthetic_msg_data(args.synthetic, args.seed)
+    # tracker and batcher
+    tracker = LiveTaskTracker(task_duration_max=datetime.timedelta(hours=args.task_duration_max_hours))
+    flag_list = []
+    def apply_batch(msg_data_list):
+        flag_list.extend(tracker.process_msg_batch(msg_data_list))
+        if args.apply_delay:
+            time.sleep(args.apply_delay)
+    batcher = MicroBatcher(apply_batch, max_batch_size=args.batch_size, max_batch_seconds=args.batch_seconds,
+                            max_queue_size=args.queue_size, name='replay')
+    batcher.start()
+    # replay
+    t0 = time.monotonic()
+    n_msgs = 0
+    for msg_data in msg_data_iter:
+        if args.record:
+            record_msg(args.record, msg_data)
+        batcher.put(msg_data)
+        n_msgs += 1
+    batcher.stop()
+    elapsed = time.monotonic() - t0
+    # report
+    stats_dict = batcher.get_stats()
+    print('replayed {0} messages in {1:.2f} s ; {2:.0f} msgs/s'.format(n_msgs, elapsed, n_msgs/elapsed if elapsed else 0))
+    print('batcher: {0}'.format(json.dumps(stats_dict)))
+    print('tracker: {0} ; open attempts {1}'.format(json.dumps(tracker.n_events_dict), len(tracker.open_attempt_dict)))
+    n_flags_dict = {}
+    for flag_dict in flag_list:
+        n_flags_dict[flag_dict['flag']] = n_flags_dict.get(flag_dict['flag'], 0) + 1
+    print('flags: {0}'.format(json.dumps(n_flags_dict)))
+    if args.flags:
+        with open(args.flags, 'w') as _f:
+            for flag_dict in flag_list:
+                _f.write(json.dumps(flag_dict, default=str) + '\n')
+    if stats_dict['n_errors']:
+        print('errors in batches: {0} ; last: {1}'.format(stats_dict['n_errors'], stats_dict['last_error']))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,12 +6,14 @@ import copy
 import json
 import pickle
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from pandacommon.pandalogger import logger_utils
 
 from pandaatm.atmconfig import atm_config
 from pandaatm.atmcore import core_utils
+from pandaatm.atmcore.checkpoint_cache import CheckpointCache, make_cache_key
 from pandaatm.atmbody.agent_base import AgentBase
 from pandaatm.atmutils.slow_task_analyzer_utils import get_total_jobs_run_core_time, get_task_attempts_in_each_duration
 
@@ -23,6 +25,62 @@ prod_source_label = 'user'
 gshare = 'User Analysis'
 task_duration = datetime.timedelta(hours=1)
 cores_per_user = 100
+checkpoint_cache_dir = os.path.join('/tmp', 'atm_checkpoint_cache')
+checkpoint_cache_max_size = 50*1024**3
+# compute run-wait of users in worker processes instead of threads
+use_process_pool = True
+n_workers = 8
+
+
+# function to handle task attempts for one user (handle overlap); module level to run in worker processes
+def _handle_one_user(item):
+    user_name, task_attempt_dict = item
+    (   duration_list,
+        n_tasks_in_duration_list,
+        task_attempts_in_duration_list) = get_task_attempts_in_each_duration(task_attempt_dict)
+    # durations and cputimes of task attempts in microseconds
+    attempt_us_dict = { key: (core_utils.timedelta_to_us(v['attemptDuration']),
+                                core_utils.timedelta_to_us(v['user_run_cputime']),
+                                core_utils.timedelta_to_us(v['user_successful_run_cputime']))
+                        for key, v in task_attempt_dict.items() }
+    # make equivalent task attempts, in microseconds
+    total_taskful_time = 0
+    total_run_time = 0.
+    total_successful_run_time = 0.
+    for duration, key_set in zip(duration_list, task_attempts_in_duration_list):
+        n_task_atttempts = len(key_set)
+        if n_task_atttempts > 0:
+            duration = core_utils.timedelta_to_us(duration)
+            total_taskful_time += duration
+            for key in key_set:
+                attempt_duration, run_cputime, successful_run_cputime = attempt_us_dict[key]
+                if attempt_duration:
+                    duration_ratio = duration/attempt_duration
+                    total_run_time += run_cputime*duration_ratio/cores_per_user
+                    total_successful_run_time += successful_run_cputime*duration_ratio/cores_per_user
+    # back to timedelta
+    total_taskful_time = core_utils.us_to_timedelta(total_taskful_time)
+    total_run_time = core_utils.us_to_timedelta(total_run_time)
+    total_successful_run_time = core_utils.us_to_timedelta(total_successful_run_time)
+    total_wait_time = total_taskful_time - total_run_time
+    total_run_proportion = total_run_time/total_taskful_time
+    total_successful_run_proportion = total_successful_run_time/total_taskful_time
+    total_wait_proportion = total_wait_time/total_taskful_time
+    total_jobs = sum(( x['user_jobs'] for x in task_attempt_dict.values() ))
+    total_task_attempts = len(task_attempt_dict)
+    total_dict = {
+            'total_jobs': total_jobs,
+            'total_task_attempts': total_task_attempts,
+            'total_taskful_time': total_taskful_time,
+            'total_run_time': total_run_time,
+            'total_successful_run_time': total_successful_run_time,
+            'total_wait_time': total_wait_time,
+            'total_run_proportion': total_run_proportion,
+            'total_successful_run_proportion': total_successful_run_proportion,
+            'total_wait_proportion': total_wait_proportion,
+        }
+    # return
+    return (user_name, total_dict)
 
 
 # main
@@ -32,21 +90,26 @@ def main():
     agent = AgentBase()
     # start
     print('start')
-    # checkpoint file
-    cand_ret_dict_file = '/tmp/user_run_wait-cand_ret_dict.pickle'
-    try:
-        with open(cand_ret_dict_file, 'rb') as _f:
-            cand_ret_dict = pickle.load(_f)
-    except FileNotFoundError:
+    # checkpoint cache keyed by query parameters
+    checkpoint_cache = CheckpointCache(checkpoint_cache_dir, max_size=checkpoint_cache_max_size)
+    query_params = {
+            'created_since': created_since,
+            'created_before': created_before,
+            'prod_source_label': prod_source_label,
+            'gshare': gshare,
+            'task_duration': task_duration,
+        }
+    cand_ret_dict_key = make_cache_key('user_run_wait-cand_ret_dict', query_params)
+    cand_ret_dict = checkpoint_cache.load_object(cand_ret_dict_key)
+    if cand_ret_dict is None:
         cand_ret_dict = agent.dbProxy.slowTaskAttemptsFilter01_ATM(
                                             created_since=created_since,
                                             created_before=created_before,
                                             prod_source_label=prod_source_label,
                                             gshare=gshare,
                                             task_duration=task_duration)
-        # pickle for checkpoint
-        with open(cand_ret_dict_file, 'wb') as _f:
-            pickle.dump(cand_ret_dict, _f)
+        # checkpoint
+        checkpoint_cache.dump_object(cand_ret_dict_key, cand_ret_dict)
     # global lock
     global_lock = threading.Lock()
     # task attempts by user
@@ -82,64 +145,29 @@ def main():
                 user_task_attempts_map[user_name].update({k: new_v})
             else:
                 user_task_attempts_map[user_name] = {k: new_v}
-    # checkpoint file
-    user_task_attempts_map_file = '/tmp/user_run_wait-user_task_attempts_map.pickle'
-    try:
-        with open(user_task_attempts_map_file, 'rb') as _f:
-            user_task_attempts_map = pickle.load(_f)
-    except FileNotFoundError:
+    # checkpoint of task attempts by user
+    user_task_attempts_map_key = make_cache_key('user_run_wait-user_task_attempts_map', query_params)
+    cached_user_task_attempts_map = checkpoint_cache.load_object(user_task_attempts_map_key)
+    if cached_user_task_attempts_map is not None:
+        user_task_attempts_map = cached_user_task_attempts_map
+    else:
         # parallel run with multithreading
         with ThreadPoolExecutor(4) as thread_pool:
             result_iter = thread_pool.map(_handle_one_task, cand_ret_dict.items())
-        # pickle for checkpoint
-        with open(user_task_attempts_map_file, 'wb') as _f:
-            pickle.dump(user_task_attempts_map, _f)
+        # checkpoint
+        checkpoint_cache.dump_object(user_task_attempts_map_key, user_task_attempts_map)
     # help to release memory
     del cand_ret_dict
-    # function to handle task attempts for one user (handle overlap)
-    def _handle_one_user(item):
-        user_name, task_attempt_dict = item
-        (   duration_list,
-            n_tasks_in_duration_list,
-            task_attempts_in_duration_list) = get_task_attempts_in_each_duration(task_attempt_dict)
-        # make equivalent task attempts
-        total_taskful_time = datetime.timedelta()
-        total_run_time = datetime.timedelta()
-        total_successful_run_time = datetime.timedelta()
-        total_wait_time = datetime.timedelta()
-        for duration, key_set in zip(duration_list, task_attempts_in_duration_list):
-            n_task_atttempts = len(key_set)
-            if n_task_atttempts > 0:
-                total_taskful_time += duration
-                for key in key_set:
-                    if task_attempt_dict[key]['attemptDuration']:
-                        duration_ratio = duration/task_attempt_dict[key]['attemptDuration']
-                        total_run_time += task_attempt_dict[key]['user_run_cputime']*duration_ratio/cores_per_user
-                        total_successful_run_time += task_attempt_dict[key]['user_successful_run_cputime']*duration_ratio/cores_per_user
-        total_wait_time = total_taskful_time - total_run_time
-        total_run_proportion = total_run_time/total_taskful_time
-        total_successful_run_proportion = total_successful_run_time/total_taskful_time
-        total_wait_proportion = total_wait_time/total_taskful_time
-        total_jobs = sum(( x['user_jobs'] for x in task_attempt_dict.values() ))
-        total_task_attempts = len(task_attempt_dict)
-        total_dict = {
-                'total_jobs': total_jobs,
-                'total_task_attempts': total_task_attempts,
-                'total_taskful_time': total_taskful_time,
-                'total_run_time': total_run_time,
-                'total_successful_run_time': total_successful_run_time,
-                'total_wait_time': total_wait_time,
-                'total_run_proportion': total_run_proportion,
-                'total_successful_run_proportion': total_successful_run_proportion,
-                'total_wait_proportion': total_wait_proportion,
-            }
-        # return
-        return (user_name, total_dict)
     # compute run-wait for users
     user_run_wait_map = {}
-    with ThreadPoolExecutor(4) as thread_pool:
-        result_iter = thread_pool.map(_handle_one_user, user_task_attempts_map.items())
-    user_run_wait_map.update(result_iter)
+    if use_process_pool:
+        with ProcessPoolExecutor(n_workers, mp_context=multiprocessing.get_context('spawn')) as process_pool:
+            result_iter = process_pool.map(_handle_one_user, user_task_attempts_map.items(), chunksize=16)
+            user_run_wait_map.update(result_iter)
+    else:
+        with ThreadPoolExecutor(4) as thread_pool:
+            result_iter = thread_pool.map(_handle_one_user, user_task_attempts_map.items())
+        user_run_wait_map.update(result_iter)
     # print
     # print(user_run_wait_map)
     # pickle
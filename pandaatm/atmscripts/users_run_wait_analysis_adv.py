@@ -8,16 +8,21 @@ import pickle
 import sqlite3
 import csv
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import numpy as np
 
 from pandacommon.pandalogger import logger_utils
 
 from pandaatm.atmconfig import atm_config
-from pandaatm.atmcore.core_utils import SQLiteProxy
+from pandaatm.atmcore.core_utils import NULL_EPOCH_US, SQLiteProxy, iter_fetched_rows, iter_column_batches_by_key, datetime_to_epoch_us, \
+                                        timedelta_to_us, us_to_timedelta
+from pandaatm.atmcore.checkpoint_cache import CheckpointCache, make_cache_key
+from pandaatm.atmcore.columnar_job_store import NULL_INT, ColumnarJobStore, make_job_store_arrays
 from pandaatm.atmbody.agent_base import AgentBase
-from pandaatm.atmutils.generic_utils import get_task_attempt_key_name, get_taskid_atmptn, update_set_by_change_tuple
+from pandaatm.atmutils.generic_utils import get_task_attempt_key_name, get_taskid_atmptn, update_set_by_change_tuple, \
+                                            task_attempts_dict_to_arrays, task_attempts_dict_from_arrays
 from pandaatm.atmutils.slow_task_analyzer_utils import get_tasks_users_in_each_duration
 
 
@@ -27,28 +32,36 @@ created_since = datetime.datetime(2020, 4, 10, 0, 0, 0)
 created_before = datetime.datetime(2020, 4, 24, 0, 0, 0)
 prod_source_label = 'user'
 gshare = 'User Analysis'
+checkpoint_cache_dir = os.path.join('/tmp', 'atm_checkpoint_cache')
+checkpoint_cache_max_size = 50*1024**3
 running_slots_history_csv = '/tmp/user_run_wait_adv_running_slots_history.csv'
+# compute weighted run time in worker processes (reading the memory-mapped job store) instead of threads
+use_process_pool = True
+n_workers = 8
 
 
 # internal constants
-epoch = datetime.datetime(1970, 1, 1)
-one_second = datetime.timedelta(seconds=1)
+one_second_us = 10**6
 
 
 # global varibles
 global_dict = {
         'agent': None,
         'jobspecs_db': None,
-        '_running_slots_ts': np.array([]),
+        '_running_slots_ts': np.array([], dtype=np.int64),
         '_running_slots_value': np.array([]),
-        '_n_users_ts_period': np.array([]),
+        '_n_users_period_end': np.array([], dtype=np.int64),
         '_n_users_value': np.array([]),
+        'job_store': None,
     }
 
 
 # jobspecs db class
 class JobspecsDB(object):
 
+    # columns of job table
+    column_names = ['PandaID', 'jediTaskID', 'attemptNr', 'userName', 'jobStatus', 'actualCoreCount', 'creationTime', 'startTime', 'endTime']
+
     def __init__(self, readonly=False):
         self.filename = global_dict['jobspecs_db']
         self.readonly = readonly
@@ -75,17 +88,25 @@ class JobspecsDB(object):
                 'CREATE INDEX idx_{column} '
                 'ON JobTable({column}) '
             )
+        create_user_start_index_sql = (
+                'CREATE INDEX IF NOT EXISTS idx_userName_startTime '
+                'ON JobTable(userName, startTime) '
+            )
         index_column_list = ['jediTaskID', 'userName', 'creationTime', 'startTime', 'endTime']
-        jdb = SQLiteProxy(self.filename)
+        jdb = SQLiteProxy(self.filename, wal=True)
         with jdb.get_proxy() as proxy:
             proxy.execute(create_table_sql)
             for column in index_column_list:
                 proxy.execute(create_index_sql.format(column=column))
+            proxy.execute(create_user_start_index_sql)
         jdb.close()
 
-    # open jobspecs db
+    # open jobspecs db; in write mode, inserts are handed over to the writer thread,
+    # in readonly mode, each reader thread has its own connection
     def open(self):
-        jdb = SQLiteProxy(self.filename, self.readonly)
+        jdb = SQLiteProxy(self.filename, self.readonly, wal=True, per_thread=self.readonly)
+        if not self.readonly:
+            jdb.start_writer()
         self.db = jdb
 
     # close db
@@ -104,20 +125,21 @@ class JobspecsDB(object):
             ':userName, :jobStatus, :actualCoreCount, '
             ':creationTime, :startTime, :endTime) '
             )
-        with self.db.get_proxy() as proxy:
-            for jobspec in jobspec_list:
-                varMap = {
-                        'PandaID': jobspec.PandaID,
-                        'jediTaskID': jobspec.jediTaskID,
-                        'attemptNr': attemptNr,
-                        'userName': userName,
-                        'jobStatus': jobspec.jobStatus,
-                        'actualCoreCount': jobspec.actualCoreCount if jobspec.actualCoreCount not in (None, 'NULL') else None,
-                        'creationTime': jobspec.creationTime,
-                        'startTime': jobspec.startTime if jobspec.startTime not in (None, 'NULL') else None,
-                        'endTime': jobspec.endTime,
-                    }
-                proxy.execute(insert_sql, varMap)
+        varMap_list = []
+        for jobspec in jobspec_list:
+            varMap = {
+                    'PandaID': jobspec.PandaID,
+                    'jediTaskID': jobspec.jediTaskID,
+                    'attemptNr': attemptNr,
+                    'userName': userName,
+                    'jobStatus': jobspec.jobStatus,
+                    'actualCoreCount': jobspec.actualCoreCount if jobspec.actualCoreCount not in (None, 'NULL') else None,
+                    'creationTime': jobspec.creationTime,
+                    'startTime': jobspec.startTime if jobspec.startTime not in (None, 'NULL') else None,
+                    'endTime': jobspec.endTime,
+                }
+            varMap_list.append(varMap)
+        self.db.put_batch(insert_sql, varMap_list)
 
     # read data as a list of jobspecs
     def read_jobspecs(self, userName=None, startTimeMax=None, endTimeMin=None):
@@ -150,10 +172,40 @@ class JobspecsDB(object):
                                     startTimeMax_filter=startTimeMax_filter,
                                     endTimeMin_filter=endTimeMin_filter,
                                     )
-        self.db.cur.execute(read_sql, varMap)
-        ret_list = self.db.cur.fetchall()
+        with self.db.get_proxy() as proxy:
+            proxy.execute(read_sql, varMap)
+            ret_list = proxy.fetchall()
         return ret_list
 
+    # read all jobs in one scan ordered by userName and startTime; yield (userName, columns_dict) for each user
+    def read_jobspecs_by_user(self, fetch_size=10000):
+        read_sql = (
+            'SELECT {columns} '
+            'FROM JobTable '
+            'ORDER BY userName, startTime'
+            ).format(columns=', '.join(self.column_names))
+        cur = self.db.con.cursor()
+        try:
+            cur.execute(read_sql)
+            yield from iter_column_batches_by_key(cur, self.column_names, 'userName', fetch_size)
+        finally:
+            cur.close()
+
+    # read all jobs which have startTime in one scan ordered by startTime; yield rows
+    def read_started_jobspecs_in_order(self, fetch_size=10000):
+        read_sql = (
+            'SELECT {columns} '
+            'FROM JobTable '
+            'WHERE startTime IS NOT NULL '
+            'ORDER BY startTime'
+            ).format(columns=', '.join(self.column_names))
+        cur = self.db.con.cursor()
+        try:
+            cur.execute(read_sql)
+            yield from iter_fetched_rows(cur, fetch_size)
+        finally:
+            cur.close()
+
 # get history of running slots, csv from grafana plot
 def init_running_slots_history(running_slots_history_csv):
     ts_list = []
@@ -162,65 +214,57 @@ def init_running_slots_history(running_slots_history_csv):
         for row in csv.DictReader(csvfile, delimiter=';', quotechar='"'):
             if row['Series'] == gshare:
                 timestamp = datetime.datetime.strptime(row['Time'], '%Y-%m-%dT%H:%M:%S+00:00')
-                ts_list.append(timestamp)
+                ts_list.append(datetime_to_epoch_us(timestamp))
                 v_list.append(float(row['Value']))
-    global_dict['_running_slots_ts'] = np.array(ts_list)
+    global_dict['_running_slots_ts'] = np.array(ts_list, dtype=np.int64)
     global_dict['_running_slots_value'] = np.array(v_list, dtype='float64')
 
-# set n_users by chronicle points
+# set n_users by chronicle points; periods are consecutive in time order
 def init_n_users_history(period_list, n_users_in_duration_list):
-    global_dict['_n_users_ts_period'] = np.array(period_list)
+    global_dict['_n_users_period_end'] = np.array([ datetime_to_epoch_us(period_end) for _, period_end in period_list ],
+                                                    dtype=np.int64)
     global_dict['_n_users_value'] = np.array(n_users_in_duration_list)
 
-# funciton to get running slots by interpolation
+# funciton to get running slots by interpolation; timestamps in epoch microseconds
 def running_slots_func(ts_array):
-    real_ts_array = np.array([ x.total_seconds() for x in (ts_array - epoch) ])
-    real_monitored_ts_array = np.array([ x.total_seconds() for x in (global_dict['_running_slots_ts'] - epoch) ])
-    ret = np.interp(real_ts_array, real_monitored_ts_array, global_dict['_running_slots_value'])
+    ret = np.interp(ts_array, global_dict['_running_slots_ts'], global_dict['_running_slots_value'])
     return ret
 
-# funciton to get number of users
+# funciton to get number of users; timestamps in epoch microseconds
 def n_users_func(ts_array):
-    ret_list = []
-    first_start = global_dict['_n_users_ts_period'][0][0]
-    first_value = global_dict['_n_users_value'][0]
-    last_end = global_dict['_n_users_ts_period'][-1][1]
-    last_value = global_dict['_n_users_value'][-1]
-    # iterator
-    vals_iter = zip(global_dict['_n_users_ts_period'], global_dict['_n_users_value'])
-    # first values
-    (_start, _end), _value = next(vals_iter)
-    # loop over every second
-    for ts in ts_array:
-        # earlier than first record
-        if ts < first_start:
-            ret_list.append(first_value)
-            continue
-        # later than last record
-        if ts >= last_end:
-            ret_list.append(last_value)
-            continue
-        # within record
-        if ts >= _start and ts < _end:
-            ret_list.append(_value)
-            continue
-        # later than record, call next until within the record
-        try:
-            while ts >= _end:
-                (_start, _end), _value = next(vals_iter)
-        except StopIteration:
-            # later than last record
-            ret_list.append(last_value)
-            continue
-        else:
-            # within the record
-            ret_list.append(_value)
-            continue
-
-    # return
-    ret = np.array(ret_list)
+    # the first period ending after each timestamp, i.e. the period containing it;
+    # the first or last value if earlier or later than all periods
+    index_array = np.searchsorted(global_dict['_n_users_period_end'], ts_array, side='right')
+    index_array = np.minimum(index_array, len(global_dict['_n_users_value']) - 1)
+    ret = global_dict['_n_users_value'][index_array]
     return ret
 
+# initialize worker process with the columnar job store memory-mapped from checkpoint cache
+def _init_job_store_worker(cache_dir, job_store_key):
+    global_dict['job_store'] = ColumnarJobStore(*CheckpointCache(cache_dir).load_arrays(job_store_key))
+
+# weighted run time of jobs of users in a period; cum_multipler_array is cumulative sum of multipler over every second from period_start
+def _get_users_weighted_run_time_in_period(user_name_list, period_start, period_end, cum_multipler_array):
+    job_store = global_dict['job_store']
+    finished_code = job_store.get_code('jobStatus', 'finished')
+    # epoch microseconds of every second within the duration
+    duration_ts_us_array = datetime_to_epoch_us(period_start) + np.arange(len(cum_multipler_array) - 1, dtype=np.int64)*1000000
+    ret_list = []
+    for user_name in user_name_list:
+        # jobs of the user running in the period, from the columnar job store
+        the_jobs = job_store.get_overlapping_jobs(user_name, period_start, period_end,
+                                                    columns=['jobStatus', 'actualCoreCount', 'startTime', 'endTime'])
+        # index range of seconds in the period covered by each job, i.e. startTime <= ts < endTime
+        start_index_array = np.searchsorted(duration_ts_us_array, the_jobs['startTime'], side='left')
+        end_index_array = np.searchsorted(duration_ts_us_array, the_jobs['endTime'], side='left')
+        # sum of multipler over covered seconds, weighted by cores
+        core_count_array = np.where(the_jobs['actualCoreCount'] != NULL_INT, the_jobs['actualCoreCount'], 0)
+        jobs_run_sec_array = core_count_array*(cum_multipler_array[end_index_array] - cum_multipler_array[start_index_array])
+        jobs_run_sec = float(np.sum(jobs_run_sec_array))
+        finished_jobs_run_sec = float(np.sum(jobs_run_sec_array[the_jobs['jobStatus'] == finished_code]))
+        ret_list.append((user_name, jobs_run_sec, finished_jobs_run_sec))
+    return ret_list
+
 
 # main
 def main():
@@ -229,12 +273,20 @@ def main():
     print('start')
     # global lock
     global_lock = threading.Lock()
-    # checkpoint file for task attempts
-    all_task_attempts_dict_file = '{0}-all_task_attempts_dict.pickle'.format(checkpoint_file_prefix)
-    try:
-        with open(all_task_attempts_dict_file, 'rb') as _f:
-            all_task_attempts_dict = pickle.load(_f)
-    except FileNotFoundError:
+    # checkpoint cache for task attempts, keyed by query parameters
+    checkpoint_cache = CheckpointCache(checkpoint_cache_dir, max_size=checkpoint_cache_max_size)
+    query_params = {
+            'created_since': created_since,
+            'created_before': created_before,
+            'prod_source_label': prod_source_label,
+            'gshare': gshare,
+        }
+    all_task_attempts_dict_key = make_cache_key('all_task_attempts_dict', query_params)
+    cached_arrays = checkpoint_cache.load_arrays(all_task_attempts_dict_key)
+    if cached_arrays is not None:
+        all_task_attempts_dict = task_attempts_dict_from_arrays(*cached_arrays)
+        del cached_arrays
+    else:
         # get db proxy
         if global_dict['agent'] is None:
             global_dict['agent'] = AgentBase()
@@ -244,9 +296,8 @@ def main():
                                                 created_before=created_before,
                                                 prod_source_label=prod_source_label,
                                                 gshare=gshare)
-        # pickle for checkpoint
-        with open(all_task_attempts_dict_file, 'wb') as _f:
-            pickle.dump(all_task_attempts_dict, _f)
+        # checkpoint
+        checkpoint_cache.dump_arrays(all_task_attempts_dict_key, *task_attempts_dict_to_arrays(all_task_attempts_dict))
     print('got all task attempts')
     # handle all task attempts
     res_tasks_users = get_tasks_users_in_each_duration(all_task_attempts_dict)
@@ -255,13 +306,15 @@ def main():
         n_users_in_duration_list, user_name_change_in_duration_list) = res_tasks_users
     print('handed all task attempts')
     # use sqlite to store jobspecs
-    task_jobspecs_db_file = '{0}-task_jobspecs.db'.format(checkpoint_file_prefix)
-    global_dict['jobspecs_db'] = task_jobspecs_db_file
-    try:
-        # open jobspecs db to read
-        task_jobspecs_db_read = JobspecsDB(readonly=True)
-    except sqlite3.OperationalError:
-        # jobspecs db not existing
+    jobspecs_params = query_params
+    task_jobspecs_db_file = '{0}-{1}.db'.format(checkpoint_file_prefix, make_cache_key('task_jobspecs', jobspecs_params))
+    if not os.path.exists(task_jobspecs_db_file):
+        # jobspecs db not existing; build it under a temporary name, renamed only when complete
+        tmp_jobspecs_db_file = '{0}.tmp'.format(task_jobspecs_db_file)
+        for file_name in (tmp_jobspecs_db_file, tmp_jobspecs_db_file + '-wal', tmp_jobspecs_db_file + '-shm'):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        global_dict['jobspecs_db'] = tmp_jobspecs_db_file
         # jobspecs db to write
         task_jobspecs_db_write = JobspecsDB()
         # get db proxy
@@ -280,29 +333,53 @@ def main():
                                                                 attempt_start=task_attempt.startTime,
                                                                 attempt_end=task_attempt.endTime,
                                                                 concise=True)
+            if jobspec_list is None:
+                raise RuntimeError('failed to get jobs of {0}'.format(key_name))
             # store into jobspecs db
             task_jobspecs_db_write.insert(jobspec_list, task_attempt.userName, task_attempt.attemptNr)
         # parallel run with multithreading
-        with ThreadPoolExecutor(4) as thread_pool:
-            thread_pool.map(_handle_one_task_attempt, all_task_attempts_dict.items())
-        # close jobspecs db
-        task_jobspecs_db_write.close()
-        del task_jobspecs_db_write
-        # open jobspecs db to read
-        task_jobspecs_db_read = JobspecsDB(readonly=True)
+        try:
+            with ThreadPoolExecutor(4) as thread_pool:
+                # consume results to raise exceptions of workers
+                for _ in thread_pool.map(_handle_one_task_attempt, all_task_attempts_dict.items()):
+                    pass
+        finally:
+            # close jobspecs db; raise if the writer thread failed
+            task_jobspecs_db_write.close()
+            del task_jobspecs_db_write
+        os.rename(tmp_jobspecs_db_file, task_jobspecs_db_file)
+    # open jobspecs db to read
+    global_dict['jobspecs_db'] = task_jobspecs_db_file
+    task_jobspecs_db_read = JobspecsDB(readonly=True)
     print('got all jobspecs')
+    # columnar job store memory-mapped from checkpoint cache, built from jobspecs db if not cached;
+    # keyed on the completed jobspecs db, so that a rebuilt db is not paired with a stale store
+    jobspecs_db_stat = os.stat(task_jobspecs_db_file)
+    job_store_params = {
+            'jobspecs_db': task_jobspecs_db_file,
+            'jobspecs_db_size': jobspecs_db_stat.st_size,
+            'jobspecs_db_mtime_ns': jobspecs_db_stat.st_mtime_ns,
+        }
+    job_store_key = make_cache_key('task_job_store', job_store_params)
+    cached_arrays = checkpoint_cache.load_arrays(job_store_key)
+    if cached_arrays is None:
+        job_row_iter = ( job_row for _, jobs_columns in task_jobspecs_db_read.read_jobspecs_by_user()
+                            for job_row in zip(*jobs_columns.values()) )
+        checkpoint_cache.dump_arrays(job_store_key, *make_job_store_arrays(JobspecsDB.column_names, job_row_iter))
+        cached_arrays = checkpoint_cache.load_arrays(job_store_key)
+    job_store = ColumnarJobStore(*cached_arrays)
+    global_dict['job_store'] = job_store
+    del cached_arrays
+    finished_code = job_store.get_code('jobStatus', 'finished')
+    print('got columnar job store')
     # initialize functions of running_slots_history and n_users_history
     init_running_slots_history(running_slots_history_csv)
     print('initialized function by running slots history')
     init_n_users_history(period_list, n_users_in_duration_list)
     print('initialized function by n users history')
-    # array of every second within the duration
-    duration_ts_list = []
-    tmp_ts = period_list[0][0]
-    while tmp_ts < period_list[-1][1]:
-        duration_ts_list.append(tmp_ts)
-        tmp_ts += one_second
-    duration_ts_array = np.array(duration_ts_list)
+    # array of every second within the duration, in epoch microseconds
+    duration_ts_array = np.arange(datetime_to_epoch_us(period_list[0][0]), datetime_to_epoch_us(period_list[-1][1]),
+                                    one_second_us, dtype=np.int64)
     print('got duration array')
     n_users_array = n_users_func(duration_ts_array)
     running_slots_array = running_slots_func(duration_ts_array)
@@ -322,20 +399,23 @@ def main():
             all_users_tasks_dict[user_name] = {}
             all_users_tasks_dict[user_name]['n_task_attempts'] = 1
             all_users_tasks_dict[user_name]['task_attempts'] = set([key])
+    # times are aggregated in microseconds, and converted into timedelta at last
     for user_name, v in all_users_tasks_dict.items():
         user_run_wait_map[user_name] = {
                 'total_jobs': 0,
                 'total_task_attempts': v['n_task_attempts'],
-                'total_taskful_time': datetime.timedelta(),
-                'total_run_core_time': datetime.timedelta(),
-                'total_successful_run_core_time': datetime.timedelta(),
-                'total_run_time': datetime.timedelta(),
-                'total_successful_run_time': datetime.timedelta(),
+                'total_taskful_time': 0,
+                'total_run_core_time': 0,
+                'total_successful_run_core_time': 0,
+                'total_run_time': 0.,
+                'total_successful_run_time': 0.,
             }
     print('initialized user_run_wait_map')
+    # durations of periods in microseconds
+    duration_us_list = [ timedelta_to_us(duration) for duration in duration_list ]
     # aggregate taskful time in map
     tmp_user_set = set()
-    for duration, user_change in zip(duration_list, user_name_change_in_duration_list):
+    for duration, user_change in zip(duration_us_list, user_name_change_in_duration_list):
         # update temporary sets
         update_set_by_change_tuple(tmp_user_set, user_change)
         # aggregate taskful time in map
@@ -347,21 +427,21 @@ def main():
 
     # fill number and run core time of jobs of users
     for user_name in all_users_tasks_dict:
-        the_jobs = task_jobspecs_db_read.read_jobspecs(userName=user_name)
-        for PandaID, jediTaskID, attemptNr, \
-                userName, jobStatus, actualCoreCount, \
-                creationTime, startTime, endTime in the_jobs:
-            if startTime in (None, 'NULL'):
-                run_duration = datetime.timedelta()
-            else:
-                start_time = max(startTime, creationTime)
-                run_duration = endTime - start_time
-            run_core_time = run_duration*actualCoreCount if actualCoreCount not in (None, 'NULL') else datetime.timedelta()
-            with global_lock:
-                user_run_wait_map[user_name]['total_jobs'] += 1
-                user_run_wait_map[user_name]['total_run_core_time'] += run_core_time
-                if jobStatus == 'finished':
-                    user_run_wait_map[user_name]['total_successful_run_core_time'] += run_core_time
+        jobs_columns = job_store.get_user_jobs(user_name,
+                                                columns=['jobStatus', 'actualCoreCount', 'creationTime', 'startTime', 'endTime'])
+        # run core time in microseconds of each job; 0 if not started or no core count
+        started_mask = jobs_columns['startTime'] != NULL_EPOCH_US
+        run_us_array = np.where(started_mask,
+                                jobs_columns['endTime'] - np.maximum(jobs_columns['startTime'], jobs_columns['creationTime']),
+                                0)
+        run_core_us_array = np.where(jobs_columns['actualCoreCount'] != NULL_INT,
+                                     run_us_array*jobs_columns['actualCoreCount'],
+                                     0)
+        finished_mask = jobs_columns['jobStatus'] == finished_code
+        with global_lock:
+            user_run_wait_map[user_name]['total_jobs'] += len(run_core_us_array)
+            user_run_wait_map[user_name]['total_run_core_time'] += int(run_core_us_array.sum())
+            user_run_wait_map[user_name]['total_successful_run_core_time'] += int(run_core_us_array[finished_mask].sum())
     print('computed run core time for all users')
 
     # run time (weighted by cores_per_user) of jobs of the task attempt
@@ -369,81 +449,56 @@ def main():
     tmp_key_set = set()
     tmp_user_set = set()
     nth_period = 0
-    for period, duration, n_task_attempts, key_change, n_users, user_change in zip(*res_tasks_users):
-        nth_period += 1
-        # skip if no task attempt
-        if n_task_attempts == 0:
-            continue
-        # update temporary sets
-        update_set_by_change_tuple(tmp_key_set, key_change)
-        update_set_by_change_tuple(tmp_user_set, user_change)
-        # edges of the period
-        period_start, period_end = period
-        # array of every second within the duration
-        duration_ts_list = []
-        tmp_ts = period_start
-        while tmp_ts < period_end:
-            duration_ts_list.append(tmp_ts)
-            tmp_ts += one_second
-        duration_ts_array = np.array(duration_ts_list)
-        n_users_array = n_users_func(duration_ts_array)
-        running_slots_array = running_slots_func(duration_ts_array)
-        # array of multipler (n_users / total_slots)
-        multipler_array = n_users_array / running_slots_array
-        # all task attempts in this duration
-        # for key in tmp_key_set:
-        def _handle_one_user_in_period(user_name):
-            # fill jobspec list of the user
-            the_jobs = task_jobspecs_db_read.read_jobspecs( userName=user_name,
-                                                            startTimeMax=period_end,
-                                                            endTimeMin=period_start,
-                                                            )
-            # numpy matrix for running period of all jobs
-            jobs_matrix_list = []
-            finished_jobs_matrix_list = []
-            jobs_run_sec = 0
-            finished_jobs_run_sec = 0
-            for PandaID, jediTaskID, attemptNr, \
-                    userName, jobStatus, actualCoreCount, \
-                    creationTime, startTime, endTime in the_jobs:
-                if startTime in (None, 'NULL'):
-                    continue
-                one_job_slots_list = []
-                for ts in duration_ts_list:
-                    if ts >= startTime and ts < endTime:
-                        one_job_slots_list.append(actualCoreCount)
-                    else:
-                        one_job_slots_list.append(0)
-                jobs_matrix_list.append(one_job_slots_list)
-                if jobStatus == 'finished':
-                    finished_jobs_matrix_list.append(one_job_slots_list)
-            if jobs_matrix_list:
-                jobs_matrix = np.array(jobs_matrix_list)
-                # sum to get run time
-                jobs_run_sec_array = np.dot(jobs_matrix, multipler_array)
-                jobs_run_sec = np.sum(jobs_run_sec_array)
-            if finished_jobs_matrix_list:
-                finished_jobs_matrix = np.array(finished_jobs_matrix_list)
-                # sum to get successful run time
-                finished_jobs_run_sec_array = np.dot(finished_jobs_matrix, multipler_array)
-                finished_jobs_run_sec = np.sum(finished_jobs_run_sec_array)
-            # aggregate run time in map
-            with global_lock:
-                user_run_wait_map[user_name]['total_run_time'] += jobs_run_sec*one_second
-                user_run_wait_map[user_name]['total_successful_run_time'] += finished_jobs_run_sec*one_second
-        # parallel run with multithreading
-        with ThreadPoolExecutor(8) as thread_pool:
-            thread_pool.map(_handle_one_user_in_period, tmp_key_set)
-        # aggregate taskful time in map
-        for user_name in tmp_user_set:
-            user_run_wait_map[user_name]['total_taskful_time'] += duration
-        print('computed weighted run time in a period: {0}/{1}'.format(nth_period, n_periods))
+    if use_process_pool:
+        executor = ProcessPoolExecutor(n_workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_job_store_worker,
+                                        initargs=(checkpoint_cache_dir, job_store_key))
+    else:
+        executor = ThreadPoolExecutor(n_workers)
+    with executor:
+        future_list = []
+        for period, duration, n_task_attempts, key_change, n_users, user_change in zip(period_list, duration_us_list,
+                                                                                        *res_tasks_users[2:]):
+            nth_period += 1
+            # update temporary sets
+            update_set_by_change_tuple(tmp_key_set, key_change)
+            update_set_by_change_tuple(tmp_user_set, user_change)
+            # skip if no task attempt
+            if n_task_attempts == 0:
+                continue
+            # edges of the period
+            period_start, period_end = period
+            # array of every second within the duration, in epoch microseconds
+            duration_ts_array = np.arange(datetime_to_epoch_us(period_start), datetime_to_epoch_us(period_end),
+                                            one_second_us, dtype=np.int64)
+            n_users_array = n_users_func(duration_ts_array)
+            running_slots_array = running_slots_func(duration_ts_array)
+            # array of multipler (n_users / total_slots)
+            multipler_array = n_users_array / running_slots_array
+            # cumulative sum of multipler
+            cum_multipler_array = np.concatenate(([0.], np.cumsum(multipler_array)))
+            # weighted run time of all users in this duration, computed by workers
+            future = executor.submit(_get_users_weighted_run_time_in_period, sorted(tmp_user_set),
+                                        period_start, period_end, cum_multipler_array)
+            future_list.append((nth_period, future))
+            # aggregate taskful time in map
+            for user_name in tmp_user_set:
+                user_run_wait_map[user_name]['total_taskful_time'] += duration
+        # aggregate run time in map
+        for nth_period, future in future_list:
+            for user_name, jobs_run_sec, finished_jobs_run_sec in future.result():
+                user_run_wait_map[user_name]['total_run_time'] += jobs_run_sec*one_second_us
+                user_run_wait_map[user_name]['total_successful_run_time'] += finished_jobs_run_sec*one_second_us
+            print('computed weighted run time in a period: {0}/{1}'.format(nth_period, n_periods))
     print('computed weighted run time for all users')
 
 
     # compute remaining values
     for user_name in all_users_tasks_dict:
         v = user_run_wait_map[user_name]
+        for time_key in ('total_taskful_time', 'total_run_core_time', 'total_successful_run_core_time',
+                            'total_run_time', 'total_successful_run_time'):
+            v[time_key] = us_to_timedelta(v[time_key])
         total_wait_time = v['total_taskful_time'] - v['total_run_time']
         total_run_proportion = v['total_run_time']/v['total_taskful_time']
         total_successful_run_proportion = v['total_successful_run_time']/v['total_taskful_time']
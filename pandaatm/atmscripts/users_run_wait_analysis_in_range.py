@@ -15,10 +15,13 @@ import numpy as np
 from pandacommon.pandalogger import logger_utils
 
 from pandaatm.atmconfig import atm_config
-from pandaatm.atmcore.core_utils import SQLiteProxy
+from pandaatm.atmcore.core_utils import SQLiteProxy, iter_fetched_rows, iter_column_batches_by_key, datetime_to_epoch_us, \
+                                        timedelta_to_us, us_to_timedelta
+from pandaatm.atmcore.checkpoint_cache import CheckpointCache, make_cache_key
 from pandaatm.atmbody.agent_base import AgentBase
-from pandaatm.atmutils.generic_utils import get_task_attempt_key_name, get_taskid_atmptn, update_set_by_change_tuple
-from pandaatm.atmutils.slow_task_analyzer_utils import get_tasks_users_in_each_duration
+from pandaatm.atmutils.generic_utils import get_task_attempt_key_name, get_taskid_atmptn, update_set_by_change_tuple, \
+                                            task_attempts_dict_to_arrays, task_attempts_dict_from_arrays
+from pandaatm.atmutils.slow_task_analyzer_utils import get_tasks_users_in_each_duration, join_jobs_to_periods
 
 
 # parameters
@@ -34,21 +37,22 @@ record_created_before = datetime.datetime(2020, 6, 7, 0, 0, 0)
 # record_created_before = datetime.datetime(2020, 5, 1, 0, 0, 0)
 prod_source_label = 'user'
 gshare = 'User Analysis'
+checkpoint_cache_dir = os.path.join('/tmp', 'atm_checkpoint_cache')
+checkpoint_cache_max_size = 50*1024**3
 running_slots_history_csv = '/tmp/user_run_wait_adv_running_slots_history_0516_0607.csv'
 
 
 # internal constants
-epoch = datetime.datetime(1970, 1, 1)
-one_second = datetime.timedelta(seconds=1)
+one_second_us = 10**6
 
 
 # global varibles
 global_dict = {
         'agent': None,
         'jobspecs_db': None,
-        '_running_slots_ts': np.array([]),
+        '_running_slots_ts': np.array([], dtype=np.int64),
         '_running_slots_value': np.array([]),
-        '_n_users_ts_period': np.array([]),
+        '_n_users_period_end': np.array([], dtype=np.int64),
         '_n_users_value': np.array([]),
     }
 
@@ -56,6 +60,9 @@ global_dict = {
 # jobspecs db class
 class JobspecsDB(object):
 
+    # columns of job table
+    column_names = ['PandaID', 'jediTaskID', 'attemptNr', 'userName', 'jobStatus', 'actualCoreCount', 'creationTime', 'startTime', 'endTime', 'computingSite']
+
     def __init__(self, readonly=False):
         self.filename = global_dict['jobspecs_db']
         self.readonly = readonly
@@ -83,17 +90,25 @@ class JobspecsDB(object):
                 'CREATE INDEX idx_{column} '
                 'ON JobTable({column}) '
             )
+        create_user_start_index_sql = (
+                'CREATE INDEX IF NOT EXISTS idx_userName_startTime '
+                'ON JobTable(userName, startTime) '
+            )
         index_column_list = ['jediTaskID', 'userName', 'creationTime', 'startTime', 'endTime']
-        jdb = SQLiteProxy(self.filename)
+        jdb = SQLiteProxy(self.filename, wal=True)
         with jdb.get_proxy() as proxy:
             proxy.execute(create_table_sql)
             for column in index_column_list:
                 proxy.execute(create_index_sql.format(column=column))
+            proxy.execute(create_user_start_index_sql)
         jdb.close()
 
-    # open jobspecs db
+    # open jobspecs db; in write mode, inserts are handed over to the writer thread,
+    # in readonly mode, each reader thread has its own connection
     def open(self):
-        jdb = SQLiteProxy(self.filename, self.readonly)
+        jdb = SQLiteProxy(self.filename, self.readonly, wal=True, per_thread=self.readonly)
+        if not self.readonly:
+            jdb.start_writer()
         self.db = jdb
 
     # close db
@@ -114,21 +129,22 @@ class JobspecsDB(object):
             ':creationTime, :startTime, :endTime, '
             ':computingSite) '
             )
-        with self.db.get_proxy() as proxy:
-            for jobspec in jobspec_list:
-                varMap = {
-                        'PandaID': jobspec.PandaID,
-                        'jediTaskID': jobspec.jediTaskID,
-                        'attemptNr': attemptNr,
-                        'userName': userName,
-                        'jobStatus': jobspec.jobStatus,
-                        'actualCoreCount': jobspec.actualCoreCount if jobspec.actualCoreCount not in (None, 'NULL') else None,
-                        'creationTime': jobspec.creationTime,
-                        'startTime': jobspec.startTime if jobspec.startTime not in (None, 'NULL') else None,
-                        'endTime': jobspec.endTime,
-                        'computingSite': jobspec.computingSite,
-                    }
-                proxy.execute(insert_sql, varMap)
+        varMap_list = []
+        for jobspec in jobspec_list:
+            varMap = {
+                    'PandaID': jobspec.PandaID,
+                    'jediTaskID': jobspec.jediTaskID,
+                    'attemptNr': attemptNr,
+                    'userName': userName,
+                    'jobStatus': jobspec.jobStatus,
+                    'actualCoreCount': jobspec.actualCoreCount if jobspec.actualCoreCount not in (None, 'NULL') else None,
+                    'creationTime': jobspec.creationTime,
+                    'startTime': jobspec.startTime if jobspec.startTime not in (None, 'NULL') else None,
+                    'endTime': jobspec.endTime,
+                    'computingSite': jobspec.computingSite,
+                }
+            varMap_list.append(varMap)
+        self.db.put_batch(insert_sql, varMap_list)
 
     # read data as a list of jobspecs
     def read_jobspecs(self, userName=None, startTimeMax=None, endTimeMin=None):
@@ -167,6 +183,35 @@ class JobspecsDB(object):
             ret_list = proxy.fetchall()
         return ret_list
 
+    # read all jobs in one scan ordered by userName and startTime; yield (userName, columns_dict) for each user
+    def read_jobspecs_by_user(self, fetch_size=10000):
+        read_sql = (
+            'SELECT {columns} '
+            'FROM JobTable '
+            'ORDER BY userName, startTime'
+            ).format(columns=', '.join(self.column_names))
+        cur = self.db.con.cursor()
+        try:
+            cur.execute(read_sql)
+            yield from iter_column_batches_by_key(cur, self.column_names, 'userName', fetch_size)
+        finally:
+            cur.close()
+
+    # read all jobs which have startTime in one scan ordered by startTime; yield rows
+    def read_started_jobspecs_in_order(self, fetch_size=10000):
+        read_sql = (
+            'SELECT {columns} '
+            'FROM JobTable '
+            'WHERE startTime IS NOT NULL '
+            'ORDER BY startTime'
+            ).format(columns=', '.join(self.column_names))
+        cur = self.db.con.cursor()
+        try:
+            cur.execute(read_sql)
+            yield from iter_fetched_rows(cur, fetch_size)
+        finally:
+            cur.close()
+
 # get history of running slots, csv from grafana plot
 def init_running_slots_history(running_slots_history_csv):
     ts_list = []
@@ -175,63 +220,29 @@ def init_running_slots_history(running_slots_history_csv):
         for row in csv.DictReader(csvfile, delimiter=';', quotechar='"'):
             if row['Series'] == gshare:
                 timestamp = datetime.datetime.strptime(row['Time'], '%Y-%m-%dT%H:%M:%S+00:00')
-                ts_list.append(timestamp)
+                ts_list.append(datetime_to_epoch_us(timestamp))
                 v_list.append(float(row['Value']))
-    global_dict['_running_slots_ts'] = np.array(ts_list)
+    global_dict['_running_slots_ts'] = np.array(ts_list, dtype=np.int64)
     global_dict['_running_slots_value'] = np.array(v_list, dtype='float64')
 
-# set n_users by chronicle points
+# set n_users by chronicle points; periods are consecutive in time order
 def init_n_users_history(period_list, n_users_in_duration_list):
-    global_dict['_n_users_ts_period'] = np.array(period_list)
+    global_dict['_n_users_period_end'] = np.array([ datetime_to_epoch_us(period_end) for _, period_end in period_list ],
+                                                    dtype=np.int64)
     global_dict['_n_users_value'] = np.array(n_users_in_duration_list)
 
-# funciton to get running slots by interpolation
+# funciton to get running slots by interpolation; timestamps in epoch microseconds
 def running_slots_func(ts_array):
-    real_ts_array = np.array([ x.total_seconds() for x in (ts_array - epoch) ])
-    real_monitored_ts_array = np.array([ x.total_seconds() for x in (global_dict['_running_slots_ts'] - epoch) ])
-    ret = np.interp(real_ts_array, real_monitored_ts_array, global_dict['_running_slots_value'])
+    ret = np.interp(ts_array, global_dict['_running_slots_ts'], global_dict['_running_slots_value'])
     return ret
 
-# funciton to get number of users
+# funciton to get number of users; timestamps in epoch microseconds
 def n_users_func(ts_array):
-    ret_list = []
-    first_start = global_dict['_n_users_ts_period'][0][0]
-    first_value = global_dict['_n_users_value'][0]
-    last_end = global_dict['_n_users_ts_period'][-1][1]
-    last_value = global_dict['_n_users_value'][-1]
-    # iterator
-    vals_iter = zip(global_dict['_n_users_ts_period'], global_dict['_n_users_value'])
-    # first values
-    (_start, _end), _value = next(vals_iter)
-    # loop over every second
-    for ts in ts_array:
-        # earlier than first record
-        if ts < first_start:
-            ret_list.append(first_value)
-            continue
-        # later than last record
-        if ts >= last_end:
-            ret_list.append(last_value)
-            continue
-        # within record
-        if ts >= _start and ts < _end:
-            ret_list.append(_value)
-            continue
-        # later than record, call next until within the record
-        try:
-            while ts >= _end:
-                (_start, _end), _value = next(vals_iter)
-        except StopIteration:
-            # later than last record
-            ret_list.append(last_value)
-            continue
-        else:
-            # within the record
-            ret_list.append(_value)
-            continue
-
-    # return
-    ret = np.array(ret_list)
+    # the first period ending after each timestamp, i.e. the period containing it;
+    # the first or last value if earlier or later than all periods
+    index_array = np.searchsorted(global_dict['_n_users_period_end'], ts_array, side='right')
+    index_array = np.minimum(index_array, len(global_dict['_n_users_value']) - 1)
+    ret = global_dict['_n_users_value'][index_array]
     return ret
 
 
@@ -244,12 +255,20 @@ def main():
     global_lock = threading.Lock()
 
 
-    # checkpoint file for task attempts
-    all_task_attempts_dict_file = '{0}-all_task_attempts_dict.pickle'.format(checkpoint_file_prefix)
-    try:
-        with open(all_task_attempts_dict_file, 'rb') as _f:
-            all_task_attempts_dict = pickle.load(_f)
-    except FileNotFoundError:
+    # checkpoint cache for task attempts, keyed by query parameters
+    checkpoint_cache = CheckpointCache(checkpoint_cache_dir, max_size=checkpoint_cache_max_size)
+    query_params = {
+            'created_since': record_created_since,
+            'created_before': record_created_before,
+            'prod_source_label': prod_source_label,
+            'gshare': gshare,
+        }
+    all_task_attempts_dict_key = make_cache_key('all_task_attempts_dict', query_params)
+    cached_arrays = checkpoint_cache.load_arrays(all_task_attempts_dict_key)
+    if cached_arrays is not None:
+        all_task_attempts_dict = task_attempts_dict_from_arrays(*cached_arrays)
+        del cached_arrays
+    else:
         # get db proxy
         if global_dict['agent'] is None:
             global_dict['agent'] = AgentBase()
@@ -259,9 +278,8 @@ def main():
                                                 created_before=record_created_before,
                                                 prod_source_label=prod_source_label,
                                                 gshare=gshare)
-        # pickle for checkpoint
-        with open(all_task_attempts_dict_file, 'wb') as _f:
-            pickle.dump(all_task_attempts_dict, _f)
+        # checkpoint
+        checkpoint_cache.dump_arrays(all_task_attempts_dict_key, *task_attempts_dict_to_arrays(all_task_attempts_dict))
     print('got all task attempts')
 
 
@@ -280,14 +298,16 @@ def main():
             concerned_task_attempts_dict[key] = task_attempt
     print('extracted concerned task attempts')
 
-    # use sqlite to store jobspecs
-    task_jobspecs_db_file = '{0}-task_jobspecs.db'.format(checkpoint_file_prefix)
-    global_dict['jobspecs_db'] = task_jobspecs_db_file
-    try:
-        # open jobspecs db to read
-        task_jobspecs_db_read = JobspecsDB(readonly=True)
-    except sqlite3.OperationalError:
-        # jobspecs db not existing
+    # use sqlite to store jobspecs; only jobs of concerned task attempts are stored
+    jobspecs_params = dict(query_params, range_start=range_start, range_end=range_end)
+    task_jobspecs_db_file = '{0}-{1}.db'.format(checkpoint_file_prefix, make_cache_key('task_jobspecs', jobspecs_params))
+    if not os.path.exists(task_jobspecs_db_file):
+        # jobspecs db not existing; build it under a temporary name, renamed only when complete
+        tmp_jobspecs_db_file = '{0}.tmp'.format(task_jobspecs_db_file)
+        for file_name in (tmp_jobspecs_db_file, tmp_jobspecs_db_file + '-wal', tmp_jobspecs_db_file + '-shm'):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        global_dict['jobspecs_db'] = tmp_jobspecs_db_file
         # jobspecs db to write
         task_jobspecs_db_write = JobspecsDB()
         # get db proxy
@@ -307,6 +327,8 @@ def main():
                                                                     attempt_start=task_attempt.startTime,
                                                                     attempt_end=task_attempt.endTime,
                                                                     concise=True)
+                if jobspec_list is None:
+                    raise RuntimeError('failed to get jobs of {0}'.format(key_name))
                 # store into jobspecs db
                 task_jobspecs_db_write.insert(jobspec_list, task_attempt.userName, task_attempt.attemptNr)
             except Exception as e:
@@ -314,13 +336,19 @@ def main():
                 sys.stderr.flush()
                 raise
         # parallel run with multithreading
-        with ThreadPoolExecutor(4) as thread_pool:
-            thread_pool.map(_handle_one_task_attempt, concerned_task_attempts_dict.items())
-        # close jobspecs db
-        task_jobspecs_db_write.close()
-        del task_jobspecs_db_write
-        # open jobspecs db to read
-        task_jobspecs_db_read = JobspecsDB(readonly=True)
+        try:
+            with ThreadPoolExecutor(4) as thread_pool:
+                # consume results to raise exceptions of workers
+                for _ in thread_pool.map(_handle_one_task_attempt, concerned_task_attempts_dict.items()):
+                    pass
+        finally:
+            # close jobspecs db; raise if the writer thread failed
+            task_jobspecs_db_write.close()
+            del task_jobspecs_db_write
+        os.rename(tmp_jobspecs_db_file, task_jobspecs_db_file)
+    # open jobspecs db to read
+    global_dict['jobspecs_db'] = task_jobspecs_db_file
+    task_jobspecs_db_read = JobspecsDB(readonly=True)
     print('got all jobspecs')
 
 
@@ -331,21 +359,19 @@ def main():
     print('initialized function by n users history')
 
 
-    # array of every second within the range of interest
-    range_ts_list = []
-    tmp_ts = range_start
-    while tmp_ts < range_end:
-        range_ts_list.append(tmp_ts)
-        tmp_ts += one_second
-    range_ts_array = np.array(range_ts_list)
+    # array of every second within the range of interest, in epoch microseconds
+    range_start_us = datetime_to_epoch_us(range_start)
+    range_end_us = datetime_to_epoch_us(range_end)
+    range_ts_array = np.arange(range_start_us, range_end_us, one_second_us, dtype=np.int64)
     print('got range timestamp array')
     n_users_array = n_users_func(range_ts_array)
     running_slots_array = running_slots_func(range_ts_array)
     # array of multiplier (n_users / total_slots)
-    multiplier_array = n_users_func(range_ts_array) / running_slots_func(range_ts_array)
+    multiplier_array = n_users_array / running_slots_array
     print('got multiplier array')
     with open('{0}.multiplier'.format(dump_file), 'wb') as _f:
-        pickle.dump((range_ts_array, n_users_array, running_slots_array, multiplier_array), _f)
+        # timestamps dumped as datetime
+        pickle.dump((range_ts_array.astype('datetime64[us]').astype(object), n_users_array, running_slots_array, multiplier_array), _f)
 
 
     # run time (weighted by cores_per_user) of jobs of the task attempt
@@ -367,15 +393,27 @@ def main():
                 'total_run_jobs': 0,
                 'total_successful_run_jobs': 0,
                 'total_task_attempts': v['n_task_attempts'],
-                'total_taskful_time': datetime.timedelta(),
-                'total_run_core_time': datetime.timedelta(),
-                'total_successful_run_core_time': datetime.timedelta(),
+                'total_taskful_time': 0,
+                'total_run_core_time': 0,
+                'total_successful_run_core_time': 0,
                 'run_core_time_on_sites': {},
                 'successful_run_core_time_on_sites': {},
-                'total_run_time': datetime.timedelta(),
-                'total_successful_run_time': datetime.timedelta(),
+                'total_run_time': 0.,
+                'total_successful_run_time': 0.,
             }
     print('initialized user_run_wait_map')
+    # times in map are aggregated in microseconds, and converted into timedelta when dumped
+    def _map_to_timedelta(run_wait_map):
+        ret_map = {}
+        for user_name, v in run_wait_map.items():
+            new_v = dict(v)
+            for time_key in ('total_taskful_time', 'total_run_core_time', 'total_successful_run_core_time',
+                                'total_run_time', 'total_successful_run_time'):
+                new_v[time_key] = us_to_timedelta(v[time_key])
+            for sites_key in ('run_core_time_on_sites', 'successful_run_core_time_on_sites'):
+                new_v[sites_key] = { site: us_to_timedelta(x) for site, x in v[sites_key].items() }
+            ret_map[user_name] = new_v
+        return ret_map
 
 
     # aggregate taskful time in map
@@ -396,6 +434,7 @@ def main():
             real_duration = period_end - range_start
         elif period_start <= range_end and period_end >= range_end:
             real_duration = range_end - period_start
+        real_duration = timedelta_to_us(real_duration)
         # aggregate taskful time in map
         for user_name in tmp_user_set:
             user_run_wait_map[user_name]['total_taskful_time'] += real_duration
@@ -403,12 +442,16 @@ def main():
 
 
     # fill number and run core time of jobs of users. Also, catogorize by sites
-    for user_name in all_users_tasks_dict:
-        the_jobs = task_jobspecs_db_read.read_jobspecs(userName=user_name)
-        for PandaID, jediTaskID, attemptNr, \
-                userName, jobStatus, actualCoreCount, \
-                creationTime, startTime, endTime, \
-                computingSite in the_jobs:
+    for user_name, jobs_columns in task_jobspecs_db_read.read_jobspecs_by_user():
+        if user_name not in user_run_wait_map:
+            continue
+        for jobStatus, actualCoreCount, creationTime, startTime, endTime, computingSite in zip(
+                                                                        jobs_columns['jobStatus'],
+                                                                        jobs_columns['actualCoreCount'],
+                                                                        jobs_columns['creationTime'],
+                                                                        jobs_columns['startTime'],
+                                                                        jobs_columns['endTime'],
+                                                                        jobs_columns['computingSite']):
             if creationTime > range_end or endTime < range_start:
                 # job not in range
                 continue
@@ -425,8 +468,8 @@ def main():
             # cut with range edges
             start_time = max(start_time, range_start)
             end_time = min(end_time, range_end)
-            run_duration = endTime - start_time
-            # run core time
+            run_duration = timedelta_to_us(endTime - start_time)
+            # run core time in microseconds
             run_core_time = run_duration*actualCoreCount
             with global_lock:
                 user_run_wait_map[user_name]['total_run_jobs'] += 1
@@ -444,7 +487,7 @@ def main():
                         user_run_wait_map[user_name]['successful_run_core_time_on_sites'][computingSite] = run_core_time
     print('computed run core time for all users')
     with open('{0}.preweighted'.format(dump_file), 'wb') as _f:
-        pickle.dump(user_run_wait_map, _f)
+        pickle.dump(_map_to_timedelta(user_run_wait_map), _f)
 
     # FIXME: for more accurate calculation. Not needed in most cases
     if False:
@@ -454,7 +497,13 @@ def main():
         tmp_user_set = set()
         nth_period = 0
         nth_period_in_range = 0
-        for period, duration, n_task_attempts, key_change, n_users, user_change in zip(*res_tasks_users):
+        # started jobs in each period, joined in one scan over jobs ordered by startTime
+        period_jobs_iter = join_jobs_to_periods(period_list,
+                                                task_jobspecs_db_read.read_started_jobspecs_in_order(),
+                                                start_index=JobspecsDB.column_names.index('startTime'),
+                                                end_index=JobspecsDB.column_names.index('endTime'))
+        user_index = JobspecsDB.column_names.index('userName')
+        for (period, duration, n_task_attempts, key_change, n_users, user_change), period_jobs in zip(zip(*res_tasks_users), period_jobs_iter):
             nth_period += 1
             # edges of the period
             period_start, period_end = period
@@ -469,13 +518,13 @@ def main():
                 continue
             # in-range period
             nth_period_in_range += 1
-            # array of every second within the duration
-            duration_ts_list = []
-            tmp_ts = period_start
-            while tmp_ts < period_end:
-                duration_ts_list.append(tmp_ts)
-                tmp_ts += one_second
-            duration_ts_array = np.array(duration_ts_list)
+            # jobs of each user in this period
+            period_user_jobs_dict = {}
+            for job_row in period_jobs:
+                period_user_jobs_dict.setdefault(job_row[user_index], []).append(job_row)
+            # array of every second within the duration, in epoch microseconds
+            duration_ts_array = np.arange(datetime_to_epoch_us(period_start), datetime_to_epoch_us(period_end),
+                                            one_second_us, dtype=np.int64)
             n_users_array = n_users_func(duration_ts_array)
             running_slots_array = running_slots_func(duration_ts_array)
             # array of multiplier (n_users / total_slots)
@@ -486,11 +535,8 @@ def main():
             # for key in tmp_key_set:
             def _handle_one_user_in_period(user_name):
                 try:
-                    # fill jobspec list of the user
-                    the_jobs = task_jobspecs_db_read.read_jobspecs( userName=user_name,
-                                                                    startTimeMax=period_end,
-                                                                    endTimeMin=period_start,
-                                                                    )
+                    # jobspec list of the user
+                    the_jobs = period_user_jobs_dict.get(user_name, [])
                     # numpy matrix for running period of all jobs
                     jobs_matrix_list = []
                     finished_jobs_matrix_list = []
@@ -502,16 +548,12 @@ def main():
                             computingSite in the_jobs:
                         if startTime in (None, 'NULL') or actualCoreCount in (None, 'NULL'):
                             continue
-                        one_job_slots_list = []
-                        for ts in duration_ts_list:
-                            if ts > range_end or ts < range_start:
-                                # outside the range
-                                one_job_slots_list.append(0)
-                            elif ts >= startTime and ts < endTime:
-                                # covered by job run time
-                                one_job_slots_list.append(actualCoreCount)
-                            else:
-                                one_job_slots_list.append(0)
+                        # cores over seconds within the range and covered by job run time
+                        start_us = datetime_to_epoch_us(startTime)
+                        end_us = datetime_to_epoch_us(endTime)
+                        one_job_slots_list = np.where((duration_ts_array >= range_start_us) & (duration_ts_array <= range_end_us)
+                                                        & (duration_ts_array >= start_us) & (duration_ts_array < end_us),
+                                                        actualCoreCount, 0)
                         jobs_matrix_list.append(one_job_slots_list)
                         if jobStatus == 'finished':
                             finished_jobs_matrix_list.append(one_job_slots_list)
@@ -527,8 +569,8 @@ def main():
                         finished_jobs_run_sec = np.sum(finished_jobs_run_sec_array)
                     # aggregate run time in map
                     with global_lock:
-                        user_run_wait_map[user_name]['total_run_time'] += jobs_run_sec*one_second
-                        user_run_wait_map[user_name]['total_successful_run_time'] += finished_jobs_run_sec*one_second
+                        user_run_wait_map[user_name]['total_run_time'] += jobs_run_sec*one_second_us
+                        user_run_wait_map[user_name]['total_successful_run_time'] += finished_jobs_run_sec*one_second_us
                 except Exception as e:
                     sys.stderr.write('_handle_one_user_in_period , {0}: {1}\n'.format(e.__class__.__name__, e))
                     sys.stderr.flush()
@@ -541,6 +583,7 @@ def main():
 
 
         # compute remaining values
+        user_run_wait_map = _map_to_timedelta(user_run_wait_map)
         for user_name in all_users_tasks_dict:
             v = user_run_wait_map[user_name]
             total_wait_time = v['total_taskful_time'] - v['total_run_time']
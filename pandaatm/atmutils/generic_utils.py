@@ -1,3 +1,11 @@
+import array
+import datetime
+
+import numpy as np
+
+from pandaatm.atmcore.core_utils import NULL_EPOCH_US, datetime_to_epoch_us, epoch_us_to_datetime
+
+
 #=== Functions =================================================
 
 def get_task_attempt_key_name(jediTaskID, attemptNr):
@@ -45,9 +53,178 @@ def update_set_by_change_tuple(orig_set, change_tuple):
 
 #=== Classes ===================================================
 
+# final statuses of task attempts
+task_attempt_final_statuses = ('finished', 'done', 'failed', 'aborted', 'broken')
+
+# placeholder of null code of final status
+NULL_STATUS_CODE = -1
+
+
+class TaskAttemptStore(object):
+    """
+    Compact store of task attempts; per-attempt values are kept in typed arrays, statuses as small int codes,
+    and timestamps as int64 microseconds since epoch. Status logs of all attempts share one pair of arrays,
+    where attempt i owns the items from statusStart[i] to statusStart[i] + statusCount[i].
+    A status appended to a log not at the end of the shared arrays moves the log to the end with as much
+    room again (statusCapacity), so appends are amortized O(1); the rows left behind are reclaimed by
+    compact(), run when they outnumber the live rows
+    """
+
+    def __init__(self):
+        # per-attempt arrays
+        self.jediTaskID = array.array('q')
+        self.attemptNr = array.array('i')
+        self.userCode = array.array('i')
+        self.startTime = array.array('q')
+        self.endTime = array.array('q')
+        self.finalStatus = array.array('h')
+        self.statusStart = array.array('q')
+        self.statusCount = array.array('i')
+        self.statusCapacity = array.array('i')
+        # shared status log arrays
+        self.statusCode = array.array('h')
+        self.statusTime = array.array('q')
+        # vocabularies of statuses and user names
+        self.status_vocab = []
+        self.status_code_dict = {}
+        self.user_vocab = []
+        self.user_code_dict = {}
+        # number of rows of shared status log arrays not owned by any attempt
+        self.n_dead_status_rows = 0
+
+    def __len__(self):
+        return len(self.jediTaskID)
+
+    def get_status_code(self, status):
+        """
+        get code of a status, adding it to the vocabulary if new
+        """
+        code = self.status_code_dict.get(status)
+        if code is None:
+            code = len(self.status_vocab)
+            self.status_vocab.append(status)
+            self.status_code_dict[status] = code
+        return code
+
+    def get_user_code(self, user_name):
+        """
+        get code of a user name, adding it to the vocabulary if new
+        """
+        code = self.user_code_dict.get(user_name)
+        if code is None:
+            code = len(self.user_vocab)
+            self.user_vocab.append(user_name)
+            self.user_code_dict[user_name] = code
+        return code
+
+    def add_attempt(self, jediTaskID, attemptNr, startTime, userName=None):
+        """
+        add a new task attempt and get its index
+        """
+        index = len(self.jediTaskID)
+        self.jediTaskID.append(jediTaskID)
+        self.attemptNr.append(attemptNr)
+        self.userCode.append(self.get_user_code(userName))
+        self.startTime.append(datetime_to_epoch_us(startTime))
+        self.endTime.append(NULL_EPOCH_US)
+        self.finalStatus.append(NULL_STATUS_CODE)
+        self.statusStart.append(len(self.statusCode))
+        self.statusCount.append(0)
+        self.statusCapacity.append(0)
+        return index
+
+    def append_status(self, index, status, modificationTime):
+        """
+        append a status to the log of the attempt at index
+        """
+        code = self.get_status_code(status)
+        timestamp = datetime_to_epoch_us(modificationTime)
+        head = self.statusStart[index]
+        count = self.statusCount[index]
+        tail = head + count
+        if tail == len(self.statusCode):
+            # at the end of shared arrays
+            self.statusCode.append(code)
+            self.statusTime.append(timestamp)
+        elif count < self.statusCapacity[index]:
+            # room left in place
+            self.statusCode[tail] = code
+            self.statusTime[tail] = timestamp
+        else:
+            # status logs of attempts interleaved; move the log of the attempt to the end with room to grow
+            capacity = max(2*(count + 1), 4)
+            # rows at the old place are left behind
+            self.n_dead_status_rows += max(count, self.statusCapacity[index])
+            self.statusStart[index] = len(self.statusCode)
+            self.statusCapacity[index] = capacity
+            self.statusCode.extend(self.statusCode[head:tail])
+            self.statusTime.extend(self.statusTime[head:tail])
+            self.statusCode.append(code)
+            self.statusTime.append(timestamp)
+            n_room = capacity - count - 1
+            self.statusCode.extend(array.array('h', bytes(2*n_room)))
+            self.statusTime.extend(array.array('q', bytes(8*n_room)))
+        self.statusCount[index] += 1
+        if self.n_dead_status_rows > len(self.statusCode) // 2:
+            self.compact()
+
+    def compact(self):
+        """
+        rewrite shared status log arrays with the logs of attempts contiguous in order of attempts
+        """
+        status_code_array = array.array('h')
+        status_time_array = array.array('q')
+        for index, (head, count) in enumerate(zip(self.statusStart, self.statusCount)):
+            self.statusStart[index] = len(status_code_array)
+            self.statusCapacity[index] = 0
+            status_code_array.extend(self.statusCode[head:head+count])
+            status_time_array.extend(self.statusTime[head:head+count])
+        self.statusCode = status_code_array
+        self.statusTime = status_time_array
+        self.n_dead_status_rows = 0
+
+    def get_status_list(self, index):
+        """
+        get list of (status, modificationTime) of the attempt at index
+        """
+        head = self.statusStart[index]
+        tail = head + self.statusCount[index]
+        return [ (self.status_vocab[code], epoch_us_to_datetime(ts))
+                    for code, ts in zip(self.statusCode[head:tail], self.statusTime[head:tail]) ]
+
+    @classmethod
+    def from_arrays(cls, arrays_dict, extra_meta):
+        """
+        get store and list of attempt indices from columnar arrays made by task_attempts_dict_to_arrays
+        """
+        store = cls()
+        for status in extra_meta['status_vocab']:
+            store.get_status_code(status)
+        for user_name in extra_meta['user_vocab']:
+            store.get_user_code(user_name)
+        status_offset_array = np.asarray(arrays_dict['statusOffset'])
+        null_final_status = store.status_code_dict.get(None)
+        final_status_array = np.array(arrays_dict['finalStatus'], dtype=np.int16)
+        if null_final_status is not None:
+            final_status_array[final_status_array == null_final_status] = NULL_STATUS_CODE
+        store.jediTaskID.frombytes(np.ascontiguousarray(arrays_dict['jediTaskID'], dtype=np.int64).tobytes())
+        store.attemptNr.frombytes(np.ascontiguousarray(arrays_dict['attemptNr'], dtype=np.int32).tobytes())
+        store.userCode.frombytes(np.ascontiguousarray(arrays_dict['userName'], dtype=np.int32).tobytes())
+        store.startTime.frombytes(np.ascontiguousarray(arrays_dict['startTime'], dtype=np.int64).tobytes())
+        store.endTime.frombytes(np.ascontiguousarray(arrays_dict['endTime'], dtype=np.int64).tobytes())
+        store.finalStatus.frombytes(final_status_array.tobytes())
+        store.statusStart.frombytes(np.ascontiguousarray(status_offset_array[:-1], dtype=np.int64).tobytes())
+        store.statusCount.frombytes(np.diff(status_offset_array).astype(np.int32).tobytes())
+        store.statusCapacity.frombytes(bytes(4*len(store.statusCount)))
+        store.statusCode.frombytes(np.ascontiguousarray(arrays_dict['statusCode'], dtype=np.int16).tobytes())
+        store.statusTime.frombytes(np.ascontiguousarray(arrays_dict['statusTime'], dtype=np.int64).tobytes())
+        return store, range(len(store))
+
+
 class TaskAttempt(object):
     """
-    Task Attempt object
+    Task Attempt object; standalone attempt with plain attributes.
+    Attempts of a TaskAttemptStore are accessed as TaskAttemptView with the same attributes and methods
     """
 
     __slots__ = [
@@ -89,17 +266,26 @@ class TaskAttempt(object):
         # compute attributes
         if self.statusList is None:
             self.statusList = []
+        if self.statusList:
+            self.attemptDuration = self.statusList[-1][1] - self.startTime
         self.keyName = get_task_attempt_key_name(self.jediTaskID, self.attemptNr)
         if endTime is not None and finalStatus is not None:
             self._set_complete(finalStatus=finalStatus, endTime=endTime)
 
+    @classmethod
+    def from_store(cls, store, index):
+        """
+        get view of the attempt at index of the store
+        """
+        return TaskAttemptView(store, index)
+
     def _set_complete(self, finalStatus, endTime):
         """
         set the task attempt complete
         """
         if endTime is None:
             raise RuntimeError('TaskAttempt: cannot set complete with endTime = None')
-        elif finalStatus not in ('finished', 'done', 'failed', 'aborted', 'broken'):
+        elif finalStatus not in task_attempt_final_statuses:
             raise RuntimeError('TaskAttempt: cannot set complete with invalid finalStatus')
         else:
             self.finalStatus = finalStatus
@@ -109,11 +295,11 @@ class TaskAttempt(object):
 
     def update_status(self, status, modificationTime):
         """
-        whether the task attempt is complete; i.e. terminated with a final status
+        append a status to the task attempt, and set it complete if the status is final
         """
         self.attemptDuration = modificationTime - self.startTime
         self.statusList.append((status, modificationTime))
-        if status in ('finished', 'done', 'failed', 'aborted', 'broken'):
+        if status in task_attempt_final_statuses:
             self._set_complete(finalStatus=status, endTime=modificationTime)
 
     def is_complete(self):
@@ -121,3 +307,199 @@ class TaskAttempt(object):
         whether the task attempt is complete; i.e. terminated with a final status
         """
         return self._is_complete
+
+
+class TaskAttemptView(object):
+    """
+    View of one attempt in a TaskAttemptStore, with the attributes and methods of TaskAttempt.
+    keyName, attemptDuration and statusList are built on access, so update the status log with update_status
+    rather than appending to statusList. A view is pickled as a standalone TaskAttempt of its own attempt
+    """
+
+    __slots__ = [
+            '_store',
+            '_index',
+        ]
+
+    __str__ = TaskAttempt.__str__
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __reduce__(self):
+        finalStatus = self.finalStatus if self.is_complete() else None
+        return (TaskAttempt, (self.jediTaskID, self.attemptNr, self.startTime,
+                                self.endTime, finalStatus, self.statusList, self.userName))
+
+    @property
+    def jediTaskID(self):
+        return self._store.jediTaskID[self._index]
+
+    @jediTaskID.setter
+    def jediTaskID(self, jediTaskID):
+        self._store.jediTaskID[self._index] = jediTaskID
+
+    @property
+    def attemptNr(self):
+        return self._store.attemptNr[self._index]
+
+    @attemptNr.setter
+    def attemptNr(self, attemptNr):
+        self._store.attemptNr[self._index] = attemptNr
+
+    @property
+    def keyName(self):
+        return get_task_attempt_key_name(self.jediTaskID, self.attemptNr)
+
+    @property
+    def userName(self):
+        return self._store.user_vocab[self._store.userCode[self._index]]
+
+    @userName.setter
+    def userName(self, userName):
+        self._store.userCode[self._index] = self._store.get_user_code(userName)
+
+    @property
+    def startTime(self):
+        return epoch_us_to_datetime(self._store.startTime[self._index])
+
+    @startTime.setter
+    def startTime(self, startTime):
+        self._store.startTime[self._index] = datetime_to_epoch_us(startTime)
+
+    @property
+    def endTime(self):
+        end_time = self._store.endTime[self._index]
+        if end_time == NULL_EPOCH_US:
+            return None
+        return epoch_us_to_datetime(end_time)
+
+    @endTime.setter
+    def endTime(self, endTime):
+        self._store.endTime[self._index] = NULL_EPOCH_US if endTime is None else datetime_to_epoch_us(endTime)
+
+    @property
+    def finalStatus(self):
+        code = self._store.finalStatus[self._index]
+        if code == NULL_STATUS_CODE:
+            raise AttributeError('finalStatus')
+        return self._store.status_vocab[code]
+
+    @finalStatus.setter
+    def finalStatus(self, finalStatus):
+        self._store.finalStatus[self._index] = self._store.get_status_code(finalStatus)
+
+    @property
+    def attemptDuration(self):
+        store = self._store
+        index = self._index
+        end_time = store.endTime[index]
+        if end_time == NULL_EPOCH_US:
+            # incomplete; till the last status if any
+            if store.statusCount[index] == 0:
+                raise AttributeError('attemptDuration')
+            end_time = store.statusTime[store.statusStart[index] + store.statusCount[index] - 1]
+        return datetime.timedelta(microseconds=(end_time - store.startTime[index]))
+
+    @property
+    def statusList(self):
+        return self._store.get_status_list(self._index)
+
+    @statusList.setter
+    def statusList(self, statusList):
+        # replace the status log; rows of the old one are left behind
+        store = self._store
+        store.n_dead_status_rows += max(store.statusCount[self._index], store.statusCapacity[self._index])
+        store.statusStart[self._index] = len(store.statusCode)
+        store.statusCount[self._index] = 0
+        store.statusCapacity[self._index] = 0
+        for status, modificationTime in (statusList or []):
+            store.append_status(self._index, status, modificationTime)
+
+    def _set_complete(self, finalStatus, endTime):
+        """
+        set the task attempt complete
+        """
+        if endTime is None:
+            raise RuntimeError('TaskAttempt: cannot set complete with endTime = None')
+        elif finalStatus not in task_attempt_final_statuses:
+            raise RuntimeError('TaskAttempt: cannot set complete with invalid finalStatus')
+        else:
+            self.finalStatus = finalStatus
+            self.endTime = endTime
+
+    def update_status(self, status, modificationTime):
+        """
+        append a status to the task attempt, and set it complete if the status is final
+        """
+        self._store.append_status(self._index, status, modificationTime)
+        if status in task_attempt_final_statuses:
+            self._set_complete(finalStatus=status, endTime=modificationTime)
+
+    def is_complete(self):
+        """
+        whether the task attempt is complete; i.e. terminated with a final status
+        """
+        return self._store.finalStatus[self._index] != NULL_STATUS_CODE
+
+
+#=== Columnar conversion of task attempts =====================
+
+def task_attempts_dict_to_arrays(task_attempts_dict):
+    """
+    get a tuple (arrays_dict, extra_meta) of columnar arrays from dict of TaskAttempt, for checkpoint
+    """
+    n_attempts = len(task_attempts_dict)
+    status_vocab = {}
+    user_vocab = {}
+    jedi_task_id_array = np.empty(n_attempts, dtype=np.int64)
+    attempt_nr_array = np.empty(n_attempts, dtype=np.int32)
+    start_time_array = np.empty(n_attempts, dtype=np.int64)
+    end_time_array = np.empty(n_attempts, dtype=np.int64)
+    final_status_array = np.empty(n_attempts, dtype=np.int16)
+    user_name_array = np.empty(n_attempts, dtype=np.int32)
+    status_offset_array = np.empty(n_attempts + 1, dtype=np.int64)
+    status_code_list = []
+    status_time_list = []
+    status_offset_array[0] = 0
+    for i, task_attempt in enumerate(task_attempts_dict.values()):
+        jedi_task_id_array[i] = task_attempt.jediTaskID
+        attempt_nr_array[i] = task_attempt.attemptNr
+        start_time_array[i] = datetime_to_epoch_us(task_attempt.startTime)
+        end_time_array[i] = NULL_EPOCH_US if task_attempt.endTime is None \
+                                else datetime_to_epoch_us(task_attempt.endTime)
+        final_status = getattr(task_attempt, 'finalStatus', None)
+        final_status_array[i] = status_vocab.setdefault(final_status, len(status_vocab))
+        user_name_array[i] = user_vocab.setdefault(task_attempt.userName, len(user_vocab))
+        for status, modificationTime in task_attempt.statusList:
+            status_code_list.append(status_vocab.setdefault(status, len(status_vocab)))
+            status_time_list.append(datetime_to_epoch_us(modificationTime))
+        status_offset_array[i+1] = len(status_code_list)
+    arrays_dict = {
+            'jediTaskID': jedi_task_id_array,
+            'attemptNr': attempt_nr_array,
+            'startTime': start_time_array,
+            'endTime': end_time_array,
+            'finalStatus': final_status_array,
+            'userName': user_name_array,
+            'statusOffset': status_offset_array,
+            'statusCode': np.array(status_code_list, dtype=np.int16),
+            'statusTime': np.array(status_time_list, dtype=np.int64),
+        }
+    extra_meta = {
+            'status_vocab': sorted(status_vocab, key=status_vocab.get),
+            'user_vocab': sorted(user_vocab, key=user_vocab.get),
+        }
+    return arrays_dict, extra_meta
+
+def task_attempts_dict_from_arrays(arrays_dict, extra_meta):
+    """
+    get dict of TaskAttempt from columnar arrays made by task_attempts_dict_to_arrays;
+    all the attempts are views of one TaskAttemptStore
+    """
+    store, index_range = TaskAttemptStore.from_arrays(arrays_dict, extra_meta)
+    task_attempts_dict = {}
+    for index, jediTaskID, attemptNr in zip(index_range, store.jediTaskID, store.attemptNr):
+        task_attempts_dict[(jediTaskID, attemptNr)] = TaskAttempt.from_store(store, index)
+    return task_attempts_dict
@@ -0,0 +1,295 @@
+import json
+import datetime
+
+from pandaatm.atmcore.core_utils import datetime_to_epoch_us, epoch_us_to_datetime
+from pandaatm.atmutils.generic_utils import TaskAttempt, task_attempt_final_statuses
+from pandaatm.atmutils.slow_task_analyzer_utils import job_status_code_map, JobsTimeConsumptionAggregator
+
+
+#=== Constants =================================================
+
+# message types
+MSG_TYPE_TASK_STATUS = 'task_status'
+MSG_TYPE_JOB_STATUS = 'job_status'
+
+# task statuses not regarded as stuck however long they last
+task_active_statuses = ('scouting', 'running', 'processing')
+
+
+#=== Functions =================================================
+
+def msg_time_to_datetime(timestamp):
+    """
+    get naive UTC datetime of a timestamp in message; epoch seconds or ISO format string
+    """
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp
+    if isinstance(timestamp, str):
+        try:
+            timestamp = float(timestamp)
+        except ValueError:
+            return datetime.datetime.fromisoformat(timestamp)
+    return epoch_us_to_datetime(round(timestamp * 1e6))
+
+
+#=== Classes ===================================================
+
+# live state of task attempts maintained from task status and job termination events
+class LiveTaskTracker(object):
+    """
+    Incremental counterpart of the slow task analysis, fed with events rather than DB scans.
+    Task status events segment attempts with the same rule as TaskStatusLogParser; a job termination event
+    is attributed to the open attempt of its task, whose time consumption is aggregated incrementally with
+    JobsTimeConsumptionAggregator, so that provisional statistics of open attempts are available any time.
+    Handlers return a list of flag dicts of slow symptoms found with the event, empty if none.
+    Open attempts are also checked as their events arrive, and flagged once as provisionally slow
+    (provisional=True) when they already last longer than task_duration_max with too little successful run time.
+    Attempt numbers count from 1 for tasks first seen by the tracker unless events carry attemptnr.
+    Tasks without task status event for open_attempt_max_age (in event time) are forgotten, checked every
+    expire_interval of event time; open attempts whose final status was never seen are dropped, and attempt
+    numbers of tasks coming back after that count from 1 again
+    """
+
+    def __init__(self, task_duration_max=datetime.timedelta(hours=168),
+                    successful_run_time_min_percent=80,
+                    each_status_max=datetime.timedelta(hours=12),
+                    open_attempt_max_age=datetime.timedelta(days=30),
+                    expire_interval=datetime.timedelta(hours=1)):
+        self.task_duration_max = task_duration_max
+        self.successful_run_time_min_percent = successful_run_time_min_percent
+        self.each_status_max = each_status_max
+        self.open_attempt_max_age = open_attempt_max_age
+        self.expire_interval = expire_interval
+        # open attempts; jediTaskID: TaskAttempt
+        self.open_attempt_dict = {}
+        # last status of open attempts; jediTaskID: (status, modificationTime)
+        self.last_status_dict = {}
+        # latest time of task status events, and time of the last expiry check
+        self.latest_event_time = None
+        self.last_expire_time = None
+        # attemptNr of the last attempt and time of the last task status event of tasks; jediTaskID: (attemptNr, time)
+        self.last_attempt_nr_dict = {}
+        # open attempts flagged provisionally
+        self.provisional_flagged_set = set()
+        # aggregators of ended jobs of open attempts; jediTaskID: JobsTimeConsumptionAggregator
+        self.job_aggregator_dict = {}
+        # counters
+        self.n_events_dict = {
+                'task_status': 0,
+                'job_status': 0,
+                'job_orphan': 0,
+                'ignored': 0,
+                'error': 0,
+                'expired': 0,
+            }
+
+    def get_open_attempt(self, jediTaskID):
+        """
+        get open TaskAttempt of a task, or None
+        """
+        return self.open_attempt_dict.get(jediTaskID)
+
+    def get_jobs_time_consumption_statistics(self, jediTaskID):
+        """
+        get time consumption statistics of ended jobs of the open attempt of a task
+        """
+        return self.job_aggregator_dict[jediTaskID].get_statistics()
+
+    def get_provisional_ratios(self, jediTaskID, now):
+        """
+        get (attempt duration, jobful time ratio, successful run time ratio) of the open attempt of a task till now
+        """
+        task_attempt = self.open_attempt_dict[jediTaskID]
+        attempt_start = datetime_to_epoch_us(task_attempt.startTime)
+        until = datetime_to_epoch_us(now)
+        jobful_time_ratio, successful_run_time_ratio = self.job_aggregator_dict[jediTaskID].get_ratios(attempt_start, until)
+        return now - task_attempt.startTime, jobful_time_ratio, successful_run_time_ratio
+
+    def on_task_status(self, jediTaskID, status, modificationTime, userName=None, attemptNr=None):
+        """
+        update with a task status change
+        """
+        self.n_events_dict['task_status'] += 1
+        flag_list = []
+        task_attempt = self.open_attempt_dict.get(jediTaskID)
+        if task_attempt is None:
+            # new attempt
+            if attemptNr is None:
+                attemptNr = self.last_attempt_nr_dict.get(jediTaskID, (0, None))[0] + 1
+            task_attempt = TaskAttempt(jediTaskID=jediTaskID, attemptNr=attemptNr, startTime=modificationTime,
+                                        userName=userName)
+            self.open_attempt_dict[jediTaskID] = task_attempt
+            self.job_aggregator_dict[jediTaskID] = JobsTimeConsumptionAggregator()
+        else:
+            # the previous status lasted till now
+            last_status, last_time = self.last_status_dict[jediTaskID]
+            if last_status not in task_active_statuses and modificationTime - last_time > self.each_status_max:
+                flag_list.append({
+                        'flag': 'TaskStatusLong',
+                        'jediTaskID': jediTaskID,
+                        'attemptNr': task_attempt.attemptNr,
+                        'status': last_status,
+                        'modificationTime': last_time,
+                        'duration': modificationTime - last_time,
+                    })
+        task_attempt.update_status(status, modificationTime)
+        self.last_status_dict[jediTaskID] = (status, modificationTime)
+        self.last_attempt_nr_dict[jediTaskID] = (task_attempt.attemptNr, modificationTime)
+        if status in task_attempt_final_statuses:
+            flag_list.extend(self._close_attempt(jediTaskID))
+        self._expire_open_attempts(modificationTime)
+        return flag_list
+
+    def _expire_open_attempts(self, event_time):
+        """
+        forget tasks without task status event for open_attempt_max_age, and drop their open attempts,
+        every expire_interval of event time
+        """
+        if self.latest_event_time is None or event_time > self.latest_event_time:
+            self.latest_event_time = event_time
+        if self.last_expire_time is None:
+            self.last_expire_time = self.latest_event_time
+        if self.latest_event_time - self.last_expire_time < self.expire_interval:
+            return
+        self.last_expire_time = self.latest_event_time
+        expire_before = self.latest_event_time - self.open_attempt_max_age
+        for jediTaskID, (_, last_time) in list(self.last_attempt_nr_dict.items()):
+            if last_time < expire_before:
+                del self.last_attempt_nr_dict[jediTaskID]
+                if jediTaskID in self.open_attempt_dict:
+                    del self.open_attempt_dict[jediTaskID]
+                    del self.job_aggregator_dict[jediTaskID]
+                    del self.last_status_dict[jediTaskID]
+                    self.provisional_flagged_set.discard(jediTaskID)
+                    self.n_events_dict['expired'] += 1
+
+    def on_job_end(self, jediTaskID, PandaID, jobStatus, creationTime, startTime, endTime):
+        """
+        update with a terminated job
+        """
+        job_aggregator = self.job_aggregator_dict.get(jediTaskID)
+        status_code = job_status_code_map.get(jobStatus)
+        if status_code is None or endTime is None or creationTime is None:
+            # not a job termination
+            self.n_events_dict['ignored'] += 1
+            return []
+        self.n_events_dict['job_status'] += 1
+        if job_aggregator is None or endTime < self.open_attempt_dict[jediTaskID].startTime:
+            # no open attempt to attribute to
+            self.n_events_dict['job_orphan'] += 1
+            return []
+        job_aggregator.add_job(PandaID, creationTime=datetime_to_epoch_us(creationTime),
+                                startTime=(None if startTime is None else datetime_to_epoch_us(startTime)),
+                                endTime=datetime_to_epoch_us(endTime), jobStatus=jobStatus)
+        return []
+
+    def _close_attempt(self, jediTaskID):
+        """
+        evaluate a complete attempt and drop its state
+        """
+        flag_list = []
+        task_attempt = self.open_attempt_dict.pop(jediTaskID)
+        job_aggregator = self.job_aggregator_dict.pop(jediTaskID)
+        del self.last_status_dict[jediTaskID]
+        self.provisional_flagged_set.discard(jediTaskID)
+        task_attempt_duration = task_attempt.attemptDuration
+        if task_attempt_duration > self.task_duration_max:
+            stats_dict = job_aggregator.get_statistics()
+            successful_run_time_ratio = stats_dict['finished']['run'] / task_attempt_duration
+            if successful_run_time_ratio*100 < self.successful_run_time_min_percent:
+                flag_list.append({
+                        'flag': 'SlowTaskAttempt',
+                        'jediTaskID': jediTaskID,
+                        'attemptNr': task_attempt.attemptNr,
+                        'finalStatus': task_attempt.finalStatus,
+                        'startTime': task_attempt.startTime,
+                        'endTime': task_attempt.endTime,
+                        'attemptDuration': task_attempt_duration,
+                        'userName': task_attempt.userName,
+                        'n_jobs': len(job_aggregator),
+                        'jobful_time_ratio': stats_dict['total']['total'] / task_attempt_duration,
+                        'successful_run_time_ratio': successful_run_time_ratio,
+                    })
+        return flag_list
+
+    def _check_open_attempt(self, jediTaskID, now):
+        """
+        flag the open attempt of a task once if it is already slow till now
+        """
+        task_attempt = self.open_attempt_dict.get(jediTaskID)
+        if task_attempt is None or jediTaskID in self.provisional_flagged_set \
+                or now - task_attempt.startTime <= self.task_duration_max:
+            return []
+        attempt_duration, jobful_time_ratio, successful_run_time_ratio = self.get_provisional_ratios(jediTaskID, now)
+        if successful_run_time_ratio*100 >= self.successful_run_time_min_percent:
+            return []
+        self.provisional_flagged_set.add(jediTaskID)
+        flag_dict = {
+                'flag': 'SlowTaskAttempt',
+                'provisional': True,
+                'jediTaskID': jediTaskID,
+                'attemptNr': task_attempt.attemptNr,
+                'status': self.last_status_dict[jediTaskID][0],
+                'startTime': task_attempt.startTime,
+                'attemptDuration': attempt_duration,
+                'userName': task_attempt.userName,
+                'n_jobs': len(self.job_aggregator_dict[jediTaskID]),
+                'jobful_time_ratio': jobful_time_ratio,
+                'successful_run_time_ratio': successful_run_time_ratio,
+            }
+        return [flag_dict]
+
+    def handle_message(self, msg_dict):
+        """
+        update with a message dict of task_status or job_status; get list of flags
+        """
+        msg_type = msg_dict.get('msg_type')
+        if msg_type == MSG_TYPE_TASK_STATUS:
+            jediTaskID = int(msg_dict['taskid'])
+            event_time = msg_time_to_datetime(msg_dict['timestamp'])
+            flag_list = self.on_task_status(jediTaskID=jediTaskID,
+                                            status=msg_dict['status'],
+                                            modificationTime=event_time,
+                                            userName=msg_dict.get('username'),
+                                            attemptNr=msg_dict.get('attemptnr'))
+        elif msg_type == MSG_TYPE_JOB_STATUS:
+            if msg_dict.get('taskid') is None:
+                self.n_events_dict['ignored'] += 1
+                return []
+            jediTaskID = int(msg_dict['taskid'])
+            event_time = msg_time_to_datetime(msg_dict.get('endtime', msg_dict.get('timestamp')))
+            flag_list = self.on_job_end(jediTaskID=jediTaskID,
+                                        PandaID=msg_dict.get('jobid'),
+                                        jobStatus=msg_dict['status'],
+                                        creationTime=msg_time_to_datetime(msg_dict.get('creationtime')),
+                                        startTime=msg_time_to_datetime(msg_dict.get('starttime')),
+                                        endTime=event_time)
+        else:
+            self.n_events_dict['ignored'] += 1
+            return []
+        # provisional slowness of the open attempt as of the event
+        if event_time is not None:
+            flag_list.extend(self._check_open_attempt(jediTaskID, event_time))
+        return flag_list
+
+    def process_msg(self, msg_data):
+        """
+        update with a message body of JSON string or dict; get list of flags
+        """
+        if isinstance(msg_data, (str, bytes)):
+            msg_data = json.loads(msg_data)
+        return self.handle_message(msg_data)
+
+    def process_msg_batch(self, msg_data_list):
+        """
+        update with a batch of message bodies in order; get list of flags. Bad messages are counted and skipped
+        """
+        flag_list = []
+        for msg_data in msg_data_list:
+            try:
+                flag_list.extend(self.process_msg(msg_data))
+            except (ValueError, KeyError, TypeError):
+                self.n_events_dict['error'] += 1
+        return flag_list
@@ -1,9 +1,37 @@
 import datetime
-import copy
+import heapq
 
+import numpy as np
+
+from pandaatm.atmcore.core_utils import NULL_EPOCH_US, datetime_to_epoch_us, timedelta_to_us, us_to_timedelta
 from pandaatm.atmutils.generic_utils import get_change_of_set
 
 
+#=== constants =================================================
+
+# job statuses classified in time consumption statistics, and their codes in time arrays
+job_status_code_map = {
+        'finished': 0,
+        'failed': 1,
+        'closed': 2,
+        'cancelled': 3,
+    }
+
+# pseudo status of jobs not terminated yet in JobsTimeConsumptionAggregator
+job_active_status = 'active'
+
+# columns and dtypes of numpy arrays of jobs; jobStatus in codes of job_status_code_map (-1 if other),
+# actualCoreCount -1 if null, and timestamps in epoch microseconds (NULL_EPOCH_US if null)
+job_array_column_dtypes = [
+        ('PandaID', np.int64),
+        ('jobStatus', np.int8),
+        ('actualCoreCount', np.int32),
+        ('creationTime', np.int64),
+        ('startTime', np.int64),
+        ('endTime', np.int64),
+    ]
+
+
 #=== classes ===================================================
 
 # job chronicle point class
@@ -68,8 +96,304 @@ class TaskChroniclePoint(object):
             setattr(self, k, v)
 
 
+# incremental aggregator of time consumption statistics of jobs
+class JobsTimeConsumptionAggregator(object):
+    """
+    Incremental counterpart of get_jobs_time_consumption_statistics_from_arrays, accepting jobs and job
+    creation/start/end events in any order. Adding a job only appends its chronicle points to a buffer.
+    At the next get_statistics(), the buffer is sorted into a run and kept with earlier runs as levels of
+    geometrically decreasing sizes; a level is merged into the one above only when it grows to half its
+    size, so each point is copied O(log n) times in total rather than all points at every call.
+    Snapshots of the sweep state are kept every snapshot_interval points, and get_statistics() re-sweeps,
+    vectorized with numpy, only the points from the earliest one changed since the last call, taken from
+    the tail of each level. The re-sweep is the cost of churn; it is short when points come roughly in
+    time order, e.g. new jobs of a running attempt.
+    Jobs not terminated yet are under pseudo status "active", and move to their status when they end.
+    Timestamps are in epoch microseconds
+    """
+
+    # categories are status_code*2 + (0 for wait, 1 for run), with the active status after the real ones
+    active_status_code = len(job_status_code_map)
+    n_categories = (len(job_status_code_map) + 1) * 2
+
+    def __init__(self, snapshot_interval=1024):
+        self.snapshot_interval = snapshot_interval
+        # levels of sorted chronicle points; list of (time array, category array, delta array), largest first
+        self.level_list = []
+        # new points to merge; (time, category, delta)
+        self.new_point_list = []
+        # jobs; PandaID: (creationTime, startTime, endTime, status_code) as added
+        self.job_dict = {}
+        # snapshots of sweep state; (time, counts before time, time consumed till time)
+        self.snapshot_list = []
+        # state after the last point
+        self.last_state = None
+        self.dirty_time = None
+
+    def __len__(self):
+        return len(self.job_dict)
+
+    def _job_points(self, creation_time, start_time, end_time, status_code):
+        """
+        get list of (time, category, delta) of a job, as in get_jobs_time_consumption_statistics_from_arrays
+        """
+        if end_time is not None and end_time != NULL_EPOCH_US:
+            if end_time < creation_time or status_code is None or status_code < 0:
+                # strange or unclassified job
+                return []
+            start_time = end_time if start_time in (None, NULL_EPOCH_US) else min(max(start_time, creation_time), end_time)
+            wait_cat, run_cat = status_code*2, status_code*2 + 1
+            return [(creation_time, wait_cat, 1), (start_time, wait_cat, -1), (start_time, run_cat, 1), (end_time, run_cat, -1)]
+        wait_cat, run_cat = self.active_status_code*2, self.active_status_code*2 + 1
+        if start_time in (None, NULL_EPOCH_US):
+            return [(creation_time, wait_cat, 1)]
+        start_time = max(start_time, creation_time)
+        return [(creation_time, wait_cat, 1), (start_time, wait_cat, -1), (start_time, run_cat, 1)]
+
+    def _insert_points(self, point_list):
+        if not point_list:
+            return
+        self.new_point_list += point_list
+        min_time = min(point[0] for point in point_list)
+        if self.dirty_time is None or min_time < self.dirty_time:
+            self.dirty_time = min_time
+
+    def _merge_new_points(self):
+        if not self.new_point_list:
+            return
+        new_time_array, new_category_array, new_delta_array = (np.array(x, dtype=np.int64) for x in zip(*self.new_point_list))
+        self.new_point_list = []
+        order = np.argsort(new_time_array, kind='stable')
+        self.level_list.append((new_time_array[order], new_category_array[order].astype(np.int8),
+                                new_delta_array[order].astype(np.int8)))
+        # merge levels while the last is at least half the size of the one above
+        while len(self.level_list) >= 2 and 2*len(self.level_list[-1][0]) >= len(self.level_list[-2][0]):
+            upper_level, lower_level = self.level_list[-2], self.level_list[-1]
+            self.level_list[-2:] = [_merge_sorted_points(upper_level, lower_level)]
+
+    def _get_points_since(self, time_min):
+        """
+        get (time array, category array, delta array) of points at or after time_min (all if None), in time order
+        """
+        tail_list = []
+        for level in self.level_list:
+            head = 0 if time_min is None else int(np.searchsorted(level[0], time_min, side='left'))
+            if head < len(level[0]):
+                tail_list.append(tuple(x[head:] for x in level))
+        if not tail_list:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int8)
+        if len(tail_list) == 1:
+            return tail_list[0]
+        merged = tail_list[0]
+        for tail in tail_list[1:]:
+            merged = _merge_sorted_points(merged, tail)
+        return merged
+
+    def _update_job(self, PandaID, new_job, point_list):
+        """
+        set a job to new_job (creationTime, startTime, endTime, status_code), and append to point_list
+        the points cancelling its old state and the points of its new state
+        """
+        old_job = self.job_dict.get(PandaID)
+        if old_job == new_job:
+            return
+        if old_job is not None:
+            # cancel points of the old state
+            point_list += [ (t, c, -d) for t, c, d in self._job_points(*old_job) ]
+        point_list += self._job_points(*new_job)
+        self.job_dict[PandaID] = new_job
+
+    def add_job(self, PandaID, creationTime, startTime=None, endTime=None, jobStatus=None):
+        """
+        add or update a job; times in epoch microseconds or None, and jobStatus is used only if endTime is set
+        """
+        status_code = None if endTime is None else job_status_code_map.get(jobStatus, -1)
+        point_list = []
+        self._update_job(PandaID, (creationTime, startTime, endTime, status_code), point_list)
+        self._insert_points(point_list)
+
+    def on_job_created(self, PandaID, creationTime):
+        old_job = self.job_dict.get(PandaID)
+        if old_job is None:
+            self.add_job(PandaID, creationTime)
+
+    def on_job_started(self, PandaID, startTime, creationTime=None):
+        old_job = self.job_dict.get(PandaID)
+        if old_job is not None:
+            creationTime = old_job[0]
+        if creationTime is None:
+            creationTime = startTime
+        if old_job is None or old_job[2] is None:
+            self.add_job(PandaID, creationTime, startTime)
+
+    def on_job_ended(self, PandaID, endTime, jobStatus, creationTime=None, startTime=None):
+        old_job = self.job_dict.get(PandaID)
+        if old_job is not None:
+            creationTime = old_job[0] if creationTime is None else creationTime
+            startTime = old_job[1] if startTime is None else startTime
+        if creationTime is None:
+            creationTime = endTime
+        self.add_job(PandaID, creationTime, startTime, endTime, jobStatus)
+
+    def add_jobspecs(self, jobspec_list):
+        """
+        add or update terminated jobs of jobspecs
+        """
+        point_list = []
+        for jobspec in jobspec_list:
+            creation_time = datetime_to_epoch_us(jobspec.creationTime)
+            start_time = None if jobspec.startTime in (None, 'NULL') else datetime_to_epoch_us(jobspec.startTime)
+            end_time = None if jobspec.endTime in (None, 'NULL') else datetime_to_epoch_us(jobspec.endTime)
+            status_code = None if end_time is None else job_status_code_map.get(jobspec.jobStatus, -1)
+            self._update_job(jobspec.PandaID, (creation_time, start_time, end_time, status_code), point_list)
+        self._insert_points(point_list)
+
+    def add_job_arrays(self, arrays_dict):
+        """
+        add or update terminated jobs of arrays of job_array_column_dtypes
+        """
+        point_list = []
+        for panda_id, creation_time, start_time, end_time, status_code in zip(arrays_dict['PandaID'].tolist(),
+                                                                            arrays_dict['creationTime'].tolist(),
+                                                                            arrays_dict['startTime'].tolist(),
+                                                                            arrays_dict['endTime'].tolist(),
+                                                                            arrays_dict['jobStatus'].tolist()):
+            new_job = (creation_time,
+                        None if start_time == NULL_EPOCH_US else start_time,
+                        None if end_time == NULL_EPOCH_US else end_time,
+                        None if end_time == NULL_EPOCH_US else status_code)
+            self._update_job(panda_id, new_job, point_list)
+        self._insert_points(point_list)
+
+    def _sweep(self):
+        """
+        sweep points from the last valid snapshot on, and update snapshots and state after the last point
+        """
+        if self.dirty_time is None and self.last_state is not None:
+            return
+        self._merge_new_points()
+        # drop snapshots after the dirty time
+        if self.dirty_time is not None:
+            while self.snapshot_list and self.snapshot_list[-1][0] > self.dirty_time:
+                self.snapshot_list.pop()
+        self.dirty_time = None
+        if self.snapshot_list:
+            snap_time, counts, consumed = self.snapshot_list[-1]
+        else:
+            snap_time = None
+            counts = np.zeros(self.n_categories, dtype=np.int64)
+            consumed = np.zeros(self.n_categories, dtype=np.float64)
+        time_array, category_array, delta_array = self._get_points_since(snap_time)
+        n_points = len(time_array)
+        if n_points == 0:
+            self.last_state = (snap_time, counts, consumed)
+            return
+        if snap_time is None:
+            snap_time = time_array[0]
+        # counts of each category before each point, as rows; segment j is from the previous point (or snapshot) to point j
+        delta_matrix = np.zeros((n_points, self.n_categories), dtype=np.int64)
+        delta_matrix[np.arange(n_points), category_array] = delta_array
+        counts_after_matrix = counts + np.cumsum(delta_matrix, axis=0)
+        counts_before_matrix = np.vstack((counts, counts_after_matrix[:-1]))
+        n_total_array = counts_before_matrix.sum(axis=1)
+        duration_array = np.diff(np.concatenate(([snap_time], time_array))).astype(np.float64)
+        nonzero_mask = n_total_array > 0
+        weight_array = np.zeros(n_points, dtype=np.float64)
+        weight_array[nonzero_mask] = duration_array[nonzero_mask] / n_total_array[nonzero_mask]
+        consumed_cum_matrix = consumed + np.cumsum(counts_before_matrix * weight_array[:, np.newaxis], axis=0)
+        # snapshots at first points of distinct times, every snapshot_interval points
+        snap_index_list = []
+        for index in range(self.snapshot_interval, n_points, self.snapshot_interval):
+            if snap_index_list and index <= snap_index_list[-1]:
+                continue
+            while index < n_points and time_array[index] == time_array[index-1]:
+                index += 1
+            if index >= n_points:
+                break
+            snap_index_list.append(index)
+        for index in snap_index_list:
+            self.snapshot_list.append((int(time_array[index]), counts_before_matrix[index].copy(), consumed_cum_matrix[index].copy()))
+        self.last_state = (int(time_array[-1]), counts_after_matrix[-1].copy(), consumed_cum_matrix[-1].copy())
+
+    def _get_consumed(self, until=None):
+        """
+        get array of time consumed (microseconds) of each category, till until if given
+        """
+        self._sweep()
+        if self.last_state is not None:
+            last_time, counts, consumed = self.last_state
+        else:
+            last_time, counts, consumed = None, np.zeros(self.n_categories, dtype=np.int64), np.zeros(self.n_categories)
+        consumed = consumed.copy()
+        n_total = counts.sum()
+        if until is not None and last_time is not None and until > last_time and n_total > 0:
+            # provisional till until
+            consumed += counts * ((until - last_time) / n_total)
+        return consumed
+
+    def get_statistics(self, until=None, in_us=False):
+        """
+        get statistics of time consumption as get_jobs_time_consumption_statistics, plus the pseudo status "active"
+        of jobs not terminated, which are regarded as going on till until (epoch microseconds) if given
+        """
+        consumed = self._get_consumed(until)
+        status_code_list = list(job_status_code_map.values()) + [self.active_status_code]
+        status_list = list(job_status_code_map) + [job_active_status]
+        return _make_time_consumption_stats_dict(consumed, status_code_list, status_list, in_us)
+
+    def get_ratios(self, attempt_start, until):
+        """
+        get (jobful time ratio, successful run time ratio) of an attempt from attempt_start till until (epoch microseconds)
+        """
+        attempt_duration = until - attempt_start
+        if attempt_duration <= 0:
+            return 0., 0.
+        consumed = self._get_consumed(until)
+        finished_run_category = job_status_code_map['finished']*2 + 1
+        return float(consumed.sum()) / attempt_duration, float(consumed[finished_run_category]) / attempt_duration
+
+
 #=== methods ===================================================
 
+def _merge_sorted_points(points_a, points_b):
+    """
+    merge two tuples of (time array, category array, delta array) sorted by time; points of points_a first on ties
+    """
+    time_array = np.concatenate((points_a[0], points_b[0]))
+    # stable sort of two sorted runs is a linear merge
+    order = np.argsort(time_array, kind='stable')
+    category_array = np.concatenate((points_a[1], points_b[1]))
+    delta_array = np.concatenate((points_a[2], points_b[2]))
+    return time_array[order], category_array[order], delta_array[order]
+
+def _make_time_consumption_stats_dict(consumed, status_code_list, status_list, in_us=False):
+    """
+    get dict of statistics of time consumption from array of time consumed (microseconds) of each category,
+    i.e. status_code*2 + (0 for wait, 1 for run); durations are rounded to integer microseconds, in timedelta unless in_us
+    """
+    consumed_us_list = [ round(float(x)) for x in consumed ]
+    time_consumption_stats_dict = {}
+    total_dict = {
+            'run': 0,
+            'wait': 0,
+            'total': 0,
+        }
+    for status, status_code in zip(status_list, status_code_list):
+        status_dict = {
+                'wait': consumed_us_list[status_code*2],
+                'run': consumed_us_list[status_code*2 + 1],
+            }
+        status_dict['total'] = status_dict['wait'] + status_dict['run']
+        for dur_type in total_dict:
+            total_dict[dur_type] += status_dict[dur_type]
+        time_consumption_stats_dict[status] = status_dict
+    time_consumption_stats_dict['total'] = total_dict
+    if not in_us:
+        for status_dict in time_consumption_stats_dict.values():
+            for dur_type in status_dict:
+                status_dict[dur_type] = us_to_timedelta(status_dict[dur_type])
+    return time_consumption_stats_dict
+
 def get_job_durations(jobspec):
     """
     get wait_duration and run_duration of a jobspec
@@ -86,186 +410,117 @@ def get_job_durations(jobspec):
         run_duration = jobspec.endTime - start_time
     return wait_duration, run_duration
 
-def get_jobs_time_consumption_statistics(jobspec_list):
+def get_job_durations_from_arrays(arrays_dict):
     """
-    get statistics of time consumption of jobs, classified by different types
+    get arrays of wait and run durations in microseconds of jobs as get_job_durations, from arrays of jobspecs_to_time_arrays
+    :return: (wait_duration_array, run_duration_array)
+    :rtype: tuple
     """
-    # get chronicle points of the jobs and sort in time order
-    chronicle_point_list = []
+    creation_time_array = arrays_dict['creationTime']
+    end_time_array = arrays_dict['endTime']
+    start_time_array = np.where(arrays_dict['startTime'] == NULL_EPOCH_US,
+                                end_time_array,
+                                np.maximum(arrays_dict['startTime'], creation_time_array))
+    return start_time_array - creation_time_array, end_time_array - start_time_array
+
+def get_jobs_time_consumption_statistics(jobspec_list, in_us=False):
+    """
+    get statistics of time consumption of jobs, classified by different types;
+    durations in timedelta, or integer microseconds if in_us.
+    A job listed more than once is counted once; KeyError is raised for jobs of other statuses
+    """
+    # one jobspec per PandaID
+    jobspec_list = list({ jobspec.PandaID: jobspec for jobspec in jobspec_list }.values())
     for jobspec in jobspec_list:
-        # skip very strange jobs with endTime < creationTime
-        if jobspec.endTime < jobspec.creationTime:
-            print('strange job pandaid={0} has endTime < creationTime'.format(jobspec.PandaID))
-            continue
-        for attr in ['creationTime', 'startTime', 'endTime']:
-            timestamp = getattr(jobspec, attr)
-            if timestamp in (None, 'NULL'):
-                continue
-            chronicle_point = JobChroniclePoint(
-                                    timestamp=timestamp,
-                                    type=attr,
-                                    PandaID=jobspec.PandaID,
-                                    jobStatus=jobspec.jobStatus,
-                                )
-            chronicle_point_list.append(chronicle_point)
-    chronicle_point_list.sort()
-    # initialization
-    duration_list = []
-    n_jobs_in_durations_dict = {
-            'finished': {
-                'run': [],
-                'wait': [],
-            },
-            'failed': {
-                'run': [],
-                'wait': [],
-            },
-            'closed': {
-                'run': [],
-                'wait': [],
-            },
-            'cancelled': {
-                'run': [],
-                'wait': [],
-            },
-        }
-    time_consumption_stats_dict = {
-            'finished': {
-                'run': datetime.timedelta(),
-                'wait': datetime.timedelta(),
-                'total': datetime.timedelta(),
-            },
-            'failed': {
-                'run': datetime.timedelta(),
-                'wait': datetime.timedelta(),
-                'total': datetime.timedelta(),
-            },
-            'closed': {
-                'run': datetime.timedelta(),
-                'wait': datetime.timedelta(),
-                'total': datetime.timedelta(),
-            },
-            'cancelled': {
-                'run': datetime.timedelta(),
-                'wait': datetime.timedelta(),
-                'total': datetime.timedelta(),
-            },
-            'total': {
-                'run': datetime.timedelta(),
-                'wait': datetime.timedelta(),
-                'total': datetime.timedelta(),
-            },
-        }
-    jobs_record_dict = {
-            'finished': {
-                'run': set(),
-                'wait': set(),
-            },
-            'failed': {
-                'run': set(),
-                'wait': set(),
-            },
-            'closed': {
-                'run': set(),
-                'wait': set(),
-            },
-            'cancelled': {
-                'run': set(),
-                'wait': set(),
-            },
+        if jobspec.jobStatus not in job_status_code_map and not jobspec.endTime < jobspec.creationTime:
+            raise KeyError(jobspec.jobStatus)
+    return get_jobs_time_consumption_statistics_from_arrays(jobspecs_to_time_arrays(jobspec_list), in_us=in_us)
+
+def _datetimes_to_epoch_us_array(timestamp_list):
+    return np.array(timestamp_list, dtype='datetime64[us]').view(np.int64)
+
+def jobspecs_to_time_arrays(jobspec_list):
+    """
+    get dict of arrays of jobs for get_jobs_time_consumption_statistics_from_arrays;
+    timestamps in epoch microseconds (NULL_EPOCH_US if null) and jobStatus in codes of job_status_code_map (-1 if other)
+    """
+    # datetimes are converted by numpy at once; null ones become NaT, i.e. NULL_EPOCH_US
+    creation_time_array = _datetimes_to_epoch_us_array([ jobspec.creationTime for jobspec in jobspec_list ])
+    start_time_array = _datetimes_to_epoch_us_array([ None if jobspec.startTime == 'NULL' else jobspec.startTime
+                                                        for jobspec in jobspec_list ])
+    end_time_array = _datetimes_to_epoch_us_array([ jobspec.endTime for jobspec in jobspec_list ])
+    status_code_array = np.array([ job_status_code_map.get(jobspec.jobStatus, -1) for jobspec in jobspec_list ],
+                                    dtype=np.int8)
+    arrays_dict = {
+            'creationTime': creation_time_array,
+            'startTime': start_time_array,
+            'endTime': end_time_array,
+            'jobStatus': status_code_array,
         }
-    previous_point = None
-    # loop over chronicle points
-    for chronicle_point in chronicle_point_list:
-        if previous_point is not None:
-            # duration
-            duration = chronicle_point.timestamp - previous_point.timestamp
-            # record duration
-            duration_list.append(duration)
-            # from previous point
-            status = previous_point.jobStatus
-            pandaid = previous_point.PandaID
-            cptype = previous_point.type
-            if cptype == 'creationTime':
-                # job waiting in this duration
-                jobs_record_dict[status]['wait'].add(pandaid)
-            elif cptype == 'startTime':
-                # job running in this duration
-                jobs_record_dict[status]['wait'].discard(pandaid)
-                jobs_record_dict[status]['run'].add(pandaid)
-            elif cptype == 'endTime':
-                # job ended, clear from temp records
-                jobs_record_dict[status]['wait'].discard(pandaid)
-                jobs_record_dict[status]['run'].discard(pandaid)
-            else:
-                # should not happen
-                raise RuntimeError('Bad type of chronicle point: {0}'.format(cptype))
-            # compute number of jobs in this duration
-            n_total_jobs = 0
-            for _status in ['finished', 'failed', 'closed', 'cancelled']:
-                for _dur_type in ['wait', 'run']:
-                    n_total_jobs += len(jobs_record_dict[_status][_dur_type])
-            # aggregate time consumed in stats and record n_jobs
-            for _status in ['finished', 'failed', 'closed', 'cancelled']:
-                for _dur_type in ['wait', 'run']:
-                    n_jobs = len(jobs_record_dict[_status][_dur_type])
-                    n_jobs_in_durations_dict[_status][_dur_type].append(n_jobs)
-                    if n_total_jobs > 0:
-                        ratio = n_jobs / n_total_jobs
-                        time_consumed = duration * ratio
-                        time_consumption_stats_dict[_status][_dur_type] += time_consumed
-                        time_consumption_stats_dict['total'][_dur_type] += time_consumed
-                        time_consumption_stats_dict[_status]['total'] += time_consumed
-                        time_consumption_stats_dict['total']['total'] += time_consumed
-        # prepare for next loop
-        previous_point = chronicle_point
-    # handle after last loop
-    if previous_point is not None:
-        _status = previous_point.jobStatus
-        _pandaid = previous_point.PandaID
-        _cptype = previous_point.type
-        if _cptype == 'creationTime':
-            # job waiting in this duration
-            jobs_record_dict[_status]['wait'].add(_pandaid)
-        elif _cptype == 'startTime':
-            # job running in this duration
-            jobs_record_dict[_status]['wait'].discard(_pandaid)
-            jobs_record_dict[_status]['run'].add(_pandaid)
-        elif _cptype == 'endTime':
-            # job ended, clear from temp records
-            jobs_record_dict[_status]['wait'].discard(_pandaid)
-            jobs_record_dict[_status]['run'].discard(_pandaid)
-    # check
-    n_durations = len(duration_list)
-    for _status in ['finished', 'failed', 'closed', 'cancelled']:
-        for _dur_type in ['wait', 'run']:
-            # with jobs left over; should not happen
-            if len(jobs_record_dict[_status][_dur_type]) > 0:
-                raise RuntimeError('still some jobs left over: {0}'.format(jobs_record_dict))
-            # differnt number of job-duration records; should not happen
-            n_jobs_records = len(n_jobs_in_durations_dict[_status][_dur_type])
-            if n_jobs_records != n_durations:
-                raise RuntimeError('numbers of job-duration records do not match: {0}_{1} has {2} != {3}'.format(
-                                                                    _status, _dur_type, n_jobs_records, n_durations))
-    # summary
-    summary_dict = copy.deepcopy(time_consumption_stats_dict)
+    return arrays_dict
+
+def get_jobs_time_consumption_statistics_from_arrays(arrays_dict, in_us=False):
+    """
+    get statistics of time consumption of jobs as get_jobs_time_consumption_statistics,
+    from arrays of jobspecs_to_time_arrays, vectorized with numpy.
+    Job startTime earlier than creationTime is taken as creationTime
+    """
+    creation_time_array = np.asarray(arrays_dict['creationTime'])
+    start_time_array = np.asarray(arrays_dict['startTime'])
+    end_time_array = np.asarray(arrays_dict['endTime'])
+    status_code_array = np.asarray(arrays_dict['jobStatus'])
+    # skip very strange jobs with endTime < creationTime, and jobs of other statuses
+    valid_mask = (end_time_array >= creation_time_array) & (status_code_array >= 0)
+    creation_time_array = creation_time_array[valid_mask]
+    start_time_array = start_time_array[valid_mask]
+    end_time_array = end_time_array[valid_mask]
+    status_code_array = status_code_array[valid_mask].astype(np.int64)
+    # jobs wait in [creationTime, startTime) and run in [startTime, endTime); never run if startTime is null
+    start_time_array = np.where(start_time_array == NULL_EPOCH_US,
+                                end_time_array,
+                                np.clip(start_time_array, creation_time_array, end_time_array))
+    # chronicle points of wait/run of each status in time order; category = status_code*2 + (0 for wait, 1 for run)
+    n_jobs = len(creation_time_array)
+    timestamp_array = np.concatenate((creation_time_array, start_time_array, start_time_array, end_time_array))
+    category_array = np.concatenate((status_code_array*2, status_code_array*2, status_code_array*2 + 1, status_code_array*2 + 1))
+    delta_array = np.concatenate((np.ones(n_jobs), -np.ones(n_jobs), np.ones(n_jobs), -np.ones(n_jobs)))
+    order = np.argsort(timestamp_array, kind='stable')
+    timestamp_array = timestamp_array[order]
+    category_array = category_array[order]
+    delta_array = delta_array[order]
+    # durations between consecutive chronicle points
+    duration_array = np.diff(timestamp_array).astype(np.float64)
+    # number of jobs of each category in each duration
+    n_categories = len(job_status_code_map)*2
+    n_jobs_array_list = [ np.cumsum(np.where(category_array == category, delta_array, 0))[:-1]
+                            for category in range(n_categories) ]
+    n_total_jobs_array = np.sum(n_jobs_array_list, axis=0) if n_jobs > 0 else np.zeros(0)
+    nonzero_mask = n_total_jobs_array > 0
+    weighted_duration_array = np.zeros_like(duration_array)
+    weighted_duration_array[nonzero_mask] = duration_array[nonzero_mask] / n_total_jobs_array[nonzero_mask]
+    # aggregate time consumed in stats
+    consumed = [ np.dot(weighted_duration_array, n_jobs_array_list[category]) if n_jobs > 0 else 0
+                    for category in range(n_categories) ]
+    time_consumption_stats_dict = _make_time_consumption_stats_dict(consumed, list(job_status_code_map.values()),
+                                                                    list(job_status_code_map), in_us)
     # return
-    return summary_dict
+    return time_consumption_stats_dict
 
 def get_total_jobs_run_core_time(jobspec_list):
     """
     get sum of run core time (~ cputime) and only successful one of all jobs
     """
-    run_core_time = datetime.timedelta()
-    successful_run_core_time = datetime.timedelta()
+    run_core_time = 0
+    successful_run_core_time = 0
     for jobspec in jobspec_list:
+        core_time = 0
         wait_duration, run_duration = get_job_durations(jobspec)
         if run_duration and jobspec.actualCoreCount not in (None, 'NULL'):
-            core_time = run_duration*jobspec.actualCoreCount
+            core_time = timedelta_to_us(run_duration)*jobspec.actualCoreCount
             run_core_time += core_time
         if jobspec.jobStatus == 'finished':
             successful_run_core_time += core_time
-    return run_core_time, successful_run_core_time
+    return us_to_timedelta(run_core_time), us_to_timedelta(successful_run_core_time)
 
 def get_task_attempts_in_each_duration(task_attempt_dict):
     """
@@ -467,6 +722,31 @@ def get_tasks_users_in_each_duration(all_task_attempts_dict):
             n_tasks_in_duration_list, task_attempt_change_in_duration_list,
             n_users_in_duration_list, user_name_change_in_duration_list)
 
+def join_jobs_to_periods(period_list, job_row_iter, start_index, end_index):
+    """
+    assign jobs to periods in one pass; i.e. for each (period_start, period_end) in period_list (sorted in time order),
+    yield the list of job rows with startTime <= period_end and endTime >= period_start.
+    job_row_iter must yield rows sorted by startTime, where startTime and endTime are at start_index and end_index
+    """
+    job_row_iter = iter(job_row_iter)
+    next_row = next(job_row_iter, None)
+    active_row_dict = {}
+    end_time_heap = []
+    n_rows = 0
+    for period_start, period_end in period_list:
+        # add jobs started before end of the period
+        while next_row is not None and next_row[start_index] <= period_end:
+            if next_row[end_index] is not None:
+                active_row_dict[n_rows] = next_row
+                heapq.heappush(end_time_heap, (next_row[end_index], n_rows))
+                n_rows += 1
+            next_row = next(job_row_iter, None)
+        # remove jobs ended before start of the period
+        while end_time_heap and end_time_heap[0][0] < period_start:
+            _, row_id = heapq.heappop(end_time_heap)
+            del active_row_dict[row_id]
+        yield list(active_row_dict.values())
+
 
 #=== test functions of bad jobs ===============================
 
@@ -0,0 +1,537 @@
+import datetime
+
+import numpy as np
+
+from pandaatm.atmcore.core_utils import NULL_EPOCH_US, datetime_to_epoch_us
+from pandaatm.atmutils.task_status_log_parser import parse_task_status_log, task_attempt_to_dict
+from pandaatm.atmutils.slow_task_analyzer_utils import get_jobs_time_consumption_statistics_from_arrays
+
+
+#=== Constants =================================================
+
+# one second and one hour in microseconds
+_SEC = 10**6
+_HOUR = 3600 * _SEC
+
+# job statuses and their probabilities
+job_status_list = ['finished', 'failed', 'closed', 'cancelled']
+job_status_probs = [0.80, 0.12, 0.05, 0.03]
+
+# final statuses of task attempts and their probabilities, for retried (non-last) and last attempts
+retried_final_status_list = ['finished', 'failed']
+retried_final_status_probs = [0.6, 0.4]
+last_final_status_list = ['done', 'finished', 'failed', 'broken', 'aborted']
+last_final_status_probs = [0.80, 0.10, 0.05, 0.03, 0.02]
+
+# numbers of cores of jobs and their probabilities
+core_count_list = [1, 8]
+core_count_probs = [0.7, 0.3]
+
+# columns of jobs with the same meanings as in JobSpec
+job_columns = ['PandaID', 'jediTaskID', 'attemptNr', 'userName', 'jobStatus', 'actualCoreCount',
+                'creationTime', 'startTime', 'endTime', 'computingSite']
+
+
+#=== Functions =================================================
+
+def _us_array_to_datetime_list(us_array):
+    """
+    get list of naive UTC datetime (None for null) from int64 epoch microseconds
+    """
+    ret_list = us_array.astype('datetime64[us]').astype(object).tolist()
+    if np.any(us_array == NULL_EPOCH_US):
+        for i in np.flatnonzero(us_array == NULL_EPOCH_US).tolist():
+            ret_list[i] = None
+    return ret_list
+
+def _zipf_weights(n, exponent):
+    """
+    get normalized weights of zipf-like popularity over n items
+    """
+    weights = 1. / np.arange(1, n + 1)**exponent
+    return weights / weights.sum()
+
+
+#=== Classes ===================================================
+
+# job spec of synthetic jobs; has the attributes of JobSpec that ATM uses
+class SyntheticJobSpec(object):
+
+    __slots__ = [
+            'PandaID',
+            'jediTaskID',
+            'jobStatus',
+            'actualCoreCount',
+            'currentPriority',
+            'creationTime',
+            'startTime',
+            'endTime',
+            'computingSite',
+            'transExitCode',
+            'pilotErrorCode',
+            'pilotErrorDiag',
+            'exeErrorCode',
+            'exeErrorDiag',
+            'ddmErrorCode',
+            'ddmErrorDiag',
+            'brokerageErrorCode',
+            'brokerageErrorDiag',
+            'jobDispatcherErrorCode',
+            'jobDispatcherErrorDiag',
+            'taskBufferErrorCode',
+            'taskBufferErrorDiag',
+            'supErrorCode',
+            'supErrorDiag',
+        ]
+
+    def __init__(self, **kwargs):
+        for attr in self.__slots__:
+            setattr(self, attr, None)
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+
+# synthetic PanDA workload
+class SyntheticWorkload(object):
+    """
+    Seeded generator of synthetic JEDI tasks, task status logs and archived jobs. Task sizes are heavy-tailed
+    (pareto) and sum up to about n_jobs before retries, users and sites are zipf-like, tasks are retried in
+    multiple attempts, wait and run times of jobs are lognormal, and some attempts have jobless gaps.
+    Jobs are generated with vectorized numpy operations and kept as int64 epoch microseconds
+    (10M jobs take a few seconds and about 1.3 GB at peak);
+    objects in the shapes the DB methods return are built on demand
+    """
+
+    def __init__(self, n_jobs=100000, seed=0, mean_task_size=100, n_users=200, n_sites=100,
+                    start_time=datetime.datetime(2023, 1, 1), span_days=30,
+                    task_size_alpha=1.2, retry_prob=0.3, max_attempts=5, gap_prob=0.2,
+                    wait_median_hours=0.5, run_median_hours=2.):
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.start_time = start_time
+        self.user_vocab = [ 'user{0:04d}'.format(i) for i in range(n_users) ]
+        self.site_vocab = [ 'SITE_{0:03d}'.format(i) for i in range(n_sites) ]
+        self.job_status_vocab = list(job_status_list)
+        n_tasks = max(1, n_jobs // mean_task_size)
+        self._generate_tasks(n_tasks, n_jobs, span_days, task_size_alpha, retry_prob, max_attempts)
+        self._generate_jobs(gap_prob, wait_median_hours, run_median_hours)
+        self._generate_status_logs()
+
+    def _generate_tasks(self, n_tasks, n_jobs, span_days, task_size_alpha, retry_prob, max_attempts):
+        """
+        generate tasks and their attempts with numbers of jobs
+        """
+        rng = self.rng
+        # tasks ordered by creation time
+        creation_array = np.sort(rng.integers(0, span_days * 24 * _HOUR, n_tasks)) + datetime_to_epoch_us(self.start_time)
+        self.task_id_array = np.arange(n_tasks, dtype=np.int64) + 10000000
+        self.task_user_array = rng.choice(len(self.user_vocab), size=n_tasks,
+                                            p=_zipf_weights(len(self.user_vocab), 1.1)).astype(np.int32)
+        self.task_creation_array = creation_array
+        # heavy-tailed task sizes summing up to about n_jobs
+        size_weights = rng.pareto(task_size_alpha, n_tasks) + 1.
+        task_size_array = np.maximum(1, np.round(size_weights / size_weights.sum() * n_jobs)).astype(np.int64)
+        # attempts; retries rerun a fraction of jobs of the previous attempt
+        n_attempts_array = np.minimum(rng.geometric(1. - retry_prob, n_tasks), max_attempts)
+        attempt_task_index = np.repeat(np.arange(n_tasks), n_attempts_array)
+        attempt_first_index = np.concatenate(([0], np.cumsum(n_attempts_array)[:-1]))
+        attempt_nr_array = np.arange(len(attempt_task_index)) - np.repeat(attempt_first_index, n_attempts_array) + 1
+        rerun_fraction = np.where(attempt_nr_array == 1, 1., rng.uniform(0.05, 0.5, len(attempt_task_index)))
+        log_fraction = np.log(rerun_fraction)
+        cum_log_fraction = np.cumsum(log_fraction)
+        cum_log_fraction -= np.repeat(cum_log_fraction[attempt_first_index] - log_fraction[attempt_first_index], n_attempts_array)
+        self.attempt_task_index = attempt_task_index
+        self.attempt_nr_array = attempt_nr_array.astype(np.int32)
+        self.attempt_is_last = np.repeat(n_attempts_array, n_attempts_array) == attempt_nr_array
+        self.attempt_first_index = attempt_first_index
+        self.n_attempts_array = n_attempts_array
+        self.attempt_n_jobs = np.maximum(1, np.round(task_size_array[attempt_task_index] * np.exp(cum_log_fraction))).astype(np.int64)
+
+    def _generate_jobs(self, gap_prob, wait_median_hours, run_median_hours):
+        """
+        generate jobs of all attempts and timelines of attempts
+        """
+        rng = self.rng
+        n_attempts = len(self.attempt_task_index)
+        attempt_n_jobs = self.attempt_n_jobs
+        n_jobs = int(attempt_n_jobs.sum())
+        job_offset_array = np.concatenate(([0], np.cumsum(attempt_n_jobs)))
+        job_attempt_index = np.repeat(np.arange(n_attempts), attempt_n_jobs)
+        # per-attempt timeline relative to attempt start: setup delay, submission span, jobless gap, finalization delay
+        setup_array = rng.exponential(600 * _SEC, n_attempts).astype(np.int64) + 60 * _SEC
+        span_array = (rng.lognormal(np.log(2 * _HOUR), 0.8, n_attempts) * np.sqrt(attempt_n_jobs) / 3).astype(np.int64) + 60 * _SEC
+        has_gap_array = rng.random(n_attempts) < gap_prob
+        gap_pos_array = setup_array + (rng.random(n_attempts) * span_array).astype(np.int64)
+        gap_len_array = np.where(has_gap_array, rng.exponential(6 * _HOUR, n_attempts).astype(np.int64) + _HOUR, 0)
+        finalize_array = rng.exponential(1200 * _SEC, n_attempts).astype(np.int64) + 10 * _SEC
+        # jobs relative to attempt start
+        creation_rel = setup_array[job_attempt_index] + (rng.random(n_jobs) * span_array[job_attempt_index]).astype(np.int64)
+        creation_rel += np.where(creation_rel > gap_pos_array[job_attempt_index], gap_len_array[job_attempt_index], 0)
+        wait_array = rng.lognormal(np.log(wait_median_hours * _HOUR), 1.0, n_jobs).astype(np.int64) + _SEC
+        run_array = rng.lognormal(np.log(run_median_hours * _HOUR), 0.8, n_jobs).astype(np.int64) + _SEC
+        job_status_array = rng.choice(len(job_status_list), size=n_jobs, p=job_status_probs).astype(np.int16)
+        # some closed or cancelled jobs never start
+        not_started = (job_status_array >= job_status_list.index('closed')) & (rng.random(n_jobs) < 0.5)
+        start_rel = creation_rel + wait_array
+        end_rel = np.where(not_started, start_rel, start_rel + run_array)
+        # attempt durations and absolute attempt starts; attempts of a task are sequential with retry delays
+        attempt_duration = np.maximum.reduceat(end_rel, job_offset_array[:-1]) + finalize_array
+        retry_delay = np.where(self.attempt_nr_array == 1, 0, rng.exponential(12 * _HOUR, n_attempts).astype(np.int64))
+        cum_time = np.cumsum(retry_delay + attempt_duration) - attempt_duration
+        cum_time -= np.repeat(cum_time[self.attempt_first_index], self.n_attempts_array)
+        self.attempt_start_array = self.task_creation_array[self.attempt_task_index] + cum_time
+        self.attempt_end_array = self.attempt_start_array + attempt_duration
+        self.attempt_setup_array = setup_array
+        self.attempt_gap_array = np.where(has_gap_array, gap_pos_array, -1)
+        self.attempt_gap_len_array = gap_len_array
+        # absolute job times
+        job_attempt_start = self.attempt_start_array[job_attempt_index]
+        self.job_offset_array = job_offset_array
+        self.job_attempt_index = job_attempt_index.astype(np.int32)
+        self.job_creation_array = job_attempt_start + creation_rel
+        self.job_start_array = np.where(not_started, NULL_EPOCH_US, job_attempt_start + start_rel)
+        self.job_end_array = job_attempt_start + end_rel
+        self.job_status_array = job_status_array
+        self.job_core_array = rng.choice(core_count_list, size=n_jobs, p=core_count_probs).astype(np.int32)
+        self.job_site_array = rng.choice(len(self.site_vocab), size=n_jobs,
+                                            p=_zipf_weights(len(self.site_vocab), 0.8)).astype(np.int32)
+        # PandaIDs in order of creation
+        panda_id_array = np.empty(n_jobs, dtype=np.int64)
+        panda_id_array[np.argsort(self.job_creation_array, kind='stable')] = np.arange(n_jobs, dtype=np.int64) + 5000000000
+        self.job_panda_id_array = panda_id_array
+
+    def _generate_status_logs(self):
+        """
+        generate task status log of all attempts, ordered by jediTaskID and modificationTime
+        """
+        rng = self.rng
+        n_attempts = len(self.attempt_task_index)
+        retried_final_array = rng.choice(len(retried_final_status_list), size=n_attempts, p=retried_final_status_probs)
+        last_final_array = rng.choice(len(last_final_status_list), size=n_attempts, p=last_final_status_probs)
+        first_job_start = np.minimum.reduceat(np.where(self.job_start_array == NULL_EPOCH_US,
+                                                        self.job_end_array, self.job_start_array),
+                                                self.job_offset_array[:-1])
+        status_list = []
+        time_list = []
+        offset_list = [0]
+        for i, (attempt_nr, attempt_start, attempt_end, setup, gap_pos, gap_len, first_start, is_last) in enumerate(zip(
+                                        self.attempt_nr_array.tolist(), self.attempt_start_array.tolist(),
+                                        self.attempt_end_array.tolist(), self.attempt_setup_array.tolist(),
+                                        self.attempt_gap_array.tolist(), self.attempt_gap_len_array.tolist(),
+                                        first_job_start.tolist(), self.attempt_is_last.tolist())):
+            if attempt_nr == 1:
+                tmp_list = [('registered', attempt_start), ('defined', attempt_start + setup // 2),
+                            ('ready', attempt_start + setup), ('scouting', attempt_start + setup + _SEC)]
+            else:
+                tmp_list = [('ready', attempt_start), ('scouting', attempt_start + setup)]
+            tmp_list.append(('running', first_start))
+            if gap_pos >= 0:
+                tmp_list.append(('pending', attempt_start + gap_pos))
+                tmp_list.append(('running', attempt_start + gap_pos + gap_len))
+            if is_last:
+                final_status = last_final_status_list[last_final_array[i]]
+            else:
+                final_status = retried_final_status_list[retried_final_array[i]]
+            tmp_list.append((final_status, attempt_end))
+            # keep timestamps in order
+            last_time = None
+            for status, timestamp in tmp_list:
+                if last_time is not None and timestamp <= last_time:
+                    timestamp = last_time + 1
+                status_list.append(status)
+                time_list.append(timestamp)
+                last_time = timestamp
+            offset_list.append(len(status_list))
+        self.status_list = status_list
+        self.status_time_array = np.array(time_list, dtype=np.int64)
+        self.status_offset_array = np.array(offset_list, dtype=np.int64)
+        self.attempt_index_map = { (task_id, attempt_nr): i for i, (task_id, attempt_nr) in enumerate(zip(
+                                        self.task_id_array[self.attempt_task_index].tolist(), self.attempt_nr_array.tolist())) }
+
+    @property
+    def n_jobs(self):
+        return len(self.job_panda_id_array)
+
+    @property
+    def n_attempts(self):
+        return len(self.attempt_task_index)
+
+    def iter_status_log_batches(self, batch_size=10000, task_mask=None):
+        """
+        iterate over batches of task status log rows (jediTaskID, modificationTime, status, userName),
+        as from the query of getTaskAttempts_ATM
+        """
+        attempt_task_id = self.task_id_array[self.attempt_task_index]
+        attempt_user = self.task_user_array[self.attempt_task_index]
+        row_attempt_index = np.repeat(np.arange(self.n_attempts), np.diff(self.status_offset_array))
+        if task_mask is not None:
+            row_index_array = np.flatnonzero(task_mask[self.attempt_task_index][row_attempt_index])
+        else:
+            row_index_array = np.arange(len(self.status_list))
+        for head in range(0, len(row_index_array), batch_size):
+            row_index = row_index_array[head:head+batch_size]
+            attempt_index = row_attempt_index[row_index]
+            rows = list(zip(attempt_task_id[attempt_index].tolist(),
+                            _us_array_to_datetime_list(self.status_time_array[row_index]),
+                            [ self.status_list[j] for j in row_index.tolist() ],
+                            [ self.user_vocab[j] for j in attempt_user[attempt_index].tolist() ]))
+            yield rows
+
+    def get_task_attempts_dict(self, batch_size=10000, task_mask=None):
+        """
+        get dict of TaskAttempt of all attempts, as returned by getTaskAttempts_ATM
+        """
+        return parse_task_status_log(self.iter_status_log_batches(batch_size, task_mask))
+
+    def _get_job_slice(self, jediTaskID, attemptNr):
+        index = self.attempt_index_map[(jediTaskID, attemptNr)]
+        return slice(self.job_offset_array[index], self.job_offset_array[index+1])
+
+    def get_jobspecs(self, job_slice=slice(None)):
+        """
+        get list of SyntheticJobSpec of a slice of all jobs (jobs are ordered by attempt)
+        """
+        job_attempt_index = self.job_attempt_index[job_slice]
+        jobspec_list = []
+        for panda_id, task_id, status_code, core_count, creation_time, start_time, end_time, site_code in zip(
+                                self.job_panda_id_array[job_slice].tolist(),
+                                self.task_id_array[self.attempt_task_index[job_attempt_index]].tolist(),
+                                self.job_status_array[job_slice].tolist(),
+                                self.job_core_array[job_slice].tolist(),
+                                _us_array_to_datetime_list(self.job_creation_array[job_slice]),
+                                _us_array_to_datetime_list(self.job_start_array[job_slice]),
+                                _us_array_to_datetime_list(self.job_end_array[job_slice]),
+                                self.job_site_array[job_slice].tolist()):
+            jobspec = SyntheticJobSpec(PandaID=panda_id, jediTaskID=task_id,
+                                        jobStatus=self.job_status_vocab[status_code], actualCoreCount=core_count,
+                                        currentPriority=1000, creationTime=creation_time, startTime=start_time,
+                                        endTime=end_time, computingSite=self.site_vocab[site_code])
+            if jobspec.jobStatus == 'failed':
+                if panda_id % 2:
+                    jobspec.pilotErrorCode = 1305
+                    jobspec.pilotErrorDiag = 'synthetic pilot error'
+                else:
+                    jobspec.exeErrorCode = 65
+                    jobspec.exeErrorDiag = 'synthetic payload error'
+            jobspec_list.append(jobspec)
+        return jobspec_list
+
+    def get_jobs_in_attempt(self, jediTaskID, attemptNr):
+        """
+        get list of SyntheticJobSpec of jobs of a task attempt, as returned by slowTaskJobsInAttempt_ATM
+        """
+        return self.get_jobspecs(self._get_job_slice(jediTaskID, attemptNr))
+
+    def iter_messages(self):
+        """
+        iterate over message dicts of task status changes and job terminations in time order, as from the broker;
+        timestamps in epoch seconds, and a job termination comes before a task status change at the same time
+        """
+        row_attempt_index = np.repeat(np.arange(self.n_attempts), np.diff(self.status_offset_array))
+        row_task_index = self.attempt_task_index[row_attempt_index]
+        n_status_rows = len(self.status_list)
+        # job events (kind 0) before task events (kind 1) at the same time
+        time_array = np.concatenate((self.job_end_array, self.status_time_array))
+        kind_array = np.concatenate((np.zeros(self.n_jobs, dtype=np.int8), np.ones(n_status_rows, dtype=np.int8)))
+        index_array = np.concatenate((np.arange(self.n_jobs), np.arange(n_status_rows)))
+        order = np.lexsort((kind_array, time_array))
+        job_task_id_array = self.task_id_array[self.attempt_task_index[self.job_attempt_index]]
+        for kind, i in zip(kind_array[order].tolist(), index_array[order].tolist()):
+            if kind == 0:
+                start_time = int(self.job_start_array[i])
+                yield {
+                        'msg_type': 'job_status',
+                        'jobid': int(self.job_panda_id_array[i]),
+                        'taskid': int(job_task_id_array[i]),
+                        'status': self.job_status_vocab[self.job_status_array[i]],
+                        'timestamp': int(self.job_end_array[i]) / 1e6,
+                        'creationtime': int(self.job_creation_array[i]) / 1e6,
+                        'starttime': None if start_time == NULL_EPOCH_US else start_time / 1e6,
+                        'endtime': int(self.job_end_array[i]) / 1e6,
+                    }
+            else:
+                task_index = row_task_index[i]
+                yield {
+                        'msg_type': 'task_status',
+                        'taskid': int(self.task_id_array[task_index]),
+                        'status': self.status_list[i],
+                        'timestamp': int(self.status_time_array[i]) / 1e6,
+                        'username': self.user_vocab[self.task_user_array[task_index]],
+                    }
+
+    def iter_job_rows(self, column_names=None, batch_size=100000):
+        """
+        iterate over job rows (tuples of column values, e.g. in JobspecsDB.column_names) of all jobs
+        """
+        if column_names is None:
+            column_names = job_columns
+        for head in range(0, self.n_jobs, batch_size):
+            job_slice = slice(head, head + batch_size)
+            attempt_index = self.job_attempt_index[job_slice]
+            column_dict = {
+                    'PandaID': lambda: self.job_panda_id_array[job_slice].tolist(),
+                    'jediTaskID': lambda: self.task_id_array[self.attempt_task_index[attempt_index]].tolist(),
+                    'attemptNr': lambda: self.attempt_nr_array[attempt_index].tolist(),
+                    'userName': lambda: [ self.user_vocab[j] for j in self.task_user_array[self.attempt_task_index[attempt_index]].tolist() ],
+                    'jobStatus': lambda: [ self.job_status_vocab[j] for j in self.job_status_array[job_slice].tolist() ],
+                    'actualCoreCount': lambda: self.job_core_array[job_slice].tolist(),
+                    'creationTime': lambda: _us_array_to_datetime_list(self.job_creation_array[job_slice]),
+                    'startTime': lambda: _us_array_to_datetime_list(self.job_start_array[job_slice]),
+                    'endTime': lambda: _us_array_to_datetime_list(self.job_end_array[job_slice]),
+                    'computingSite': lambda: [ self.site_vocab[j] for j in self.job_site_array[job_slice].tolist() ],
+                }
+            yield from zip(*[ column_dict[column]() for column in column_names ])
+
+
+# stand-in of DBProxy serving a synthetic workload, for benchmarks
+class SyntheticDBProxy(object):
+    """
+    Has the ATM query methods of DBProxy with the same signatures and return shapes.
+    All synthetic tasks have prodSourceLabel=user; prod_source_label=None and gshare are not filtered.
+    With now, methods about open attempts and jobs see the workload as of now: status changes after now are
+    invisible, and jobs ending after now are not archived but active
+    """
+
+    def __init__(self, workload, now=None):
+        self.workload = workload
+        self.now = now
+        task_last_index = workload.attempt_first_index + workload.n_attempts_array - 1
+        self.task_modification_array = workload.attempt_end_array[task_last_index]
+
+    def _task_mask(self, created_since, created_before, prod_source_label, by_modification):
+        workload = self.workload
+        if prod_source_label not in (None, 'user'):
+            return np.zeros(len(workload.task_id_array), dtype=bool)
+        time_array = self.task_modification_array if by_modification else workload.task_creation_array
+        mask = time_array >= datetime_to_epoch_us(created_since)
+        if created_before is not None:
+            mask &= workload.task_creation_array < datetime_to_epoch_us(created_before)
+        return mask
+
+    def slowTaskAttemptsFilter01_ATM(self, created_since, created_before=None, prod_source_label='user',
+                                        gshare=None, task_duration=None, shard=None):
+        task_mask = self._task_mask(created_since, created_before, prod_source_label, by_modification=False)
+        if shard is not None:
+            shard_index, n_shards = shard
+            task_mask &= (self.workload.task_id_array % n_shards) == shard_index
+        task_attempts_dict = self.workload.get_task_attempts_dict(task_mask=task_mask)
+        ret_dict = {}
+        for k, task_attempt in task_attempts_dict.items():
+            if task_attempt.is_complete() and (task_duration is None or task_attempt.attemptDuration > task_duration):
+                ret_dict[k] = task_attempt_to_dict(task_attempt)
+        return ret_dict
+
+    def getTaskAttempts_ATM(self, created_since, created_before=None, prod_source_label='user',
+                            gshare=None, attempt_duration=None):
+        task_mask = self._task_mask(created_since, None, prod_source_label, by_modification=True)
+        task_attempts_dict = self.workload.get_task_attempts_dict(task_mask=task_mask)
+        ret_dict = {}
+        for key, task_attempt in task_attempts_dict.items():
+            if task_attempt.is_complete() \
+                    and task_attempt.startTime >= created_since \
+                    and (created_before is None or task_attempt.startTime < created_before):
+                ret_dict[key] = task_attempt
+        return ret_dict
+
+    def openTaskAttempts_ATM(self, created_since, prod_source_label='user', gshare=None, attempt_duration=None,
+                                shard=None):
+        now = datetime.datetime.utcnow() if self.now is None else self.now
+        task_mask = self._task_mask(created_since, None, prod_source_label, by_modification=False)
+        if shard is not None:
+            shard_index, n_shards = shard
+            task_mask &= (self.workload.task_id_array % n_shards) == shard_index
+        # status log rows till now
+        row_batch_iter = ( [ row for row in rows if row[1] <= now ]
+                            for rows in self.workload.iter_status_log_batches(task_mask=task_mask) )
+        ret_dict = {}
+        for k, task_attempt in parse_task_status_log(rows for rows in row_batch_iter if rows).items():
+            if not task_attempt.is_complete() \
+                    and (attempt_duration is None or now - task_attempt.startTime > attempt_duration):
+                ret_dict[k] = task_attempt_to_dict(task_attempt)
+        return ret_dict
+
+    def slowTaskJobsInAttempt_ATM(self, jediTaskID, attemptNr, attempt_start, attempt_end, concise=False,
+                                    created_after=None):
+        jobspec_list = self.workload.get_jobs_in_attempt(jediTaskID, attemptNr)
+        if created_after is not None and created_after > attempt_start:
+            attempt_start = created_after
+        return [ jobspec for jobspec in jobspec_list
+                    if attempt_start <= jobspec.creationTime <= attempt_end
+                        and (self.now is None or jobspec.endTime <= self.now) ]
+
+    def getJobArraysInAttempt_ATM(self, jediTaskID, attemptNr, attempt_start, attempt_end, batch_func, created_after=None,
+                                    batch_size=10000):
+        workload = self.workload
+        job_slice = workload._get_job_slice(jediTaskID, attemptNr)
+        arrays_dict = {
+                'PandaID': workload.job_panda_id_array[job_slice],
+                'jobStatus': workload.job_status_array[job_slice].astype(np.int8),
+                'actualCoreCount': workload.job_core_array[job_slice],
+                'creationTime': workload.job_creation_array[job_slice],
+                'startTime': workload.job_start_array[job_slice],
+                'endTime': workload.job_end_array[job_slice],
+            }
+        if created_after is not None and created_after > attempt_start:
+            attempt_start = created_after
+        mask = (arrays_dict['creationTime'] >= datetime_to_epoch_us(attempt_start)) \
+                & (arrays_dict['creationTime'] <= datetime_to_epoch_us(attempt_end))
+        if self.now is not None:
+            mask &= arrays_dict['endTime'] <= datetime_to_epoch_us(self.now)
+        arrays_dict = { k: v[mask] for k, v in arrays_dict.items() }
+        n_jobs = len(arrays_dict['PandaID'])
+        for i in range(0, n_jobs, batch_size):
+            batch_func({ k: v[i:i+batch_size] for k, v in arrays_dict.items() })
+        return n_jobs
+
+    def slowTaskJobsCountInAttempt_ATM(self, jediTaskID, attempt_start, attempt_end):
+        workload = self.workload
+        n_jobs = 0
+        attemptNr = 1
+        while (jediTaskID, attemptNr) in workload.attempt_index_map:
+            creation_time_array = workload.job_creation_array[workload._get_job_slice(jediTaskID, attemptNr)]
+            n_jobs += int(np.count_nonzero((creation_time_array >= datetime_to_epoch_us(attempt_start))
+                                            & (creation_time_array <= datetime_to_epoch_us(attempt_end))))
+            attemptNr += 1
+        return n_jobs
+
+    def slowTaskAttemptAggregate_ATM(self, jediTaskID, attemptNr, attempt_start, attempt_end):
+        workload = self.workload
+        job_slice = workload._get_job_slice(jediTaskID, attemptNr)
+        arrays_dict = {
+                'creationTime': workload.job_creation_array[job_slice],
+                'startTime': workload.job_start_array[job_slice],
+                'endTime': workload.job_end_array[job_slice],
+                'jobStatus': workload.job_status_array[job_slice],
+            }
+        if self.now is not None:
+            ended_mask = arrays_dict['endTime'] <= datetime_to_epoch_us(self.now)
+            arrays_dict = { k: v[ended_mask] for k, v in arrays_dict.items() }
+        stats_dict = get_jobs_time_consumption_statistics_from_arrays(arrays_dict)
+        # plain sum of run time of finished jobs
+        valid_mask = arrays_dict['endTime'] >= arrays_dict['creationTime']
+        finished_mask = valid_mask & (arrays_dict['jobStatus'] == job_status_list.index('finished'))
+        end_time_array = arrays_dict['endTime'][finished_mask]
+        start_time_array = arrays_dict['startTime'][finished_mask]
+        start_time_array = np.where(start_time_array == NULL_EPOCH_US, end_time_array,
+                                    np.clip(start_time_array, arrays_dict['creationTime'][finished_mask], end_time_array))
+        return {
+                'n_jobs': int(np.count_nonzero(valid_mask)),
+                'n_finished_jobs': int(np.count_nonzero(finished_mask)),
+                'finished_run_time': datetime.timedelta(microseconds=int(np.sum(end_time_array - start_time_array))),
+                'successful_run_time': stats_dict['finished']['run'],
+            }
+
+    def activeJobsInTask_ATM(self, jediTaskID, created_since):
+        now = datetime.datetime.utcnow() if self.now is None else self.now
+        jobspec_list = []
+        attemptNr = 1
+        while (jediTaskID, attemptNr) in self.workload.attempt_index_map:
+            for jobspec in self.workload.get_jobs_in_attempt(jediTaskID, attemptNr):
+                if created_since <= jobspec.creationTime <= now < jobspec.endTime:
+                    jobspec.endTime = None
+                    if jobspec.startTime is not None and jobspec.startTime > now:
+                        jobspec.startTime = None
+                    jobspec.jobStatus = 'activated' if jobspec.startTime is None else 'running'
+                    jobspec_list.append(jobspec)
+            attemptNr += 1
+        return jobspec_list
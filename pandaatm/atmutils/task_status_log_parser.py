@@ -0,0 +1,153 @@
+import numpy as np
+
+from pandaatm.atmutils.generic_utils import TaskAttempt, TaskAttemptStore, NULL_STATUS_CODE, \
+                                            task_attempt_final_statuses
+
+
+#=== Constants =================================================
+
+# placeholder of null status in string arrays
+null_status_placeholder = '\x01'
+
+
+#=== Functions =================================================
+
+def parse_task_status_log(row_batch_iter, store=None):
+    """
+    get dict of TaskAttempt from batches of rows (jediTaskID, modificationTime, status, userName)
+    ordered by jediTaskID and modificationTime; rows can come from DB, cache, or any offline source
+    """
+    parser = TaskStatusLogParser(store=store)
+    for rows in row_batch_iter:
+        parser.feed(rows)
+    return parser.get_task_attempts_dict()
+
+def task_attempt_to_dict(task_attempt):
+    """
+    get plain dict of a task attempt, as returned by slowTaskAttemptsFilter01_ATM
+    """
+    statusList = task_attempt.statusList
+    ret_dict = {
+            'startTime': task_attempt.startTime,
+            'statusList': statusList,
+            'userName': task_attempt.userName,
+        }
+    if statusList:
+        ret_dict['finalStatus'] = statusList[-1][0]
+    if task_attempt.is_complete():
+        ret_dict['endTime'] = task_attempt.endTime
+        ret_dict['attemptDuration'] = task_attempt.attemptDuration
+    return ret_dict
+
+
+#=== Classes ===================================================
+
+# streaming parser of task status log into task attempts
+class TaskStatusLogParser(object):
+    """
+    Segment task status log into attempts. An attempt starts at the first status of a task or right after
+    a final status, and ends at a final status. Rows are consumed in batches and segmented with vectorized
+    operations; python work is per attempt rather than per row. Rows must be ordered by jediTaskID and
+    modificationTime, and an attempt may span consecutive batches
+    """
+
+    def __init__(self, store=None):
+        if store is None:
+            store = TaskAttemptStore()
+        self.store = store
+        # indices of attempts parsed by this parser
+        self.index_list = []
+        # state of the last task: jediTaskID, index of its last attempt, whether that attempt is complete
+        self.last_task_id = None
+        self.last_index = None
+        self.last_complete = True
+        # final status codes
+        self.final_code_set = set()
+
+    def _get_status_codes(self, status_list):
+        """
+        get array of status codes and whether each status is final
+        """
+        # null status as a placeholder string, not 'None', for the string conversion
+        status_array = np.asarray(status_list, dtype=object)
+        null_mask = np.equal(status_array, None)
+        if np.any(null_mask):
+            status_array[null_mask] = null_status_placeholder
+        unique_array, inverse_array = np.unique(status_array.astype(str), return_inverse=True)
+        unique_list = [ None if status == null_status_placeholder else status for status in unique_array.tolist() ]
+        unique_code_array = np.array([ self.store.get_status_code(status) for status in unique_list ], dtype=np.int16)
+        unique_final_array = np.array([ status in task_attempt_final_statuses for status in unique_list ], dtype=bool)
+        return unique_code_array[inverse_array], unique_final_array[inverse_array]
+
+    def feed(self, rows):
+        """
+        parse a batch of rows (jediTaskID, modificationTime, status, userName)
+        """
+        if not rows:
+            return
+        task_id_list, time_list, status_list, user_name_list = zip(*rows)
+        n_rows = len(task_id_list)
+        store = self.store
+        task_id_array = np.array(task_id_list, dtype=np.int64)
+        time_array = np.array(time_list, dtype='datetime64[us]').astype(np.int64)
+        code_array, is_final_array = self._get_status_codes(status_list)
+        # task boundaries
+        new_task_array = np.empty(n_rows, dtype=bool)
+        new_task_array[1:] = task_id_array[1:] != task_id_array[:-1]
+        new_task_array[0] = (self.last_task_id is None or task_id_array[0] != self.last_task_id)
+        if np.any(task_id_array[1:] < task_id_array[:-1]) \
+                or (self.last_task_id is not None and task_id_array[0] < self.last_task_id):
+            raise RuntimeError('TaskStatusLogParser: rows are not ordered by jediTaskID')
+        # attempt boundaries: first row of a task, or row after a final status of the same task
+        new_attempt_array = new_task_array.copy()
+        new_attempt_array[1:] |= is_final_array[:-1]
+        if not new_task_array[0]:
+            new_attempt_array[0] = self.last_complete
+        # segments of attempts in the batch
+        seg_start_array = np.flatnonzero(new_attempt_array)
+        if len(seg_start_array) == 0 or seg_start_array[0] != 0:
+            # the batch starts with the ongoing attempt of the last batch
+            seg_start_array = np.concatenate(([0], seg_start_array))
+        seg_end_array = np.append(seg_start_array[1:], n_rows)
+        # bulk append status log; attempts are contiguous, and the ongoing attempt of the last batch is at the tail
+        status_base = len(store.statusCode)
+        store.statusCode.frombytes(code_array.tobytes())
+        store.statusTime.frombytes(time_array.tobytes())
+        # loop over attempts
+        for seg_start, seg_end, is_new_attempt, is_new_task in zip(seg_start_array.tolist(),
+                                                                    seg_end_array.tolist(),
+                                                                    new_attempt_array[seg_start_array].tolist(),
+                                                                    new_task_array[seg_start_array].tolist()):
+            if is_new_attempt:
+                jediTaskID = task_id_list[seg_start]
+                if is_new_task:
+                    attemptNr = 1
+                else:
+                    attemptNr = store.attemptNr[self.last_index] + 1
+                index = store.add_attempt(jediTaskID=jediTaskID, attemptNr=attemptNr,
+                                            startTime=time_list[seg_start], userName=user_name_list[seg_start])
+                store.statusStart[index] = status_base + seg_start
+                self.index_list.append(index)
+                self.last_task_id = jediTaskID
+                self.last_index = index
+            else:
+                index = self.last_index
+            store.statusCount[index] += seg_end - seg_start
+            # final status at the end of the segment
+            last_row = seg_end - 1
+            self.last_complete = bool(is_final_array[last_row])
+            if self.last_complete:
+                store.finalStatus[index] = code_array[last_row]
+                store.endTime[index] = time_array[last_row]
+
+    def get_task_attempts_dict(self, complete_only=False):
+        """
+        get dict {(jediTaskID, attemptNr): TaskAttempt} of parsed attempts
+        """
+        store = self.store
+        task_attempts_dict = {}
+        for index in self.index_list:
+            if complete_only and store.finalStatus[index] == NULL_STATUS_CODE:
+                continue
+            task_attempts_dict[(store.jediTaskID[index], store.attemptNr[index])] = TaskAttempt.from_store(store, index)
+        return task_attempts_dict
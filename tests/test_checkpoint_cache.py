@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+
+from pandaatm.atmcore.checkpoint_cache import CheckpointCache, make_cache_key, _get_dir_size, META_FILE_NAME
+
+
+def test_make_cache_key():
+    key = make_cache_key('jobs', {'since': '2025-01-01'}, code_version='1')
+    assert key == make_cache_key('jobs', {'since': '2025-01-01'}, code_version='1')
+    assert key != make_cache_key('jobs', {'since': '2025-01-02'}, code_version='1')
+    assert key != make_cache_key('jobs', {'since': '2025-01-01'}, code_version='2')
+
+def test_arrays_round_trip(tmp_path):
+    cache = CheckpointCache(str(tmp_path))
+    arrays_dict = {
+            'a': np.arange(10, dtype=np.int64),
+            'b': np.linspace(0, 1, 5),
+        }
+    assert cache.load_arrays('k') is None
+    cache.dump_arrays('k', arrays_dict, extra_meta={'n': 10})
+    assert cache.has('k')
+    loaded_dict, extra_meta = cache.load_arrays('k')
+    assert extra_meta == {'n': 10}
+    assert sorted(loaded_dict) == ['a', 'b']
+    for name, array in arrays_dict.items():
+        assert isinstance(loaded_dict[name], np.memmap)
+        np.testing.assert_array_equal(loaded_dict[name], array)
+    # overwrite in place
+    cache.dump_arrays('k', {'a': np.zeros(3)})
+    loaded_dict, extra_meta = cache.load_arrays('k', mmap=False)
+    assert extra_meta is None
+    np.testing.assert_array_equal(loaded_dict['a'], np.zeros(3))
+    # no temporary or trash directories left
+    assert sorted(os.listdir(str(tmp_path))) == ['k']
+
+def test_object_round_trip(tmp_path):
+    cache = CheckpointCache(str(tmp_path))
+    obj = {'x': [1, 2, 3], ('t', 1): None}
+    cache.dump_object('o', obj)
+    assert cache.load_object('o') == obj
+    # wrong type of entry
+    assert cache.load_arrays('o') is None
+    cache.remove('o')
+    assert cache.load_object('o') is None
+
+def test_broken_entry_removed(tmp_path):
+    cache = CheckpointCache(str(tmp_path))
+    cache.dump_arrays('k', {'a': np.arange(3)})
+    os.remove(os.path.join(str(tmp_path), 'k', 'a.npy'))
+    assert cache.load_arrays('k') is None
+    assert not cache.has('k')
+
+def test_eviction_lru(tmp_path):
+    array = np.arange(1000, dtype=np.float64)
+    cache = CheckpointCache(str(tmp_path / 'probe'))
+    cache.dump_arrays('e0', {'a': array})
+    entry_size = _get_dir_size(os.path.join(str(tmp_path / 'probe'), 'e0'))
+    cache = CheckpointCache(str(tmp_path / 'cache'), max_size=int(entry_size*2.5))
+    cache.dump_arrays('e1', {'a': array})
+    cache.dump_arrays('e2', {'a': array})
+    # e1 is older than e2, but accessed afterwards
+    os.utime(os.path.join(cache.cache_dir, 'e1', META_FILE_NAME), (100, 100))
+    os.utime(os.path.join(cache.cache_dir, 'e2', META_FILE_NAME), (200, 200))
+    assert cache.load_arrays('e1') is not None
+    cache.dump_arrays('e3', {'a': array})
+    assert cache.has('e1')
+    assert not cache.has('e2')
+    assert cache.has('e3')
+
+def test_eviction_keeps_new_entry(tmp_path):
+    cache = CheckpointCache(str(tmp_path), max_size=1)
+    cache.dump_arrays('e1', {'a': np.arange(100)})
+    cache.dump_arrays('e2', {'a': np.arange(100)})
+    assert not cache.has('e1')
+    assert cache.has('e2')
+
+def test_size_estimate_of_rewrites(tmp_path):
+    cache = CheckpointCache(str(tmp_path), max_size=10**6)
+    n_scans = [0]
+    evict = cache.evict
+    def counting_evict(*args, **kwargs):
+        n_scans[0] += 1
+        return evict(*args, **kwargs)
+    cache.evict = counting_evict
+    for i in range(50):
+        cache.dump_arrays('k', {'a': np.arange(1000)})
+    entry_size = _get_dir_size(os.path.join(cache.cache_dir, 'k'))
+    # only the first write scans; rewrites replace the entry in the estimate
+    assert n_scans[0] == 1
+    assert cache._size_estimate == entry_size
@@ -0,0 +1,58 @@
+import random
+import datetime
+
+import pytest
+
+from pandaatm.atmcore.core_utils import datetime_to_epoch_us
+from pandaatm.atmcore.columnar_job_store import ColumnarJobStore, make_job_store_arrays
+
+
+column_names = ('PandaID', 'userName', 'jobStatus', 'creationTime', 'startTime', 'endTime')
+
+def _make_rows(seed, n_jobs=500):
+    rand = random.Random(seed)
+    t0 = datetime.datetime(2025, 1, 1)
+    row_list = []
+    for PandaID in range(n_jobs):
+        creationTime = t0 + datetime.timedelta(seconds=rand.randint(0, 10**6))
+        startTime = creationTime + datetime.timedelta(seconds=rand.randint(0, 10**4))
+        endTime = startTime + datetime.timedelta(seconds=rand.randint(0, 10**5))
+        if rand.random() < 0.1:
+            startTime = None
+        row_list.append((PandaID, rand.choice(['alice', 'bob', 'carol']), rand.choice(['finished', 'failed']),
+                            creationTime, startTime, endTime))
+    return row_list
+
+@pytest.mark.parametrize('seed', range(5))
+def test_get_overlapping_jobs(seed):
+    row_list = _make_rows(seed)
+    store = ColumnarJobStore(*make_job_store_arrays(column_names, iter(row_list), chunk_size=77))
+    assert len(store) == len(row_list)
+    assert store.user_names() == ['alice', 'bob', 'carol']
+    rand = random.Random(seed)
+    t0 = datetime.datetime(2025, 1, 1)
+    for i in range(50):
+        user_name = rand.choice(['alice', 'bob', 'carol', 'nobody'])
+        time_min = t0 + datetime.timedelta(seconds=rand.randint(0, 10**6))
+        time_max = time_min + datetime.timedelta(seconds=rand.randint(0, 10**5))
+        expected_set = { row[0] for row in row_list
+                            if row[1] == user_name and row[4] is not None
+                                and row[4] <= time_max and row[5] >= time_min }
+        # datetime or epoch microseconds
+        time_args = (time_min, time_max) if i % 2 else (datetime_to_epoch_us(time_min), datetime_to_epoch_us(time_max))
+        jobs_dict = store.get_overlapping_jobs(user_name, *time_args)
+        assert set(jobs_dict['PandaID'].tolist()) == expected_set
+        assert len(jobs_dict['PandaID']) == len(expected_set)
+        if user_name != 'nobody':
+            assert set(jobs_dict['userName'].tolist()) <= {store.get_code('userName', user_name)}
+
+def test_get_user_jobs():
+    row_list = _make_rows(0, n_jobs=100)
+    store = ColumnarJobStore(*make_job_store_arrays(column_names, iter(row_list)))
+    jobs_dict = store.get_user_jobs('bob', columns=['PandaID', 'startTime', 'jobStatus'])
+    assert sorted(jobs_dict['PandaID'].tolist()) == sorted(row[0] for row in row_list if row[1] == 'bob')
+    start_time_list = jobs_dict['startTime'].tolist()
+    assert start_time_list == sorted(start_time_list)
+    assert store.decode('jobStatus', jobs_dict['jobStatus']) \
+                == [ {row[0]: row[2] for row in row_list}[PandaID] for PandaID in jobs_dict['PandaID'].tolist() ]
+    assert len(store.get_user_jobs('nobody')['PandaID']) == 0
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+from pandaatm.atmcore.core_utils import AppendOnlyRecordFile, iter_fetched_array_batches
+
+
+class _ListCursor(object):
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def fetchmany(self, n):
+        rows, self.rows = self.rows[:n], self.rows[n:]
+        return rows
+
+
+def test_append_and_read(tmp_path):
+    file_path = str(tmp_path / 'records.bin')
+    record_file = AppendOnlyRecordFile(file_path)
+    assert list(record_file.read_records()) == []
+    record_file.append('a', 1)
+    record_file.append(('b', 2), {'x': [1, 2]})
+    record_file.close()
+    assert list(AppendOnlyRecordFile(file_path).read_records()) == [('a', 1), (('b', 2), {'x': [1, 2]})]
+    assert AppendOnlyRecordFile(file_path).read_keys() == {'a', ('b', 2)}
+
+def test_truncated_tail_recovery(tmp_path):
+    file_path = str(tmp_path / 'records.bin')
+    record_file = AppendOnlyRecordFile(file_path)
+    record_file.append('a', 1)
+    record_file.append('b', 2)
+    good_size = os.path.getsize(file_path)
+    record_file.append('c', 3)
+    record_file.close()
+    # process killed in the middle of writing the last record
+    with open(file_path, 'r+b') as _f:
+        _f.truncate(os.path.getsize(file_path) - 3)
+    record_file = AppendOnlyRecordFile(file_path)
+    assert list(record_file.read_records()) == [('a', 1), ('b', 2)]
+    assert os.path.getsize(file_path) == good_size
+    # resume appending after the broken tail is dropped
+    record_file.append('c', 3)
+    record_file.close()
+    assert list(AppendOnlyRecordFile(file_path).read_records()) == [('a', 1), ('b', 2), ('c', 3)]
+
+def test_truncated_header(tmp_path):
+    file_path = str(tmp_path / 'records.bin')
+    record_file = AppendOnlyRecordFile(file_path)
+    record_file.append('a', 1)
+    record_file.close()
+    with open(file_path, 'ab') as _f:
+        _f.write(b'\x05\x00')
+    assert AppendOnlyRecordFile(file_path).read_keys() == {'a'}
+
+def test_iter_fetched_array_batches():
+    column_dtype_list = [('a', np.int64), ('b', np.int8)]
+    rows = [ (i*10**12, i % 3 - 1) for i in range(10) ]
+    batch_list = []
+    for arrays_dict in iter_fetched_array_batches(_ListCursor(rows), column_dtype_list, fetch_size=4):
+        assert arrays_dict['a'].dtype == np.int64
+        assert arrays_dict['b'].dtype == np.int8
+        # arrays are reused for the next batch
+        batch_list.append({ name: array.tolist() for name, array in arrays_dict.items() })
+    assert [ len(batch['a']) for batch in batch_list ] == [4, 4, 2]
+    assert sum((batch['a'] for batch in batch_list), []) == [ row[0] for row in rows ]
+    assert sum((batch['b'] for batch in batch_list), []) == [ row[1] for row in rows ]
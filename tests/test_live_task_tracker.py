@@ -0,0 +1,64 @@
+import datetime
+
+from pandaatm.atmutils.live_task_tracker import LiveTaskTracker
+
+
+t0 = datetime.datetime(2025, 1, 1)
+
+def _hours(n):
+    return t0 + datetime.timedelta(hours=n)
+
+def test_attempt_numbers():
+    tracker = LiveTaskTracker()
+    tracker.on_task_status(1, 'running', _hours(0))
+    tracker.on_task_status(1, 'failed', _hours(1))
+    tracker.on_task_status(1, 'running', _hours(2))
+    assert tracker.get_open_attempt(1).attemptNr == 2
+
+def test_expire_forgets_tasks():
+    tracker = LiveTaskTracker(open_attempt_max_age=datetime.timedelta(days=1),
+                                expire_interval=datetime.timedelta(hours=1))
+    # task 1 closed, task 2 left open
+    tracker.on_task_status(1, 'running', _hours(0))
+    tracker.on_task_status(1, 'done', _hours(1))
+    tracker.on_task_status(2, 'running', _hours(1))
+    assert set(tracker.last_attempt_nr_dict) == {1, 2}
+    # events of another task much later
+    tracker.on_task_status(3, 'running', _hours(100))
+    tracker.on_task_status(3, 'running', _hours(102))
+    assert set(tracker.last_attempt_nr_dict) == {3}
+    assert tracker.get_open_attempt(2) is None
+    assert set(tracker.job_aggregator_dict) == {3}
+    assert tracker.n_events_dict['expired'] == 1
+
+def _job_msg(taskid, jobid, status, creation_hours, start_hours, end_hours):
+    return {
+            'msg_type': 'job_status',
+            'taskid': taskid,
+            'jobid': jobid,
+            'status': status,
+            'creationtime': _hours(creation_hours).isoformat(),
+            'starttime': _hours(start_hours).isoformat(),
+            'endtime': _hours(end_hours).isoformat(),
+        }
+
+def test_provisional_flag_on_events():
+    tracker = LiveTaskTracker(task_duration_max=datetime.timedelta(hours=10), successful_run_time_min_percent=80)
+    assert tracker.handle_message({'msg_type': 'task_status', 'taskid': 1, 'status': 'running',
+                                    'timestamp': _hours(0).isoformat()}) == []
+    # successful jobs; not slow yet and not long yet
+    assert tracker.handle_message(_job_msg(1, 100, 'finished', 0, 0, 9)) == []
+    # long, but still mostly successful
+    assert tracker.handle_message(_job_msg(1, 101, 'finished', 9, 9, 11)) == []
+    # failed jobs make the open attempt slow
+    flag_list = tracker.handle_message(_job_msg(1, 102, 'failed', 11, 11, 20))
+    assert [ (flag_dict['flag'], flag_dict['provisional']) for flag_dict in flag_list ] == [('SlowTaskAttempt', True)]
+    assert flag_list[0]['n_jobs'] == 3
+    assert flag_list[0]['successful_run_time_ratio'] == 11/20
+    # flagged once while open
+    assert tracker.handle_message(_job_msg(1, 103, 'failed', 20, 20, 25)) == []
+    # final flag at close
+    flag_list = tracker.handle_message({'msg_type': 'task_status', 'taskid': 1, 'status': 'failed',
+                                        'timestamp': _hours(26).isoformat()})
+    assert [ (flag_dict['flag'], flag_dict.get('provisional')) for flag_dict in flag_list ] == [('SlowTaskAttempt', None)]
+    assert tracker.provisional_flagged_set == set()
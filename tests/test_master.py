@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip('daemon')
+
+from pandaatm.atmconfig import atm_config
+from pandaatm.atmbody.master import AtmMaster
+
+
+class _Section(object):
+    pass
+
+def _set_master_config(monkeypatch, **kwargs):
+    section = _Section()
+    for k, v in kwargs.items():
+        setattr(section, k, v)
+    # set the section directly, not to read the config file
+    monkeypatch.setitem(vars(atm_config), 'master', section)
+
+def test_agent_config_list_default(monkeypatch):
+    _set_master_config(monkeypatch)
+    assert AtmMaster().get_agent_config_list() == [('slow_task_analyzer', 1)]
+
+def test_agent_config_list(monkeypatch):
+    _set_master_config(monkeypatch, agents='slow_task_analyzer:2; testing_agent:0;;other_agent;last_agent:')
+    assert AtmMaster().get_agent_config_list() == [
+            ('slow_task_analyzer', 2),
+            ('testing_agent', 0),
+            ('other_agent', 1),
+            ('last_agent', 1),
+        ]
@@ -0,0 +1,77 @@
+import time
+import threading
+
+from pandaatm.atmmsgprocessor.msg_batcher import MicroBatcher
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_flush_by_size_and_stop():
+    batch_list = []
+    batcher = MicroBatcher(batch_list.append, max_batch_size=3, max_batch_seconds=60)
+    batcher.start()
+    for i in range(7):
+        assert batcher.put(i)
+    # full batches are applied without waiting for max_batch_seconds
+    assert _wait_for(lambda: len(batch_list) >= 2)
+    # stop applies the rest
+    batcher.stop()
+    assert batch_list == [[0, 1, 2], [3, 4, 5], [6]]
+    stats_dict = batcher.get_stats()
+    assert stats_dict['n_msgs'] == 7
+    assert stats_dict['n_batches'] == 3
+    assert stats_dict['queue_depth'] == 0
+
+def test_flush_by_time():
+    batch_list = []
+    batcher = MicroBatcher(batch_list.append, max_batch_size=100, max_batch_seconds=0.05)
+    batcher.start()
+    batcher.put('a')
+    batcher.put('b')
+    assert _wait_for(lambda: batch_list == [['a', 'b']])
+    batcher.stop()
+
+def test_apply_error_counted():
+    def apply_func(msg_list):
+        if 'bad' in msg_list:
+            raise ValueError('bad message')
+    batcher = MicroBatcher(apply_func, max_batch_size=1)
+    batcher.start()
+    batcher.put('bad')
+    batcher.put('good')
+    batcher.stop()
+    stats_dict = batcher.get_stats()
+    assert stats_dict['n_batches'] == 2
+    assert stats_dict['n_errors'] == 1
+    assert stats_dict['last_error'] == 'ValueError: bad message'
+
+def test_backpressure():
+    release_event = threading.Event()
+    batch_list = []
+    def apply_func(msg_list):
+        release_event.wait(5)
+        batch_list.append(msg_list)
+    batcher = MicroBatcher(apply_func, max_batch_size=1, max_queue_size=1)
+    batcher.start()
+    assert batcher.put(0)
+    # the worker is blocked in applying 0, and 1 fills the queue
+    assert _wait_for(lambda: batcher.qsize() == 0)
+    assert batcher.put(1)
+    # queue full; put blocks till timeout
+    t0 = time.monotonic()
+    assert not batcher.put(2, timeout=0.1)
+    assert time.monotonic() - t0 >= 0.1
+    # put blocks till the worker takes 1
+    threading.Timer(0.1, release_event.set).start()
+    assert batcher.put(3, timeout=5)
+    batcher.stop()
+    assert batch_list == [[0], [1], [3]]
+    stats_dict = batcher.get_stats()
+    assert stats_dict['n_blocked_puts'] == 2
+    assert stats_dict['blocked_seconds'] > 0
@@ -0,0 +1,97 @@
+import random
+import datetime
+import types
+
+import pytest
+
+from pandaatm.atmcore.core_utils import datetime_to_epoch_us
+from pandaatm.atmutils.slow_task_analyzer_utils import JobsTimeConsumptionAggregator, \
+                                                        get_jobs_time_consumption_statistics
+
+
+def _make_jobspecs(seed, n_jobs=200):
+    rand = random.Random(seed)
+    t0 = datetime.datetime(2025, 1, 1)
+    jobspec_list = []
+    for PandaID in range(n_jobs):
+        creationTime = t0 + datetime.timedelta(seconds=rand.randint(0, 10**5))
+        startTime = creationTime + datetime.timedelta(seconds=rand.randint(-100, 10**4))
+        if rand.random() < 0.1:
+            startTime = None
+        endTime = creationTime + datetime.timedelta(seconds=rand.randint(-100, 2*10**4))
+        jobStatus = rand.choice(['finished', 'failed', 'closed', 'cancelled'])
+        jobspec_list.append(types.SimpleNamespace(PandaID=PandaID, creationTime=creationTime, startTime=startTime,
+                                                    endTime=endTime, jobStatus=jobStatus))
+    return jobspec_list
+
+def _assert_stats_equal(stats_dict, expected_dict):
+    for status, expected in expected_dict.items():
+        for dur_type, value in expected.items():
+            assert stats_dict[status][dur_type] == pytest.approx(value, rel=1e-9, abs=1)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_aggregator_as_statistics(seed):
+    jobspec_list = _make_jobspecs(seed)
+    expected_dict = get_jobs_time_consumption_statistics(jobspec_list, in_us=True)
+    # jobs added in random order, with statistics taken in between
+    shuffled_list = list(jobspec_list)
+    random.Random(seed).shuffle(shuffled_list)
+    aggregator = JobsTimeConsumptionAggregator(snapshot_interval=16)
+    for i in range(0, len(shuffled_list), 30):
+        aggregator.add_jobspecs(shuffled_list[i:i+30])
+        aggregator.get_statistics(in_us=True)
+    stats_dict = aggregator.get_statistics(in_us=True)
+    _assert_stats_equal(stats_dict, expected_dict)
+    assert stats_dict['active']['total'] == 0
+
+def test_aggregator_events():
+    jobspec_list = _make_jobspecs(0, n_jobs=50)
+    expected_dict = get_jobs_time_consumption_statistics(jobspec_list, in_us=True)
+    aggregator = JobsTimeConsumptionAggregator(snapshot_interval=4)
+    to_us = (lambda x: None if x is None else datetime_to_epoch_us(x))
+    for jobspec in jobspec_list:
+        aggregator.on_job_created(jobspec.PandaID, to_us(jobspec.creationTime))
+    for jobspec in jobspec_list:
+        if jobspec.startTime is not None:
+            aggregator.on_job_started(jobspec.PandaID, to_us(jobspec.startTime))
+    aggregator.get_statistics(in_us=True)
+    for jobspec in jobspec_list:
+        aggregator.on_job_ended(jobspec.PandaID, to_us(jobspec.endTime), jobspec.jobStatus)
+    _assert_stats_equal(aggregator.get_statistics(in_us=True), expected_dict)
+
+def test_statistics_of_duplicate_jobs():
+    jobspec_list = _make_jobspecs(1, n_jobs=20)
+    expected_dict = get_jobs_time_consumption_statistics(jobspec_list, in_us=True)
+    stats_dict = get_jobs_time_consumption_statistics(jobspec_list + jobspec_list[:5], in_us=True)
+    _assert_stats_equal(stats_dict, expected_dict)
+
+def test_statistics_in_timedelta():
+    jobspec_list = _make_jobspecs(2, n_jobs=20)
+    expected_dict = get_jobs_time_consumption_statistics(jobspec_list, in_us=True)
+    stats_dict = get_jobs_time_consumption_statistics(jobspec_list)
+    for status, expected in expected_dict.items():
+        for dur_type, value in expected.items():
+            assert abs(stats_dict[status][dur_type] / datetime.timedelta(microseconds=1) - value) <= 1
+
+def test_statistics_of_unknown_status():
+    jobspec_list = _make_jobspecs(3, n_jobs=5)
+    jobspec_list[2].endTime = jobspec_list[2].creationTime
+    jobspec_list[2].jobStatus = 'running'
+    with pytest.raises(KeyError):
+        get_jobs_time_consumption_statistics(jobspec_list)
+    # strange jobs with endTime < creationTime are skipped before the status is looked at
+    jobspec_list[2].endTime = jobspec_list[2].creationTime - datetime.timedelta(seconds=1)
+    get_jobs_time_consumption_statistics(jobspec_list)
+
+def test_aggregator_levels_incremental():
+    jobspec_list = _make_jobspecs(4, n_jobs=500)
+    expected_dict = get_jobs_time_consumption_statistics(jobspec_list, in_us=True)
+    aggregator = JobsTimeConsumptionAggregator(snapshot_interval=32)
+    for jobspec in jobspec_list:
+        aggregator.add_jobspecs([jobspec])
+        aggregator.get_statistics(in_us=True)
+        # levels of geometrically decreasing sizes
+        level_size_list = [ len(level[0]) for level in aggregator.level_list ]
+        assert all(2*lower < upper for upper, lower in zip(level_size_list, level_size_list[1:]))
+    assert len(aggregator.level_list) <= 12
+    _assert_stats_equal(aggregator.get_statistics(in_us=True), expected_dict)
@@ -0,0 +1,83 @@
+import random
+import datetime
+
+import pytest
+
+from pandaatm.atmutils.generic_utils import TaskAttempt
+from pandaatm.atmutils.task_status_log_parser import TaskStatusLogParser, parse_task_status_log, task_attempt_to_dict
+
+
+def _baseline_task_attempts_dict(rows):
+    """
+    segment rows into attempts row by row with TaskAttempt.update_status, as the DB proxy did before the parser
+    """
+    task_attempts_dict = {}
+    attempt_nr_dict = {}
+    for jediTaskID, modificationTime, status, userName in rows:
+        attemptNr = attempt_nr_dict.setdefault(jediTaskID, 1)
+        key = (jediTaskID, attemptNr)
+        if key not in task_attempts_dict:
+            task_attempts_dict[key] = TaskAttempt(jediTaskID=jediTaskID, attemptNr=attemptNr,
+                                                    startTime=modificationTime, userName=userName)
+        task_attempt = task_attempts_dict[key]
+        task_attempt.update_status(status=status, modificationTime=modificationTime)
+        if task_attempt.is_complete():
+            attempt_nr_dict[jediTaskID] += 1
+    return task_attempts_dict
+
+def _make_rows(seed, n_tasks=50):
+    rand = random.Random(seed)
+    status_list = ['defined', 'ready', 'running', 'scouting', None, 'finished', 'done', 'failed', 'aborted', 'broken']
+    rows = []
+    for jediTaskID in sorted(rand.sample(range(1000, 100000), n_tasks)):
+        modificationTime = datetime.datetime(2025, 1, 1) + datetime.timedelta(seconds=rand.randint(0, 10**6))
+        for i in range(rand.randint(1, 30)):
+            modificationTime += datetime.timedelta(microseconds=rand.randint(0, 10**9))
+            rows.append((jediTaskID, modificationTime, rand.choice(status_list), 'user{0}'.format(jediTaskID % 7)))
+    return rows
+
+def _batches(rows, seed):
+    rand = random.Random(seed)
+    i = 0
+    while i < len(rows):
+        n = rand.randint(1, 40)
+        yield rows[i:i+n]
+        i += n
+
+@pytest.mark.parametrize('seed', range(10))
+def test_segmentation_as_baseline(seed):
+    rows = _make_rows(seed)
+    expected_dict = _baseline_task_attempts_dict(rows)
+    task_attempts_dict = parse_task_status_log(_batches(rows, seed))
+    assert list(task_attempts_dict) == list(expected_dict)
+    for key, expected in expected_dict.items():
+        task_attempt = task_attempts_dict[key]
+        assert task_attempt.keyName == expected.keyName
+        assert task_attempt.userName == expected.userName
+        assert task_attempt.startTime == expected.startTime
+        assert task_attempt.statusList == expected.statusList
+        assert task_attempt.attemptDuration == expected.attemptDuration
+        assert task_attempt.is_complete() == expected.is_complete()
+        if expected.is_complete():
+            assert task_attempt.endTime == expected.endTime
+            assert task_attempt.finalStatus == expected.finalStatus
+        assert task_attempt_to_dict(task_attempt) == task_attempt_to_dict(expected)
+
+def test_complete_only():
+    t0 = datetime.datetime(2025, 1, 1)
+    rows = [
+            (1, t0, 'running', 'u'),
+            (1, t0 + datetime.timedelta(hours=1), 'done', 'u'),
+            (1, t0 + datetime.timedelta(hours=2), 'running', 'u'),
+        ]
+    parser = TaskStatusLogParser()
+    parser.feed(rows)
+    assert list(parser.get_task_attempts_dict()) == [(1, 1), (1, 2)]
+    assert list(parser.get_task_attempts_dict(complete_only=True)) == [(1, 1)]
+
+def test_unordered_rows():
+    t0 = datetime.datetime(2025, 1, 1)
+    parser = TaskStatusLogParser()
+    parser.feed([(2, t0, 'running', 'u')])
+    with pytest.raises(RuntimeError):
+        parser.feed([(1, t0, 'running', 'u')])